@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+"""A throughput benchmark for the operator's 'create' and 'job_event' handlers.
+
+The handlers are driven directly (without kopf or a cluster)
+against an in-process stand-in for the CoreV1 API (see 'fake_api.py')
+that can be given a call latency and an error rate.
+
+For each number of Jobs we report: -
+
+-   The rate DataManagerJobs are turned into Pods ('create'),
+    with the p50 and p99 latency of each create (including any retries)
+-   The rate finished Jobs are deleted ('job_event'),
+    with the p50 and p99 latency from the event to the Pod's deletion
+    (the Pod watch's 'pod_event' also reflects each Pod's run in its Job's status)
+    If '--logs-drained-s' is given each finished Pod is marked as having
+    had its logs collected (as the log-watcher would) after that delay.
+-   The peak memory (KiB) used per Job (in a separate, traced, run)
+
+Run it from the project root, with the operator's requirements installed: -
+
+    python benchmark/benchmark.py
+    python benchmark/benchmark.py --jobs 1000 --latency-ms 5 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import kopf
+
+from fake_api import FakeCoreV1Api
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "operator")
+)
+
+import handlers  # pylint: disable=wrong-import-position
+
+# The namespace of the benchmark's Jobs
+_NAMESPACE: str = "benchmark"
+# The longest we wait for the Jobs to be deleted (seconds)
+_DELETE_TIMEOUT_S: float = 600.0
+# The Pod states (spec and status) seen as a Job's Pod runs
+_POD_RUN: List[Dict[str, Any]] = [
+    {"spec": {"nodeName": "node-1"}, "status": {"phase": "Pending"}},
+    {
+        "spec": {"nodeName": "node-1"},
+        "status": {
+            "phase": "Pending",
+            "conditions": [
+                {
+                    "type": "PodScheduled",
+                    "status": "True",
+                    "lastTransitionTime": "2022-04-01T12:00:00Z",
+                }
+            ],
+        },
+    },
+    {
+        "spec": {"nodeName": "node-1"},
+        "status": {
+            "phase": "Running",
+            "containerStatuses": [
+                {"state": {"running": {"startedAt": "2022-04-01T12:00:01Z"}}}
+            ],
+        },
+    },
+    {
+        "spec": {"nodeName": "node-1"},
+        "status": {
+            "phase": "Succeeded",
+            "containerStatuses": [
+                {
+                    "state": {
+                        "terminated": {
+                            "startedAt": "2022-04-01T12:00:01Z",
+                            "finishedAt": "2022-04-01T12:00:02Z",
+                        }
+                    }
+                }
+            ],
+        },
+    },
+]
+
+
+def _jobs(
+    run: str, count: int, files: int, image_type: str
+) -> Iterator[Dict[str, Any]]:
+    """Generates DataManagerJob bodies (as kopf would present them)."""
+    for number in range(count):
+        name: str = f"{run}-{number}"
+        yield {
+            "apiVersion": "squonk.it/v3",
+            "kind": "DataManagerJob",
+            "metadata": {"name": name, "namespace": _NAMESPACE, "uid": name},
+            "spec": {
+                "imDataManager": {
+                    "image": "informaticsmatters/benchmark:1.0.0",
+                    "imageType": image_type,
+                    "command": 'echo "Hello, world"',
+                    "taskId": f"task-{number}",
+                    "project": {"id": "project-00000000"},
+                    "workingDirectory": "/data",
+                    "labels": [
+                        f"data-manager.informaticsmatters.com/instance-id={name}",
+                        "data-manager.informaticsmatters.com/instance-is-job=yes",
+                    ],
+                    "environment": ["DM_BENCHMARK=yes"],
+                    "file": [
+                        {
+                            "name": f"/usr/local/file-{file_number}.txt",
+                            "content": f"{name} {file_number}\n" * 16,
+                            "origin": "benchmark",
+                        }
+                        for file_number in range(files)
+                    ],
+                }
+            },
+        }
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    """Returns the given percentile (i.e. 0.99) of the values."""
+    if not values:
+        return 0.0
+    ordered: List[float] = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def _create_jobs(
+    jobs: Iterator[Dict[str, Any]], latencies: List[float], stats: Dict[str, int]
+) -> None:
+    """A worker that runs 'create' for Jobs until there are none left,
+    retrying (immediately) when kopf would retry.
+    """
+    for job in jobs:
+        started: float = time.perf_counter()
+        retry: int = 0
+        while True:
+            try:
+                await handlers.create(
+                    name=job["metadata"]["name"],
+                    namespace=job["metadata"]["namespace"],
+                    spec=job["spec"],
+                    meta=job["metadata"],
+                    body=job,
+                    retry=retry,
+                )
+            except kopf.TemporaryError:
+                retry += 1
+                stats["retries"] += 1
+                continue
+            except kopf.PermanentError:
+                stats["failed"] += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+            break
+
+
+async def _run(args: argparse.Namespace, count: int, run: str) -> Dict[str, Any]:
+    """Creates 'count' Jobs, then finishes and deletes them,
+    returning the results.
+    """
+    api: FakeCoreV1Api = FakeCoreV1Api(
+        latency_s=args.latency_ms / 1000,
+        jitter_s=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        keep_objects=not tracemalloc.is_tracing(),
+    )
+    handlers._JOB_OBJECTS.core_api = api  # pylint: disable=protected-access
+    handlers._CUSTOM_API = api  # pylint: disable=protected-access
+    delete_fn = handlers._JOB_OBJECTS.delete_job  # pylint: disable=protected-access
+    handlers._DEFERRED_DELETER = (  # pylint: disable=protected-access
+        handlers.DeferredDeleter(delete_fn)
+    )
+    handlers._POD_PRE_DELETE_DELAY_S = (  # pylint: disable=protected-access
+        args.pre_delete_delay_s
+    )
+    handlers._STATUS_WRITER = (  # pylint: disable=protected-access
+        handlers.job_status.StatusWriter(
+            handlers._patch_job_status,  # pylint: disable=protected-access
+            args.status_window_s,
+        )
+    )
+    if args.api_limits:
+        # pylint: disable=protected-access
+        handlers._API_LIMITER.configure(
+            create_rate=handlers._API_CREATE_RATE,
+            create_burst=handlers._API_CREATE_BURST,
+            delete_rate=handlers._API_DELETE_RATE,
+            delete_burst=handlers._API_DELETE_BURST,
+            max_in_flight=handlers._API_MAX_IN_FLIGHT,
+        )
+    else:
+        handlers._API_LIMITER.configure()  # pylint: disable=protected-access
+
+    results: Dict[str, Any] = {"jobs": count}
+    stats: Dict[str, int] = {"retries": 0, "failed": 0}
+    traced_before: int = 0
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        traced_before = tracemalloc.get_traced_memory()[0]
+
+    # Create
+    create_latencies: List[float] = []
+    jobs: Iterator[Dict[str, Any]] = _jobs(run, count, args.files, args.image_type)
+    started: float = time.perf_counter()
+    await asyncio.gather(
+        *[_create_jobs(jobs, create_latencies, stats) for _ in range(args.concurrency)]
+    )
+    create_s: float = time.perf_counter() - started
+    results["create_rate"] = len(create_latencies) / create_s
+    results["create_p50"] = _percentile(create_latencies, 0.5)
+    results["create_p99"] = _percentile(create_latencies, 0.99)
+    results.update(stats)
+
+    # Finish (and delete)
+    finished: Dict[Tuple[str, str], float] = {}
+    started = time.perf_counter()
+    pods: List[Dict[str, Any]] = [
+        pod for key, pod in api.objects.items() if key[0] == "Pod"
+    ]
+    drains: List[asyncio.Task] = []
+    for pod in pods:
+        metadata: Dict[str, Any] = pod["metadata"]
+        # The Pod's run (scheduled, running and then finished),
+        # as seen by the Pod watch
+        previous_phase: Optional[str] = None
+        for pod_state in _POD_RUN:
+            if pod_state["status"]["phase"] in ["Succeeded", "Failed"]:
+                finished[(metadata["namespace"], metadata["name"])] = time.monotonic()
+            await handlers.pod_event(
+                "MODIFIED", {"metadata": metadata, **pod_state}, previous_phase
+            )
+            previous_phase = pod_state["status"]["phase"]
+            # Let the event loop run (as it would between watch events)
+            await asyncio.sleep(0)
+        if args.logs_drained_s is not None:
+            drains.append(
+                asyncio.create_task(
+                    _drain_logs(metadata, _POD_RUN[-1], args.logs_drained_s)
+                )
+            )
+    while len(api.pod_deletions) < len(finished):
+        if time.perf_counter() - started > _DELETE_TIMEOUT_S:
+            logging.error("Timed out waiting for Job deletions")
+            break
+        await asyncio.sleep(0.01)
+    delete_s: float = time.perf_counter() - started
+    for drain in drains:
+        drain.cancel()
+    await handlers._STATUS_WRITER.flush()  # pylint: disable=protected-access
+    delete_latencies: List[float] = [
+        api.pod_deletions[key] - finished_at
+        for key, finished_at in finished.items()
+        if key in api.pod_deletions
+    ]
+    results["delete_rate"] = len(delete_latencies) / delete_s
+    results["delete_p50"] = _percentile(delete_latencies, 0.5)
+    results["delete_p99"] = _percentile(delete_latencies, 0.99)
+    results["api_calls"] = sum(api.calls.values())
+    results["api_errors"] = api.errors
+
+    if tracemalloc.is_tracing():
+        peak: int = tracemalloc.get_traced_memory()[1]
+        results["memory"] = (peak - traced_before) / count
+
+    # Forget the deleted Jobs
+    handlers._DEFERRED_DELETER.cancel_all()  # pylint: disable=protected-access
+    return results
+
+
+async def _drain_logs(
+    metadata: Dict[str, Any], pod_state: Dict[str, Any], delay_s: float
+) -> None:
+    """Marks a finished Pod as having had its logs collected,
+    after the given delay, as seen by the Pod watch.
+    """
+    await asyncio.sleep(delay_s)
+    annotations: Dict[str, str] = {
+        **metadata.get("annotations", {}),
+        handlers._LOGS_DRAINED_ANNOTATION: "yes",  # pylint: disable=protected-access
+    }
+    await handlers.pod_event(
+        "MODIFIED",
+        {"metadata": {**metadata, "annotations": annotations}, **pod_state},
+        pod_state["status"]["phase"],
+    )
+
+
+def _report(results: Dict[str, Any], memory: Optional[float]) -> None:
+    """Prints one line of results."""
+    print(
+        f"{results['jobs']:>7}"
+        f" {results['create_rate']:>9.0f}"
+        f" {results['create_p50'] * 1000:>8.2f}"
+        f" {results['create_p99'] * 1000:>8.2f}"
+        f" {results['delete_rate']:>9.0f}"
+        f" {results['delete_p50'] * 1000:>8.2f}"
+        f" {results['delete_p99'] * 1000:>8.2f}"
+        f" {'-' if memory is None else f'{memory / 1024:.1f}':>8}"
+        f" {results['api_calls']:>9}"
+        f" {results['api_errors']:>7}"
+        f" {results['retries']:>7}"
+        f" {results['failed']:>6}",
+        flush=True,
+    )
+
+
+def main() -> None:
+    """The benchmark entry-point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument(
+        "--concurrency", type=int, default=100, help="Handlers run at once"
+    )
+    parser.add_argument("--files", type=int, default=1, help="Files per Job")
+    parser.add_argument(
+        "--image-type", choices=["simple", "nextflow"], default="simple"
+    )
+    parser.add_argument(
+        "--latency-ms", type=float, default=0.0, help="Mean API call latency"
+    )
+    parser.add_argument(
+        "--jitter-ms", type=float, default=0.0, help="API call latency jitter"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of failed API calls"
+    )
+    parser.add_argument("--pre-delete-delay-s", type=float, default=0.0)
+    parser.add_argument(
+        "--logs-drained-s",
+        type=float,
+        default=None,
+        help="The time taken to collect a finished Job's logs",
+    )
+    parser.add_argument(
+        "--status-window-s",
+        type=float,
+        default=1.0,
+        help="The Job status write (coalescing) window",
+    )
+    parser.add_argument(
+        "--api-limits",
+        action="store_true",
+        help="Apply the operator's API write limits (from the environment)",
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="Skip the memory (traced) runs"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level)
+
+    print(
+        f"concurrency={args.concurrency} files={args.files}"
+        f" image_type={args.image_type} latency_ms={args.latency_ms}"
+        f" jitter_ms={args.jitter_ms} error_rate={args.error_rate}"
+        f" api_limits={args.api_limits}"
+    )
+    print(
+        "   Jobs  Create/s  p50(ms)  p99(ms)  Delete/s  p50(ms)  p99(ms)"
+        "  KiB/Job  ApiCalls  Errors Retries Failed"
+    )
+    for run_number, count in enumerate(args.jobs):
+        results: Dict[str, Any] = asyncio.run(_run(args, count, f"job-{run_number}"))
+        memory: Optional[float] = None
+        if not args.no_memory:
+            tracemalloc.start()
+            memory = asyncio.run(_run(args, count, f"mem-{run_number}"))["memory"]
+            tracemalloc.stop()
+        _report(results, memory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""An in-process stand-in for the parts of the Kubernetes CoreV1 API
+(and the API client and CustomObjects API) used by the operator, for benchmarking its handlers.
+
+Objects are kept in memory. Every call can be given a latency
+(to simulate the round-trip to the API server) and an error rate
+(to simulate transient API server failures).
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from kubernetes_asyncio.client.exceptions import ApiException
+
+
+class FakeCoreV1Api:
+    """A fake asynchronous CoreV1Api.
+
+    'latency_s' is the mean time each call takes, with up to
+    'jitter_s' added (or removed) at random. A fraction ('error_rate')
+    of calls fail with a 503 (Service Unavailable) before
+    they have any effect.
+
+    Object bodies are only kept if 'keep_objects' is set,
+    otherwise (i.e. when measuring the operator's memory)
+    only their metadata is kept.
+    """
+
+    def __init__(
+        self,
+        latency_s: float = 0.0,
+        jitter_s: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+        keep_objects: bool = True,
+    ):
+        self.latency_s: float = latency_s
+        self.jitter_s: float = jitter_s
+        self.error_rate: float = error_rate
+        self.keep_objects: bool = keep_objects
+        self._random: random.Random = random.Random(seed)
+        # Objects, keyed by kind, namespace and name
+        self.objects: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        # The keys of the ConfigMaps, by namespace and 'app' label
+        self._apps: Dict[Tuple[str, str], Set[Tuple[str, str, str]]] = {}
+        # Statistics
+        self.calls: Dict[str, int] = {}
+        self.errors: int = 0
+        # The time (monotonic) each Pod deletion finished (or failed)
+        self.pod_deletions: Dict[Tuple[str, str], float] = {}
+
+    async def _call(self, call: str) -> None:
+        """Simulates the round-trip of an API call,
+        raising a (transient) ApiException if the call is to fail.
+        """
+        self.calls[call] = self.calls.get(call, 0) + 1
+        delay_s: float = self.latency_s
+        if self.jitter_s:
+            delay_s += self._random.uniform(-self.jitter_s, self.jitter_s)
+        # Always yield - as any real call would
+        await asyncio.sleep(max(delay_s, 0))
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            raise ApiException(status=503, reason="Service Unavailable")
+
+    def _create(self, kind: str, namespace: str, body: Dict[str, Any]) -> None:
+        key: Tuple[str, str, str] = (kind, namespace, body["metadata"]["name"])
+        if key in self.objects:
+            raise ApiException(status=409, reason="Conflict")
+        self._store(key, body)
+
+    def _delete(self, kind: str, name: str, namespace: str) -> None:
+        key: Tuple[str, str, str] = (kind, namespace, name)
+        if key not in self.objects:
+            raise ApiException(status=404, reason="Not Found")
+        self._remove(key)
+
+    def _store(self, key: Tuple[str, str, str], body: Dict[str, Any]) -> None:
+        self.objects[key] = (
+            body if self.keep_objects else {"metadata": body["metadata"]}
+        )
+        app: Optional[str] = body["metadata"].get("labels", {}).get("app")
+        if key[0] == "ConfigMap" and app:
+            self._apps.setdefault((key[1], app), set()).add(key)
+
+    def _remove(self, key: Tuple[str, str, str]) -> None:
+        obj: Dict[str, Any] = self.objects.pop(key)
+        app: Optional[str] = obj["metadata"].get("labels", {}).get("app")
+        if key[0] == "ConfigMap" and app:
+            self._apps[(key[1], app)].discard(key)
+            if not self._apps[(key[1], app)]:
+                del self._apps[(key[1], app)]
+
+    @property
+    def api_client(self) -> "FakeCoreV1Api":
+        """The API client (for requests the API has no method for)."""
+        return self
+
+    async def call_api(
+        self,
+        resource_path: str,
+        method: str,
+        path_params: Dict[str, str],
+        header_params: Dict[str, str],
+        body: Any,
+        **_: Any,
+    ) -> Dict[str, Any]:
+        """Makes a request. Only server-side apply (of ConfigMaps and Pods)
+        and merge patches of the status of DataManagerJobs are supported.
+        Applied objects are created, or replaced.
+        """
+        assert method == "PATCH"
+        if resource_path.endswith("/datamanagerjobs/{name}/status"):
+            assert header_params["Content-Type"] == "application/merge-patch+json"
+            await self._call("merge_patch_job_status")
+            return self._patch_status(
+                "datamanagerjobs", path_params["namespace"], path_params["name"], body
+            )
+        assert header_params["Content-Type"] == "application/apply-patch+yaml"
+        await self._call("server_side_apply")
+        kind: str = {"configmaps": "ConfigMap", "pods": "Pod"}[
+            resource_path.split("/")[-2]
+        ]
+        obj: Dict[str, Any] = json.loads(body)
+        key: Tuple[str, str, str] = (
+            kind,
+            path_params["namespace"],
+            path_params["name"],
+        )
+        self._store(key, obj)
+        return obj
+
+    def count(self, kind: str) -> int:
+        """Returns the number of objects of the given kind."""
+        return sum(1 for key in self.objects if key[0] == kind)
+
+    async def create_namespaced_config_map(
+        self, namespace: str, body: Dict[str, Any], **_: Any
+    ) -> Dict[str, Any]:
+        """Creates a ConfigMap."""
+        await self._call("create_namespaced_config_map")
+        self._create("ConfigMap", namespace, body)
+        return body
+
+    async def create_namespaced_pod(
+        self, namespace: str, body: Dict[str, Any], **_: Any
+    ) -> Dict[str, Any]:
+        """Creates a Pod."""
+        await self._call("create_namespaced_pod")
+        self._create("Pod", namespace, body)
+        return body
+
+    async def patch_namespaced_config_map(
+        self, name: str, namespace: str, body: Dict[str, Any], **_: Any
+    ) -> Dict[str, Any]:
+        """Patches a ConfigMap, merging any owner references."""
+        await self._call("patch_namespaced_config_map")
+        key: Tuple[str, str, str] = ("ConfigMap", namespace, name)
+        if key not in self.objects:
+            raise ApiException(status=404, reason="Not Found")
+        configmap: Dict[str, Any] = self.objects[key]
+        refs = configmap["metadata"].setdefault("ownerReferences", [])
+        uids = {ref["uid"] for ref in refs}
+        for ref in body.get("metadata", {}).get("ownerReferences", []):
+            if ref["uid"] not in uids:
+                refs.append(ref)
+        return configmap
+
+    async def patch_namespaced_custom_object(self, *_: Any, **__: Any) -> None:
+        """Patches a custom object. The client sends the patch
+        as a strategic merge patch, which custom objects do not support.
+        """
+        await self._call("patch_namespaced_custom_object")
+        raise ApiException(status=415, reason="Unsupported Media Type")
+
+    async def patch_namespaced_custom_object_status(self, *_: Any, **__: Any) -> None:
+        """Patches the status of a custom object.
+        As 'patch_namespaced_custom_object', it fails.
+        """
+        await self._call("patch_namespaced_custom_object_status")
+        raise ApiException(status=415, reason="Unsupported Media Type")
+
+    def _patch_status(
+        self, plural: str, namespace: str, name: str, body: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Merges the status of a custom object (i.e. a DataManagerJob),
+        which is created if it doesn't exist (and only kept if 'keep_objects').
+        """
+        if not self.keep_objects:
+            return body
+        key: Tuple[str, str, str] = (plural, namespace, name)
+        obj: Dict[str, Any] = self.objects.setdefault(
+            key, {"metadata": {"name": name, "namespace": namespace}}
+        )
+        obj.setdefault("status", {}).update(body["status"])
+        return obj
+
+    async def delete_namespaced_pod(self, name: str, namespace: str, **_: Any) -> None:
+        """Deletes a Pod."""
+        try:
+            await self._call("delete_namespaced_pod")
+            self._delete("Pod", name, namespace)
+        finally:
+            self.pod_deletions[(namespace, name)] = time.monotonic()
+
+    async def delete_namespaced_config_map(
+        self, name: str, namespace: str, **_: Any
+    ) -> None:
+        """Deletes a ConfigMap."""
+        await self._call("delete_namespaced_config_map")
+        self._delete("ConfigMap", name, namespace)
+
+    async def delete_collection_namespaced_config_map(
+        self, namespace: str, label_selector: str, **_: Any
+    ) -> None:
+        """Deletes the ConfigMaps selected by an 'app' label selector
+        ('app=<name>' or 'app in (<name>,...)').
+        """
+        await self._call("delete_collection_namespaced_config_map")
+        if " in " in label_selector:
+            apps: List[str] = label_selector.split("(", 1)[1].rstrip(")").split(",")
+        else:
+            apps = [label_selector.split("=", 1)[1]]
+        for app in apps:
+            for key in list(self._apps.get((namespace, app), [])):
+                self._remove(key)
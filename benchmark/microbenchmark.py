@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+"""A micro-benchmark of building a Job's Pod and Nextflow configuration.
+
+It compares the operator's templates ('operator/templates.py'),
+which build the operator-wide parts of the objects once,
+with building the whole of each object from the Job's material
+for every Job (as the operator used to).
+
+Run it from the project root, with the operator's requirements installed: -
+
+    python benchmark/microbenchmark.py
+"""
+import argparse
+import os
+import shlex
+import sys
+import timeit
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "operator")
+)
+
+# pylint: disable=wrong-import-position
+from templates import JobTemplates, nextflow_config
+
+_SA: str = "data-manager-app"
+_SELECTOR_KEY: str = "informaticsmatters.com/purpose-worker"
+_SELECTOR_VALUE: str = "yes"
+_QUEUE_SIZE: int = 100
+_DEFAULT_CPU: str = "1"
+_DEFAULT_MEMORY: str = "1Gi"
+_DEFAULT_USER_ID: int = 1001
+_DEFAULT_GROUP_ID: int = 1001
+_DEFAULT_PROJECT_MOUNT: str = "/project"
+_DEFAULT_PROJECT_CLAIM_NAME: str = "project"
+
+_TEMPLATES: JobTemplates = JobTemplates(
+    service_account=_SA,
+    node_selector_key=_SELECTOR_KEY,
+    node_selector_value=_SELECTOR_VALUE,
+    nf_executor_queue_size=_QUEUE_SIZE,
+    default_cpu=_DEFAULT_CPU,
+    default_memory=_DEFAULT_MEMORY,
+    default_user_id=_DEFAULT_USER_ID,
+    default_group_id=_DEFAULT_GROUP_ID,
+    default_project_mount=_DEFAULT_PROJECT_MOUNT,
+    default_project_claim_name=_DEFAULT_PROJECT_CLAIM_NAME,
+)
+
+# A typical Job
+_NAME: str = "instance-00000000-0000-0000-0000-000000000000"
+_NF_CONFIG_NAME: str = f"{_NAME}-nf-config"
+_MATERIAL: Dict[str, Any] = {
+    "image": "informaticsmatters/benchmark:1.0.0",
+    "imageType": "nextflow",
+    "command": "nextflow run main.nf --input data/input.sdf --output output.sdf",
+    "taskId": "task-00000000-0000-0000-0000-000000000000",
+    "project": {"id": "project-00000000-0000-0000-0000-000000000000"},
+    "workingDirectory": "/project",
+    "labels": [
+        f"data-manager.informaticsmatters.com/instance-id={_NAME}",
+        "data-manager.informaticsmatters.com/instance-is-job=yes",
+        "data-manager.informaticsmatters.com/task-id=task-00000000",
+    ],
+    "environment": ["DM_INSTANCE_ID=instance-00000000", "DM_OWNER=dmit-user"],
+}
+# ...and one whose command has quotes
+_QUOTED_MATERIAL: Dict[str, Any] = dict(
+    _MATERIAL, command="nextflow run main.nf --title 'My Job' --output output.sdf"
+)
+
+
+def _literal_pod(material: Dict[str, Any]) -> Dict[str, Any]:
+    """Builds the whole Pod from the material (as the operator used to)."""
+    image: str = material["image"]
+    image_parts: List[str] = image.split(":")
+    image_tag: str = "latest" if len(image_parts) == 1 else image_parts[1]
+    image_pull_policy: str = (
+        "Always" if image_tag.lower() in ["latest", "stable"] else "IfNotPresent"
+    )
+    command_items = shlex.split(material["command"])
+    sc_run_as_user = material.get("securityContext", {}).get(
+        "runAsUser", _DEFAULT_USER_ID
+    )
+    sc_run_as_group = material.get("securityContext", {}).get(
+        "runAsGroup", _DEFAULT_GROUP_ID
+    )
+    cpu_request: Any = (
+        material.get("resources", {}).get("requests", {}).get("cpu", _DEFAULT_CPU)
+    )
+    memory_request: Any = (
+        material.get("resources", {}).get("requests", {}).get("memory", _DEFAULT_MEMORY)
+    )
+    cpu_limit: Any = (
+        material.get("resources", {}).get("limits", {}).get("cpu", _DEFAULT_CPU)
+    )
+    memory_limit: Any = (
+        material.get("resources", {}).get("limits", {}).get("memory", _DEFAULT_MEMORY)
+    )
+    project_id = material.get("project", {}).get("id")
+    project_mount = material.get("projectMount", _DEFAULT_PROJECT_MOUNT)
+    working_sub_path = material.get("workingSubPath")
+    project_claim_name = material.get("project", {}).get(
+        "claimName", _DEFAULT_PROJECT_CLAIM_NAME
+    )
+    pull_secret: str = material.get("pullSecret", "")
+    working_path = material["workingDirectory"]
+    if working_sub_path:
+        working_path += f"/{working_sub_path}"
+
+    pod: Dict[str, Any] = {
+        "kind": "Pod",
+        "apiVersion": "v1",
+        "metadata": {"name": _NAME, "labels": {}},
+        "spec": {
+            "serviceAccountName": _SA,
+            "nodeSelector": {_SELECTOR_KEY: _SELECTOR_VALUE},
+            "restartPolicy": "Never",
+            "containers": [
+                {
+                    "name": _NAME,
+                    "image": image,
+                    "command": command_items,
+                    "workingDir": working_path,
+                    "imagePullPolicy": image_pull_policy,
+                    "terminationMessagePolicy": "FallbackToLogsOnError",
+                    "env": [
+                        {
+                            "name": "NXF_WORK",
+                            "value": project_mount + "/." + _NAME + "/work",
+                        }
+                    ],
+                    "resources": {
+                        "requests": {
+                            "cpu": f"{cpu_request}",
+                            "memory": f"{memory_request}",
+                        },
+                        "limits": {"cpu": f"{cpu_limit}", "memory": f"{memory_limit}"},
+                    },
+                    "volumeMounts": [
+                        {
+                            "name": "project",
+                            "mountPath": project_mount,
+                            "subPath": project_id,
+                        },
+                    ],
+                }
+            ],
+            "securityContext": {
+                "runAsUser": sc_run_as_user,
+                "runAsGroup": sc_run_as_group,
+                "fsGroup": 0,
+            },
+            "volumes": [
+                {
+                    "name": "project",
+                    "persistentVolumeClaim": {"claimName": project_claim_name},
+                },
+            ],
+        },
+    }
+    if pull_secret:
+        pod["spec"]["imagePullSecrets"] = [{"name": pull_secret}]
+    for label in material.get("labels", []):
+        key, value = label.split("=")
+        pod["metadata"]["labels"][key] = value
+    for environment in material.get("environment", []):
+        key, value = environment.split("=")
+        pod["spec"]["containers"][0]["env"].append({"name": key, "value": value})
+    if material.get("debug"):
+        pod["metadata"]["labels"]["debug"] = "yes"
+    pod["spec"]["volumes"].append(
+        {"name": "nf-config", "configMap": {"name": _NF_CONFIG_NAME}}
+    )
+    pod["spec"]["containers"][0]["volumeMounts"].append(
+        {
+            "name": "nf-config",
+            "mountPath": f"{working_path}/nextflow.config",
+            "subPath": "nextflow.config",
+        }
+    )
+    return pod
+
+
+def _template_pod(material: Dict[str, Any]) -> Dict[str, Any]:
+    """Builds the Pod from the operator's templates."""
+    return _TEMPLATES.pod(_NAME, material, nf_config_name=_NF_CONFIG_NAME)
+
+
+def _literal_nextflow_config(material: Dict[str, Any]) -> str:
+    """Formats the whole Nextflow configuration (as the operator used to)."""
+    pull_secret: str = material.get("pullSecret", "")
+    extra_pod_settings = ""
+    if pull_secret:
+        extra_pod_settings += f"[imagePullSecret: '{pull_secret}'],\n"
+    configmap_vars = {
+        "executor_queue_size": _QUEUE_SIZE,
+        "extra_pod_settings": extra_pod_settings,
+        "claim_name": material.get("project", {}).get(
+            "claimName", _DEFAULT_PROJECT_CLAIM_NAME
+        ),
+        "name": _NAME,
+        "project_id": material.get("project", {}).get("id"),
+        "project_mount": material.get("projectMount", _DEFAULT_PROJECT_MOUNT),
+        "sa": _SA,
+        "user": material.get("securityContext", {}).get("runAsUser", _DEFAULT_USER_ID),
+        "group": material.get("securityContext", {}).get(
+            "runAsGroup", _DEFAULT_GROUP_ID
+        ),
+        "selector_key": _SELECTOR_KEY,
+        "selector_value": _SELECTOR_VALUE,
+    }
+    return nextflow_config % configmap_vars
+
+
+def _template_nextflow_config(material: Dict[str, Any]) -> str:
+    """Formats the Nextflow configuration from the operator's templates."""
+    return _TEMPLATES.nextflow_config(_NAME, material)
+
+
+def _time(fn: Callable[[], Any], number: int, repeat: int) -> float:
+    """Returns the best time (microseconds) for one call of the function."""
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def main() -> None:
+    """The micro-benchmark entry-point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print("Object                  Literal(us)  Template(us)  Speed-up")
+    for title, literal, template, material in [
+        ("Pod", _literal_pod, _template_pod, _MATERIAL),
+        ("Pod (quoted command)", _literal_pod, _template_pod, _QUOTED_MATERIAL),
+        (
+            "nextflow.config",
+            _literal_nextflow_config,
+            _template_nextflow_config,
+            _MATERIAL,
+        ),
+    ]:
+        # Both must build the same object
+        assert literal(material) == template(material)
+        literal_us: float = _time(
+            lambda fn=literal, m=material: fn(m), args.number, args.repeat
+        )
+        template_us: float = _time(
+            lambda fn=template, m=material: fn(m), args.number, args.repeat
+        )
+        print(
+            f"{title:<22} {literal_us:>12.2f} {template_us:>13.2f}"
+            f" {literal_us / template_us:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
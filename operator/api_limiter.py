@@ -0,0 +1,116 @@
+"""A token-bucket rate limiter for the operator's Kubernetes API calls.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+
+class TokenBucket:
+    """An asynchronous token-bucket rate limiter.
+
+    Tokens are added at 'rate' per second up to 'burst'. Each call to
+    'acquire()' takes a token, waiting (in turn) for one if the bucket
+    is empty. A rate of zero (or less) means there is no limit.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate: float = rate
+        self.burst: int = max(burst, 1)
+        self._tokens: float = float(self.burst)
+        self._updated: float = time.monotonic()
+        self._lock: asyncio.Lock = asyncio.Lock()
+        # Statistics
+        self.acquired: int = 0
+        self.waits: int = 0
+        self.wait_s_total: float = 0.0
+
+    def _refill(self) -> None:
+        now: float = time.monotonic()
+        self._tokens = min(
+            float(self.burst), self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    @property
+    def level(self) -> float:
+        """How full the bucket is (0.0 to 1.0)."""
+        if self.rate <= 0:
+            return 1.0
+        elapsed_s: float = time.monotonic() - self._updated
+        return min(float(self.burst), self._tokens + elapsed_s * self.rate) / self.burst
+
+    async def acquire(self) -> float:
+        """Takes a token, returning the time (seconds) spent waiting for it."""
+        self.acquired += 1
+        if self.rate <= 0:
+            return 0.0
+        async with self._lock:
+            self._refill()
+            wait_s: float = 0.0
+            if self._tokens < 1.0:
+                wait_s = (1.0 - self._tokens) / self.rate
+                await asyncio.sleep(wait_s)
+                self._refill()
+                self.waits += 1
+                self.wait_s_total += wait_s
+            self._tokens -= 1.0
+            return wait_s
+
+
+class ApiLimiter:
+    """Limits the rate of the operator's API writes, using a TokenBucket
+    for each kind of call ('create' and 'delete'), and the number of
+    API calls that can be in progress.
+    """
+
+    def __init__(self) -> None:
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.max_in_flight: int = 0
+        self.in_flight: int = 0
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._last_report: float = 0.0
+        self.configure()
+
+    def configure(
+        self,
+        create_rate: float = 0.0,
+        create_burst: int = 1,
+        delete_rate: float = 0.0,
+        delete_burst: int = 1,
+        max_in_flight: int = 0,
+    ) -> None:
+        """Sets (or resets) the limits."""
+        self.buckets = {
+            "create": TokenBucket(create_rate, create_burst),
+            "delete": TokenBucket(delete_rate, delete_burst),
+        }
+        self.max_in_flight = max_in_flight
+        self._in_flight = (
+            asyncio.Semaphore(max_in_flight) if max_in_flight > 0 else None
+        )
+
+    async def call(self, kind: str, api_fn: Any, *args: Any, **kwargs: Any) -> Any:
+        """Calls the API function once a token (of the given kind)
+        and an in-flight slot are available.
+        """
+        bucket: TokenBucket = self.buckets[kind]
+        wait_s: float = await bucket.acquire()
+        if wait_s > 0 and time.monotonic() - self._last_report > 10:
+            self._last_report = time.monotonic()
+            logging.info(
+                "Throttled API %s (level=%.2f waits=%s wait_s_total=%.1f in_flight=%s)",
+                kind,
+                bucket.level,
+                bucket.waits,
+                bucket.wait_s_total,
+                self.in_flight,
+            )
+        if self._in_flight is None:
+            return await api_fn(*args, **kwargs)
+        async with self._in_flight:
+            self.in_flight += 1
+            try:
+                return await api_fn(*args, **kwargs)
+            finally:
+                self.in_flight -= 1
@@ -0,0 +1,34 @@
+"""Checks of the raw (not preloaded) responses of API calls.
+
+The operator's lists (and log streams) ask the client not to preload
+(deserialise) the response, reading the JSON (or log) itself - it's much
+faster than building the client's models. The client then returns the
+response whatever its status (it only raises an ApiException for a failed,
+preloaded, response) so a failure's Status object would be read as if it
+were the result. The response is checked here instead, raising the
+ApiException the client would have raised.
+"""
+import json
+from typing import Any
+
+import aiohttp
+import kubernetes_asyncio
+
+
+async def check(response: aiohttp.ClientResponse) -> None:
+    """Raises an ApiException if the response is not a success (2xx)."""
+    if 200 <= response.status <= 299:
+        return
+    # Reading the body releases the connection
+    body: bytes = await response.read()
+    raise kubernetes_asyncio.client.exceptions.ApiException(
+        http_resp=kubernetes_asyncio.client.rest.RESTResponse(response, body)
+    )
+
+
+async def read_json(response: aiohttp.ClientResponse) -> Any:
+    """The JSON body of a successful response
+    (an ApiException is raised if it failed).
+    """
+    await check(response)
+    return json.loads(await response.read())
@@ -0,0 +1,52 @@
+"""The operator's local (informer-style) cache of Job Pods.
+
+The cache is the operator's Job Pod watch (see pod_watch.py), which
+remembers every Job Pod it has seen. The watch is selected (by the API
+server) using the Pods' labels, so only Job Pods are ever cached.
+The watch is handed to 'use()' by the operator's startup handler.
+
+The cache is incomplete until the watch has listed the Pods (and it
+does not list them if it resumes from a checkpoint), so it's only used
+to avoid work - i.e. to skip creating a Pod that's known to exist. An
+object that's not in the cache may still exist, so deletions are never
+skipped (deleting an object that has gone costs a 404).
+
+Until then (or if the handlers are not run by kopf) there is no cache,
+and nothing is known to exist.
+
+ConfigMaps are not cached (they're applied, so creating one that exists
+is harmless, and their deletions are never skipped) and the Pods are not
+indexed by their labels - nothing in the operator looks them up, and the
+state of a Job is in the status of its DataManagerJob (see job_status.py).
+"""
+from typing import Container, List, Optional, Tuple
+
+# The labels of the Job Pods
+INSTANCE_ID_LABEL: str = "data-manager.informaticsmatters.com/instance-id"
+INSTANCE_IS_JOB_LABEL: str = "data-manager.informaticsmatters.com/instance-is-job"
+# The label applied to shared ConfigMaps
+# (they have no 'app' label as they're not owned by a single Job)
+SHARED_CONFIGMAP_LABEL: str = "data-manager.informaticsmatters.com/shared"
+
+# The Pod phases
+POD_PHASES: List[str] = ["Pending", "Running", "Succeeded", "Failed", "Unknown"]
+# Selects the Pods that have finished (by excluding the other phases)
+FINISHED_FIELD_SELECTOR: str = (
+    "status.phase!=Pending,status.phase!=Running,status.phase!=Unknown"
+)
+
+# The Job Pods in use (keyed by namespace and name)
+_PODS: Optional[Container[Tuple[str, str]]] = None
+
+
+def use(pods: Optional[Container[Tuple[str, str]]]) -> None:
+    """Sets (or, with None, clears) the Job Pods,
+    i.e. the Job Pod watch.
+    """
+    global _PODS  # pylint: disable=global-statement
+    _PODS = pods
+
+
+def pod_exists(namespace: str, name: str) -> bool:
+    """True if the Job Pod is in the cache."""
+    return _PODS is not None and (namespace, name) in _PODS
@@ -0,0 +1,178 @@
+"""Checkpoints of the resource versions the operator's watches resume from.
+
+A watch that's given a resource version resumes from it, receiving only
+the changes made since, rather than listing every object. The versions of
+the operator's watches are saved periodically (and when the operator stops)
+so that, when the operator restarts, its watches resume from where they
+were. If a saved version is too old (the API server only keeps a few
+minutes of history) the watch is told (with a '410 Gone') and lists
+the objects instead.
+
+A watch may have several versions (one for each namespace it watches),
+saved as '{watch}.{namespace}' (or '{watch}', if it watches all namespaces).
+
+The versions are saved in a ConfigMap (in the operator's namespace),
+or in a local file (which should be on a volume that outlives
+the operator's container).
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Callable, Dict, Optional
+
+import aiohttp
+import kubernetes_asyncio
+
+# Errors we expect (and survive) when saving (or loading) the versions
+_API_ERRORS = (
+    kubernetes_asyncio.client.exceptions.ApiException,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+    OSError,
+    ValueError,
+)
+
+
+class Checkpoint:
+    """Loads and (periodically) saves watch resource versions.
+
+    'store' is 'configmap' (the versions are saved in the ConfigMap 'name'
+    in 'namespace'), 'file' (the versions are saved, as JSON, in the file
+    'path') or 'no' (the versions are not saved).
+    """
+
+    def __init__(
+        self,
+        store: str,
+        name: str,
+        namespace: str,
+        path: str,
+        interval_s: float = 30.0,
+    ):
+        if store not in ["configmap", "file", "no"]:
+            raise ValueError(f"Unsupported checkpoint store ({store})")
+        self.store: str = store
+        self.name: str = name
+        self.namespace: str = namespace
+        self.path: str = path
+        self.interval_s: float = interval_s
+        # The loaded (or last saved) versions, keyed by watch
+        self.versions: Dict[str, str] = {}
+        self._watches: Dict[str, Callable[[], Dict[str, Optional[str]]]] = {}
+        self._api: Optional[kubernetes_asyncio.client.CoreV1Api] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        """True if the versions are saved."""
+        return self.store != "no"
+
+    async def start(self, api_client: kubernetes_asyncio.client.ApiClient) -> None:
+        """Loads the saved versions (see 'versions')
+        and starts saving them (in a background task).
+        """
+        if not self.enabled:
+            return
+        if self.store == "configmap":
+            self._api = kubernetes_asyncio.client.CoreV1Api(api_client)
+        try:
+            self.versions = await self._load()
+        except _API_ERRORS as ex:
+            logging.warning("Failed to load the watch checkpoint (%s)", ex)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logging.info("Loaded the watch checkpoint (versions=%s)", self.versions)
+
+    def watch_versions(self, watch: str) -> Dict[str, str]:
+        """The loaded versions of a watch, keyed by namespace
+        ('' if it watches all namespaces).
+        """
+        return {
+            key.partition(".")[2]: version
+            for key, version in self.versions.items()
+            if key.partition(".")[0] == watch
+        }
+
+    def track(
+        self, watch: str, versions_fn: Callable[[], Dict[str, Optional[str]]]
+    ) -> None:
+        """Saves the versions of a watch (keyed by namespace,
+        see 'watch_versions'), obtained by calling 'versions_fn'.
+        """
+        self._watches[watch] = versions_fn
+
+    async def stop(self) -> None:
+        """Stops (periodically) saving the versions, saving them one last time."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+            await self._save_changes()
+        self._api = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_s)
+            await self._save_changes()
+
+    async def _save_changes(self) -> None:
+        """Saves the versions, if any have changed."""
+        versions: Dict[str, str] = dict(self.versions)
+        for watch, versions_fn in self._watches.items():
+            for namespace, version in versions_fn().items():
+                if version:
+                    versions[f"{watch}.{namespace}" if namespace else watch] = version
+        if versions == self.versions:
+            return
+        try:
+            await self._save(versions)
+        except _API_ERRORS as ex:
+            logging.warning("Failed to save the watch checkpoint (%s)", ex)
+            return
+        self.versions = versions
+
+    async def _load(self) -> Dict[str, str]:
+        if self.store == "file":
+            if not os.path.exists(self.path):
+                return {}
+            with open(self.path, "r", encoding="utf-8") as checkpoint_file:
+                return json.load(checkpoint_file)
+
+        assert self._api
+        try:
+            configmap = await self._api.read_namespaced_config_map(
+                self.name, self.namespace
+            )
+        except kubernetes_asyncio.client.exceptions.ApiException as ex:
+            if ex.status != 404:
+                raise
+            return {}
+        return dict(configmap.data or {})
+
+    async def _save(self, versions: Dict[str, str]) -> None:
+        if self.store == "file":
+            # Write a new file and then replace the old one,
+            # so the checkpoint is never left half-written.
+            new_path: str = f"{self.path}.new"
+            with open(new_path, "w", encoding="utf-8") as checkpoint_file:
+                json.dump(versions, checkpoint_file)
+            os.replace(new_path, self.path)
+            return
+
+        assert self._api
+        try:
+            await self._api.patch_namespaced_config_map(
+                self.name, self.namespace, {"data": versions}
+            )
+            return
+        except kubernetes_asyncio.client.exceptions.ApiException as ex:
+            if ex.status != 404:
+                raise
+        await self._api.create_namespaced_config_map(
+            self.namespace,
+            {
+                "apiVersion": "v1",
+                "kind": "ConfigMap",
+                "metadata": {"name": self.name},
+                "data": versions,
+            },
+        )
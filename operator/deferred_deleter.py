@@ -0,0 +1,189 @@
+"""Deferred (delayed) deletion of a finished Job's objects.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import metrics
+
+
+class DeferredDeleter:
+    """Runs delayed Job deletions without blocking (or sleeping in)
+    the event handler.
+
+    Each deletion is a timer on the operator's event loop, keyed by the
+    Pod's namespace and name. Timers cost very little so thousands of
+    deletions can be pending. A Pod is only ever scheduled once, repeated
+    events for a Pod that's pending (or recently deleted) are ignored.
+    Keys of deleted Pods are retained for a short period to absorb the
+    events that typically follow the deletion.
+
+    A pending deletion can be expedited (started immediately) - i.e. when
+    the Job's logs are known to have been collected, the delay being
+    only a fallback for when we're not told.
+
+    The objects are deleted by 'delete_fn', which is called with the
+    Pod's name, namespace and the names of its ConfigMaps. A deletion
+    that fails is retried after a (jittered) exponential delay, starting
+    at 'backoff_base_s' and limited to 'backoff_max_s', and is abandoned
+    after 'max_attempts' (a finished Pod that's left is swept later).
+    """
+
+    def __init__(
+        self,
+        delete_fn: Callable[[str, str, Optional[List[str]]], Awaitable[None]],
+        retention_s: float = 60.0,
+        backoff_base_s: float = 1.0,
+        backoff_max_s: float = 60.0,
+        max_attempts: int = 10,
+    ):
+        self._delete_fn = delete_fn
+        self._retention_s: float = retention_s
+        self._backoff_base_s: float = backoff_base_s
+        self._backoff_max_s: float = backoff_max_s
+        self._max_attempts: int = max_attempts
+        # The deletions waiting to start (or be retried), or in progress
+        self._pending: Dict[Tuple[str, str], asyncio.Handle] = {}
+        # The ConfigMaps and schedule time of deletions yet to start
+        self._waiting: Dict[Tuple[str, str], Tuple[Optional[List[str]], float]] = {}
+        # The (recently) deleted Pods, and the timers that forget them
+        self._retained: Dict[Tuple[str, str], asyncio.Handle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self._pending or key in self._retained
+
+    def schedule(
+        self,
+        pod_namespace: str,
+        pod_name: str,
+        configmaps: Optional[List[str]],
+        delay_s: float,
+        drained: bool = False,
+    ) -> bool:
+        """Schedules the deletion of the Job objects (the Pod and the named
+        ConfigMaps) after the given delay, returning False if the Pod
+        is already known to us. If the Job's logs have already been
+        collected ('drained') the deletion starts immediately.
+        """
+        key: Tuple[str, str] = (pod_namespace, pod_name)
+        if key in self:
+            return False
+        scheduled: float = time.monotonic()
+        loop = asyncio.get_running_loop()
+        if drained:
+            self._pending[key] = loop.call_soon(
+                self._start, key, configmaps, scheduled, "drained"
+            )
+            return True
+        self._waiting[key] = (configmaps, scheduled)
+        self._pending[key] = loop.call_later(
+            max(delay_s, 0), self._start, key, configmaps, scheduled, "timeout"
+        )
+        return True
+
+    def expedite(self, pod_namespace: str, pod_name: str) -> bool:
+        """Starts a scheduled deletion now, rather than after its delay,
+        returning False if there's no deletion waiting to start.
+        """
+        key: Tuple[str, str] = (pod_namespace, pod_name)
+        waiting: Optional[Tuple[Optional[List[str]], float]] = self._waiting.pop(
+            key, None
+        )
+        if waiting is None:
+            return False
+        self._pending[key].cancel()
+        configmaps, scheduled = waiting
+        self._pending[key] = asyncio.get_running_loop().call_soon(
+            self._start, key, configmaps, scheduled, "drained"
+        )
+        return True
+
+    def cancel_all(self) -> int:
+        """Cancels all the pending deletions, returning the number cancelled."""
+        for handle in [*self._pending.values(), *self._retained.values()]:
+            handle.cancel()
+        for task in self._tasks:
+            task.cancel()
+        cancelled: int = len(self._pending)
+        self._pending.clear()
+        self._waiting.clear()
+        self._retained.clear()
+        return cancelled
+
+    def _start(
+        self,
+        key: Tuple[str, str],
+        configmaps: Optional[List[str]],
+        scheduled: float,
+        trigger: str,
+        attempt: int = 0,
+    ) -> None:
+        """Starts a deletion, recording what triggered it
+        ('drained' or 'timeout') unless it's being retried.
+        """
+        self._waiting.pop(key, None)
+        if not attempt:
+            metrics.DELETIONS_STARTED.labels(trigger).inc()
+        task = asyncio.get_running_loop().create_task(
+            self._delete(key, configmaps, scheduled, trigger, attempt)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _delete(
+        self,
+        key: Tuple[str, str],
+        configmaps: Optional[List[str]],
+        scheduled: float,
+        trigger: str,
+        attempt: int,
+    ) -> None:
+        pod_namespace, pod_name = key
+        loop = asyncio.get_running_loop()
+        try:
+            await self._delete_fn(pod_name, pod_namespace, configmaps)
+        except Exception as ex:  # pylint: disable=broad-except
+            # Anything the deletion raises must be caught here,
+            # there's nobody waiting for the task.
+            if attempt + 1 < self._max_attempts:
+                backoff_s: float = min(
+                    self._backoff_max_s, self._backoff_base_s * 2**attempt
+                )
+                delay_s: float = backoff_s / 2 + random.uniform(0, backoff_s / 2)
+                logging.warning(
+                    'Failed to delete Job "%s" (%s), retrying in %.1f seconds',
+                    pod_name,
+                    ex,
+                    delay_s,
+                )
+                metrics.DELETION_FAILURES.labels("retried").inc()
+                self._pending[key] = loop.call_later(
+                    delay_s,
+                    self._start,
+                    key,
+                    configmaps,
+                    scheduled,
+                    trigger,
+                    attempt + 1,
+                )
+                return
+            logging.error(
+                'Failed to delete Job "%s" (%s) after %s attempts',
+                pod_name,
+                ex,
+                attempt + 1,
+            )
+            metrics.DELETION_FAILURES.labels("abandoned").inc()
+        else:
+            metrics.DELETE_LATENCY_S.observe(time.monotonic() - scheduled)
+        # Remember the Pod for a while before forgetting it.
+        self._pending.pop(key, None)
+        self._retained[key] = loop.call_later(
+            self._retention_s, self._retained.pop, key, None
+        )
@@ -1,2 +1,15 @@
 #!/usr/bin/env bash
-kopf run ./handlers.py --verbose --standalone --all-namespaces --log-format full
+
+# Serve all namespaces, or just those in JO_NAMESPACES
+# (a comma-separated list of namespace names or glob patterns).
+NAMESPACE_ARGS=(--all-namespaces)
+if [ -n "${JO_NAMESPACES}" ]; then
+  NAMESPACE_ARGS=()
+  IFS=',' read -ra NAMESPACES <<< "${JO_NAMESPACES}"
+  for NAMESPACE in "${NAMESPACES[@]}"; do
+    NAMESPACE="${NAMESPACE// /}"
+    [ -n "${NAMESPACE}" ] && NAMESPACE_ARGS+=("--namespace=${NAMESPACE}")
+  done
+fi
+
+kopf run ./handlers.py --verbose --standalone "${NAMESPACE_ARGS[@]}" --log-format full
@@ -1,19 +1,47 @@
 """A kopf handler for the DataManagerJob CRD.
 """
+import asyncio
+import fnmatch
+import functools
 import os
-import shlex
+import random
+import socket
 import time
-from typing import Any, Dict, List
+from typing import Any, Awaitable, Dict, List, Optional, Set, Union
 
 import logging
+import aiohttp
 import kopf
-import kubernetes
+import kubernetes_asyncio
+
+from api_limiter import ApiLimiter
+import cache
+from checkpoint import Checkpoint
+from deferred_deleter import DeferredDeleter
+from job_objects import (
+    JobObjects,
+    list_jobs,
+    merge_patch_job,
+    run_all,
+    share_configmap,
+)
+import job_status
+import metrics
+from leadership import Leadership
+from log_shipper import LogShipper
+from pod_watch import PodWatch
+from reaper import ConfigMapReaper
+from sharding import ShardDiffBaseStorage, Shards
+from sweeper import Sweeper
+from templates import JobTemplates, file_objects
 
 # Pod pre-delete delay (seconds).
-# A fixed period of time the 'job_event' method waits
+# The longest period of time the 'job_event' method waits (without blocking)
 # after deciding to delete the Pod before actually deleting it.
 # This delay gives the Data Manager log-watcher an opportunity to collect
-# any remaining log events.
+# any remaining log events. The Pod is deleted as soon as the log-watcher
+# tells us it's done (see _LOGS_DRAINED_ANNOTATION), so the delay is only
+# a fallback, for when we're not told.
 _POD_PRE_DELETE_DELAY_S: int = int(os.environ.get("JO_POD_PRE_DELETE_DELAY_S", "5"))
 
 # Job Pod node selection
@@ -34,6 +62,176 @@ _POD_DEFAULT_MEMORY: str = os.environ.get("JO_POD_DEFAULT_MEMORY", "1Gi")
 # By default it's the DM's built-in app-based service account
 _POD_SA: str = os.environ.get("JO_POD_SA", "data-manager-app")
 
+# The maximum number of simultaneous connections
+# the (shared) asynchronous Kubernetes API client can open.
+_API_CONNECTION_POOL_SIZE: int = int(
+    os.environ.get("JO_API_CONNECTION_POOL_SIZE", "100")
+)
+
+# Pack injected files into as few ConfigMaps as possible?
+# If 'yes' all the files for a Job are written as keys in one ConfigMap
+# (or more, if the files would exceed _FILE_CONFIGMAP_MAX_BYTES)
+# and mounted into the Pod using a single projected volume.
+# If not, each file is written to its own ConfigMap (and volume).
+_PACK_FILE_CONFIGMAPS: bool = (
+    os.environ.get("JO_PACK_FILE_CONFIGMAPS", "no").lower() == "yes"
+)
+# The maximum size (bytes) of file content packed into one ConfigMap.
+# Kubernetes objects are limited to 1MiB, we leave room for the metadata.
+_FILE_CONFIGMAP_MAX_BYTES: int = int(
+    os.environ.get("JO_FILE_CONFIGMAP_MAX_BYTES", "921600")
+)
+
+# Share ConfigMaps between Jobs?
+# If 'yes' the injected file and Nextflow ConfigMaps are named by
+# a hash of their content. Jobs with identical content use the same
+# ConfigMap, each Job adding itself as an owner. Kubernetes removes
+# the ConfigMap when all of its owners have been deleted.
+_SHARE_CONFIGMAPS: bool = os.environ.get("JO_SHARE_CONFIGMAPS", "no").lower() == "yes"
+
+# Create a Job's Pod at the same time as its ConfigMaps?
+# A Job's ConfigMaps are always created concurrently. If 'yes' its Pod
+# is also created with them, rather than once they've all been created
+# (the kubelet waits for the ConfigMaps a Pod's volumes refer to).
+# The Pod is then created in one round-trip rather than two,
+# but will not start if one of its ConfigMaps cannot be created.
+_CREATE_POD_WITH_CONFIGMAPS: bool = (
+    os.environ.get("JO_CREATE_POD_WITH_CONFIGMAPS", "no").lower() == "yes"
+)
+
+# The Pod annotation used to record the (comma-separated) names
+# of the ConfigMaps created for (and owned by) the Job.
+# These are the objects deleted (as a collection, selected by their
+# 'app' label), along with the Pod, when the Job finishes.
+# Shared ConfigMaps are not recorded.
+_CONFIGMAPS_ANNOTATION: str = "data-manager.informaticsmatters.com/configmaps"
+
+# The annotation the Data Manager log-watcher adds to a Job's Pod
+# (or DataManagerJob) once it has collected all of the Pod's logs.
+# Its value is unimportant. A finished Pod with the annotation
+# is deleted without waiting for _POD_PRE_DELETE_DELAY_S.
+_LOGS_DRAINED_ANNOTATION: str = "data-manager.informaticsmatters.com/logs-drained"
+
+# Retry policy for transient API failures in 'create'.
+# Transient failures (i.e. 429, 5xx, timeouts and connection problems)
+# are retried after a jittered exponential delay that starts at
+# _RETRY_BACKOFF_BASE_S and is limited to _RETRY_BACKOFF_MAX_S.
+# A create that fails _RETRY_MAX_ATTEMPTS times is abandoned.
+# Failed Job deletions are retried (whatever the failure) using the same policy.
+_RETRY_BACKOFF_BASE_S: float = float(os.environ.get("JO_RETRY_BACKOFF_BASE_S", "1"))
+_RETRY_BACKOFF_MAX_S: float = float(os.environ.get("JO_RETRY_BACKOFF_MAX_S", "60"))
+_RETRY_MAX_ATTEMPTS: int = int(os.environ.get("JO_RETRY_MAX_ATTEMPTS", "10"))
+# The API response codes we consider transient
+_TRANSIENT_API_STATUS: Set[int] = {408, 429, 500, 502, 503, 504}
+# Exceptions raised (by the API client) for failed API calls
+_API_ERRORS = (
+    kubernetes_asyncio.client.exceptions.ApiException,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+)
+
+# Client-side limits for the operator's API writes.
+# Creates (and patches) and deletes each have a token bucket,
+# allowing a sustained rate (calls per second) with an initial burst.
+# A rate of zero disables the corresponding limit.
+# The number of API calls in progress at any time is also limited.
+_API_CREATE_RATE: float = float(os.environ.get("JO_API_CREATE_RATE", "50"))
+_API_CREATE_BURST: int = int(os.environ.get("JO_API_CREATE_BURST", "100"))
+_API_DELETE_RATE: float = float(os.environ.get("JO_API_DELETE_RATE", "50"))
+_API_DELETE_BURST: int = int(os.environ.get("JO_API_DELETE_BURST", "100"))
+_API_MAX_IN_FLIGHT: int = int(os.environ.get("JO_API_MAX_IN_FLIGHT", "64"))
+
+# The DataManagerJob status write window (seconds).
+# Changes to a Job's status made during the window (i.e. as its Pod
+# starts, runs and finishes) are merged and written in one patch.
+_STATUS_PATCH_WINDOW_S: float = float(os.environ.get("JO_STATUS_PATCH_WINDOW_S", "1"))
+
+# The port used to serve Prometheus metrics (0 to disable)
+_METRICS_PORT: int = int(os.environ.get("JO_METRICS_PORT", "8080"))
+
+# The namespaces the operator serves.
+# A comma-separated list of namespace names (or glob patterns,
+# i.e. 'data-manager-*'). The framework only watches (and caches)
+# objects in these namespaces (see entrypoint.sh). If empty,
+# the operator serves all namespaces.
+_NAMESPACES: List[str] = [
+    namespace.strip()
+    for namespace in os.environ.get("JO_NAMESPACES", "").split(",")
+    if namespace.strip()
+]
+# The namespaces the operator's own lists and watches (of Job Pods,
+# ConfigMaps and DataManagerJobs) are confined to. The API server
+# can't select namespaces using patterns, so if there are any (or no
+# namespaces) they're cluster-wide, and the objects are filtered.
+_LISTED_NAMESPACES: List[str] = (
+    [] if any(set(namespace) & set("*?[") for namespace in _NAMESPACES) else _NAMESPACES
+)
+
+# Sharding.
+# If set (to 'name' or 'namespace') DataManagerJobs are shared between
+# the operator's replicas, each handling the Jobs whose instance name
+# (or namespace) hashes to it. Replicas find each other using Leases,
+# created in the operator's namespace and renewed during the lease duration.
+# A replica whose Lease expires loses its Jobs to the others.
+_SHARD_BY: str = os.environ.get("JO_SHARD_BY", "")
+_SHARD_LEASE_DURATION_S: int = int(os.environ.get("JO_SHARD_LEASE_DURATION_S", "15"))
+# This replica's shard identity (the Pod name)
+# and the operator's namespace (of the Leases and the watch checkpoint)
+_SHARD_ID: str = os.environ.get("JO_SHARD_ID", socket.gethostname())
+_SHARD_NAMESPACE: str = os.environ.get("JO_NAMESPACE", "data-manager-job-operator")
+# The kopf annotation that records the last-handled DataManagerJob.
+# Objects without it have not been handled (created) yet.
+_KOPF_LAST_HANDLED_ANNOTATION: str = "kopf.zalando.org/last-handled-configuration"
+# The annotation set on unhandled DataManagerJobs that a replica
+# takes over from one that's gone (to re-trigger their handlers).
+_SHARD_ANNOTATION: str = "data-manager.informaticsmatters.com/shard"
+
+# Active/standby replicas.
+# If 'yes' the operator's replicas elect a leader (using a Lease in the
+# operator's namespace), which handles all the DataManagerJobs.
+# The others are warm standbys, one of which takes over when the leader
+# stops (immediately) or fails to renew the Lease (within its duration).
+# Ignored if the operator is sharded.
+_STANDBY: bool = os.environ.get("JO_STANDBY", "no").lower() == "yes"
+_LEADER_LEASE_DURATION_S: int = int(os.environ.get("JO_LEADER_LEASE_DURATION_S", "15"))
+
+# Watch checkpoints.
+# The resource version the Job Pod watch has reached is saved periodically,
+# in a ConfigMap ('configmap', in the operator's namespace) or a local file
+# ('file'), so a restarted operator resumes watching from it rather than
+# listing the Pods. 'no' disables the checkpoint. Replicas share
+# the checkpoint (resource versions are cluster-wide).
+_WATCH_CHECKPOINT: str = os.environ.get("JO_WATCH_CHECKPOINT", "configmap")
+_WATCH_CHECKPOINT_FILE: str = os.environ.get(
+    "JO_WATCH_CHECKPOINT_FILE", "/checkpoint/watch-checkpoint.json"
+)
+_WATCH_CHECKPOINT_INTERVAL_S: float = float(
+    os.environ.get("JO_WATCH_CHECKPOINT_INTERVAL_S", "30")
+)
+
+# Capture the logs of Job Pods (in the operator)?
+# If 'yes' the log of each Job Pod is written (compressed) to its project
+# (in the '.job-logs' directory), so the Pod can be deleted as soon as it
+# finishes (see log_shipper.py). The project volume (the claim
+# _LOG_SHIPPER_CLAIM_NAME, in the operator's namespace) has to be mounted
+# at _LOG_SHIPPER_ROOT. Jobs in other namespaces are not captured.
+# At most _LOG_SHIPPER_MAX_STREAMS logs are captured at once.
+_LOG_SHIPPER_ENABLED: bool = os.environ.get("JO_LOG_SHIPPER", "no").lower() == "yes"
+_LOG_SHIPPER_ROOT: str = os.environ.get("JO_LOG_SHIPPER_ROOT", "/projects")
+_LOG_SHIPPER_CLAIM_NAME: str = os.environ.get("JO_LOG_SHIPPER_CLAIM_NAME", "project")
+_LOG_SHIPPER_MAX_STREAMS: int = int(os.environ.get("JO_LOG_SHIPPER_MAX_STREAMS", "100"))
+
+# How often (seconds) finished Job Pods whose completion has been missed
+# (i.e. they're older than _POD_PRE_DELETE_DELAY_S and not being deleted)
+# are swept (deleted). 0 disables the sweeps.
+_SWEEP_INTERVAL_S: float = float(os.environ.get("JO_SWEEP_INTERVAL_S", "600"))
+
+# How often (seconds) the ConfigMaps of Jobs without a Pod are reaped
+# (deleted). 0 disables the reaping. The ConfigMaps are only reaped
+# once they're older than _REAP_GRACE_S.
+_REAP_INTERVAL_S: float = float(os.environ.get("JO_REAP_INTERVAL_S", "600"))
+_REAP_GRACE_S: float = float(os.environ.get("JO_REAP_GRACE_S", "3600"))
+
 # Some (key) default variables...
 default_cpu: str = _POD_DEFAULT_CPU
 default_memory: str = _POD_DEFAULT_MEMORY
@@ -42,35 +240,38 @@ default_project_claim_name: str = "project"
 default_user_id: int = 1001
 default_group_id: int = 1001
 
+# The templates for the Job objects.
+# The operator-wide parts of the objects are built once, here.
+_TEMPLATES: JobTemplates = JobTemplates(
+    service_account=_POD_SA,
+    node_selector_key=_POD_NODE_SELECTOR_KEY,
+    node_selector_value=_POD_NODE_SELECTOR_VALUE,
+    nf_executor_queue_size=_NF_EXECUTOR_QUEUE_SIZE,
+    default_cpu=default_cpu,
+    default_memory=default_memory,
+    default_user_id=default_user_id,
+    default_group_id=default_group_id,
+    default_project_mount=default_project_mount,
+    default_project_claim_name=default_project_claim_name,
+)
+
+# The asynchronous Kubernetes API client (and its connection pool).
+# A single, long-lived, client is created by the 'configure' startup handler
+# and shared by all the handlers. It's closed by the 'shutdown' handler.
+_API_CLIENT: Optional[kubernetes_asyncio.client.ApiClient] = None
+_CUSTOM_API: Optional[kubernetes_asyncio.client.CustomObjectsApi] = None
 
-# The Nextflow kubernetes config file.
-# A ConfigMap written into the working directory, or root.
-nextflow_config: str = """
-process {
-  pod = [ %(extra_pod_settings)s
-          [nodeSelector: '%(selector_key)s=%(selector_value)s'],
-          [label: 'data-manager.informaticsmatters.com/instance-id',
-           value: '%(name)s'] ]
-}
-executor {
-  name = 'k8s'
-  queueSize = %(executor_queue_size)s
-}
-k8s {
-  computeResourceType = 'Job'
-  serviceAccount = '%(sa)s'
-  securityContext: [runAsUser: %(user)s, runAsGroup: %(group)s, fsGroup: 0]
-  storageClaimName = '%(claim_name)s'
-  storageMountPath = '%(project_mount)s'
-  storageSubPath = '%(project_id)s'
-  workDir = '%(project_mount)s/.%(name)s/work'
-}
-"""
+# The operator's API write limiter.
+# Configured by the 'configure' startup handler.
+_API_LIMITER: ApiLimiter = ApiLimiter()
 
 
 @kopf.on.startup()
-def configure(settings: kopf.OperatorSettings, **_):
+async def configure(settings: kopf.OperatorSettings, **_: Any) -> None:
     """The operator startup handler."""
+    global _API_CLIENT  # pylint: disable=global-statement
+    global _CUSTOM_API  # pylint: disable=global-statement
+
     # Here we adjust the logging level
     settings.posting.level = logging.INFO
 
@@ -81,24 +282,366 @@ def configure(settings: kopf.OperatorSettings, **_):
     settings.watching.connect_timeout = 1 * 60
     settings.watching.server_timeout = 10 * 60
 
+    # Only record the handling of the DataManagerJobs that are ours
+    # (see sharding.py)
+    if _SHARDS.enabled or _LEADERSHIP.enabled:
+        settings.persistence.diffbase_storage = ShardDiffBaseStorage(_is_ours)
+
+    # Create the shared asynchronous API client.
+    # We're normally in-cluster but fall back to a kubernetes config file
+    # (i.e. KUBECONFIG) if we're not.
+    try:
+        kubernetes_asyncio.config.load_incluster_config()
+    except kubernetes_asyncio.config.ConfigException:
+        await kubernetes_asyncio.config.load_kube_config()
+    configuration = kubernetes_asyncio.client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = _API_CONNECTION_POOL_SIZE
+    _API_CLIENT = kubernetes_asyncio.client.ApiClient(configuration)
+    _JOB_OBJECTS.core_api = kubernetes_asyncio.client.CoreV1Api(_API_CLIENT)
+    _CUSTOM_API = kubernetes_asyncio.client.CustomObjectsApi(_API_CLIENT)
+
+    # Set the API write limits
+    _API_LIMITER.configure(
+        create_rate=_API_CREATE_RATE,
+        create_burst=_API_CREATE_BURST,
+        delete_rate=_API_DELETE_RATE,
+        delete_burst=_API_DELETE_BURST,
+        max_in_flight=_API_MAX_IN_FLIGHT,
+    )
+
+    # Serve metrics.
+    # The API limiter and pending deletion gauges are read when scraped.
+    for kind in ["create", "delete"]:
+        metrics.API_LIMITER_LEVEL.labels(kind).set_function(
+            functools.partial(_api_limiter_level, kind)
+        )
+    metrics.API_IN_FLIGHT.set_function(lambda: _API_LIMITER.in_flight)
+    metrics.API_MAX_IN_FLIGHT.set_function(lambda: _API_LIMITER.max_in_flight)
+    metrics.PENDING_DELETIONS.set_function(lambda: len(_DEFERRED_DELETER))
+    metrics.PENDING_STATUS_UPDATES.set_function(lambda: _STATUS_WRITER.pending)
+    metrics.SHARD_MEMBERS.set_function(lambda: len(_SHARDS.members))
+    metrics.LEADER.set_function(lambda: int(_LEADERSHIP.is_leader))
+    metrics.LOG_STREAMS.set_function(lambda: len(_LOG_SHIPPER))
+    for phase in cache.POD_PHASES:
+        metrics.JOB_PODS.labels(phase).set_function(
+            functools.partial(_POD_WATCH.count, phase)
+        )
+    metrics.start(_METRICS_PORT)
+
+    # The Job Pod watch is the cache
+    cache.use(_POD_WATCH)
+
+    # Join the shard members (if we're sharded),
+    # or the leader election (if we're a standby).
+    await _SHARDS.start(_API_CLIENT)
+    await _LEADERSHIP.start(_API_CLIENT)
+
+    # Watch the Job Pods (capturing their logs),
+    # resuming from the checkpoint (if there is one)
+    await _LOG_SHIPPER.start()
+    await _CHECKPOINT.start(_API_CLIENT)
+    await _POD_WATCH.start(_API_CLIENT, _CHECKPOINT.watch_versions("pods"))
+    _CHECKPOINT.track("pods", lambda: _POD_WATCH.resource_versions)
+    await _SWEEPER.start(_API_CLIENT)
+    await _REAPER.start(_API_CLIENT)
+
+    logging.info("Startup _API_CONNECTION_POOL_SIZE=%s", _API_CONNECTION_POOL_SIZE)
+    logging.info("Startup _API_CREATE_BURST=%s", _API_CREATE_BURST)
+    logging.info("Startup _API_CREATE_RATE=%s", _API_CREATE_RATE)
+    logging.info("Startup _API_DELETE_BURST=%s", _API_DELETE_BURST)
+    logging.info("Startup _API_DELETE_RATE=%s", _API_DELETE_RATE)
+    logging.info("Startup _API_MAX_IN_FLIGHT=%s", _API_MAX_IN_FLIGHT)
+    logging.info("Startup _CREATE_POD_WITH_CONFIGMAPS=%s", _CREATE_POD_WITH_CONFIGMAPS)
+    logging.info("Startup _LISTED_NAMESPACES=%s", _LISTED_NAMESPACES)
+    logging.info("Startup _NAMESPACES=%s", _NAMESPACES)
     logging.info("Startup _NF_EXECUTOR_QUEUE_SIZE=%s", _NF_EXECUTOR_QUEUE_SIZE)
+    logging.info("Startup _FILE_CONFIGMAP_MAX_BYTES=%s", _FILE_CONFIGMAP_MAX_BYTES)
+    logging.info("Startup _LEADER_LEASE_DURATION_S=%s", _LEADER_LEASE_DURATION_S)
+    logging.info("Startup _LOG_SHIPPER_CLAIM_NAME=%s", _LOG_SHIPPER_CLAIM_NAME)
+    logging.info("Startup _LOG_SHIPPER_ENABLED=%s", _LOG_SHIPPER_ENABLED)
+    logging.info("Startup _LOG_SHIPPER_MAX_STREAMS=%s", _LOG_SHIPPER_MAX_STREAMS)
+    logging.info("Startup _LOG_SHIPPER_ROOT=%s", _LOG_SHIPPER_ROOT)
+    logging.info("Startup _METRICS_PORT=%s", _METRICS_PORT)
+    logging.info("Startup _PACK_FILE_CONFIGMAPS=%s", _PACK_FILE_CONFIGMAPS)
     logging.info("Startup _POD_DEFAULT_CPU=%s", _POD_DEFAULT_CPU)
     logging.info("Startup _POD_DEFAULT_MEMORY=%s", _POD_DEFAULT_MEMORY)
     logging.info("Startup _POD_NODE_SELECTOR_KEY=%s", _POD_NODE_SELECTOR_KEY)
     logging.info("Startup _POD_NODE_SELECTOR_VALUE=%s", _POD_NODE_SELECTOR_VALUE)
     logging.info("Startup _POD_PRE_DELETE_DELAY_S=%s", _POD_PRE_DELETE_DELAY_S)
     logging.info("Startup _POD_SA=%s", _POD_SA)
+    logging.info("Startup _REAP_GRACE_S=%s", _REAP_GRACE_S)
+    logging.info("Startup _REAP_INTERVAL_S=%s", _REAP_INTERVAL_S)
+    logging.info("Startup _RETRY_BACKOFF_BASE_S=%s", _RETRY_BACKOFF_BASE_S)
+    logging.info("Startup _RETRY_BACKOFF_MAX_S=%s", _RETRY_BACKOFF_MAX_S)
+    logging.info("Startup _RETRY_MAX_ATTEMPTS=%s", _RETRY_MAX_ATTEMPTS)
+    logging.info("Startup _SHARD_BY=%s", _SHARD_BY)
+    logging.info("Startup _SHARD_ID=%s", _SHARD_ID)
+    logging.info("Startup _SHARD_LEASE_DURATION_S=%s", _SHARD_LEASE_DURATION_S)
+    logging.info("Startup _SHARD_NAMESPACE=%s", _SHARD_NAMESPACE)
+    logging.info("Startup _SHARE_CONFIGMAPS=%s", _SHARE_CONFIGMAPS)
+    logging.info("Startup _STANDBY=%s", _STANDBY)
+    logging.info("Startup _SWEEP_INTERVAL_S=%s", _SWEEP_INTERVAL_S)
+    logging.info("Startup _STATUS_PATCH_WINDOW_S=%s", _STATUS_PATCH_WINDOW_S)
+    logging.info("Startup _WATCH_CHECKPOINT=%s", _WATCH_CHECKPOINT)
+    logging.info("Startup _WATCH_CHECKPOINT_FILE=%s", _WATCH_CHECKPOINT_FILE)
+    logging.info(
+        "Startup _WATCH_CHECKPOINT_INTERVAL_S=%s", _WATCH_CHECKPOINT_INTERVAL_S
+    )
+
+
+@kopf.on.cleanup()
+async def shutdown(**_):
+    """The operator cleanup handler.
+    Here we stop sweeping (and reaping) and watching the Job Pods
+    (saving the watch checkpoint) and capturing their logs,
+    leave the shard members (or hand over the leadership),
+    write pending status updates, cancel pending deletions
+    and close the shared API client (and its connection pool).
+    """
+    global _API_CLIENT  # pylint: disable=global-statement
+    global _CUSTOM_API  # pylint: disable=global-statement
+
+    await _SWEEPER.stop()
+    await _REAPER.stop()
+    await _POD_WATCH.stop()
+    await _CHECKPOINT.stop()
+    await _LOG_SHIPPER.stop()
+    await _SHARDS.stop()
+    await _LEADERSHIP.stop()
+    await _STATUS_WRITER.flush()
+
+    # Pending deletions are cancelled - the (finished) Pods are found
+    # again when the Pod watch is next started (see pod_watch.py),
+    # or by the replica that takes them over (see '_start_claim()').
+    cancelled: int = _DEFERRED_DELETER.cancel_all()
+    if cancelled:
+        logging.warning("Cancelled %s pending Job deletions", cancelled)
+
+    if _API_CLIENT:
+        await _API_CLIENT.close()
+    _API_CLIENT = None
+    _JOB_OBJECTS.core_api = None
+    _CUSTOM_API = None
+    cache.use(None)
+
+
+def _api_limiter_level(kind: str) -> float:
+    """The level of the API limiter's bucket of the given kind
+    ('create' or 'delete').
+    """
+    return _API_LIMITER.buckets[kind].level
+
+
+async def _api_call(kind: str, api_fn: Any, *args: Any, **kwargs: Any) -> Any:
+    """Makes an API write call, of the given kind ('create' or 'delete'),
+    subject to the API limiter, recording the time spent waiting for
+    the limiter and the latency of the call itself.
+    """
+    queued: float = time.monotonic()
+
+    async def timed_call() -> Any:
+        metrics.API_WAIT_S.labels(kind).observe(time.monotonic() - queued)
+        with metrics.API_CALL_S.labels(api_fn.__name__).time():
+            return await api_fn(*args, **kwargs)
+
+    return await _API_LIMITER.call(kind, timed_call)
+
+
+def _api_failure(
+    ex: Exception, retry: int
+) -> Union[kopf.PermanentError, kopf.TemporaryError]:
+    """Classifies a failed API call, returning the kopf exception to raise.
+
+    Transient problems result in a 'kopf.TemporaryError' with a
+    jittered exponential delay (429 responses honour any 'Retry-After').
+    Everything else (i.e. validation failures), or a problem that persists
+    for _RETRY_MAX_ATTEMPTS, results in a 'kopf.PermanentError'.
+    """
+    status: Optional[int] = getattr(ex, "status", None)
+    if (
+        isinstance(ex, kubernetes_asyncio.client.exceptions.ApiException)
+        and status not in _TRANSIENT_API_STATUS
+    ):
+        return kopf.PermanentError(f"ApiException ({status})")
+    if retry + 1 >= _RETRY_MAX_ATTEMPTS:
+        return kopf.PermanentError(
+            f"{type(ex).__name__} ({status}) after {retry + 1} attempts"
+        )
+
+    backoff_s: float = min(_RETRY_BACKOFF_MAX_S, _RETRY_BACKOFF_BASE_S * 2**retry)
+    delay_s: float = backoff_s / 2 + random.uniform(0, backoff_s / 2)
+    headers: Any = getattr(ex, "headers", None)
+    if status == 429 and headers:
+        retry_after: str = headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            delay_s = max(delay_s, float(retry_after))
+    logging.warning(
+        "%s (%s) is transient, retrying in %.1f seconds (retry=%s)",
+        type(ex).__name__,
+        status,
+        delay_s,
+        retry,
+    )
+    return kopf.TemporaryError(f"{type(ex).__name__} ({status})", delay=delay_s)
+
+
+# The creator (and deleter) of the Jobs' objects
+_JOB_OBJECTS: JobObjects = JobObjects(_api_call, _SHARE_CONFIGMAPS)
+
+
+async def _patch_job_status(namespace: str, name: str, fields: Dict[str, Any]) -> None:
+    """Patches (merges) the status of a DataManagerJob.
+    The call is subject to the API write limits.
+    """
+    assert _CUSTOM_API
+    await _api_call(
+        "create",
+        merge_patch_job,
+        _CUSTOM_API.api_client,
+        namespace,
+        name,
+        {"status": fields},
+        "status",
+    )
+
+
+# The writer of the DataManagerJobs' status
+_STATUS_WRITER: job_status.StatusWriter = job_status.StatusWriter(
+    _patch_job_status, _STATUS_PATCH_WINDOW_S
+)
+
+
+async def _claim_jobs(lost: Optional[Set[str]]) -> None:
+    """Called when shard members are lost (or we're elected leader).
+    DataManagerJobs that belonged to the lost members (or, if there are none,
+    any), that are now ours, and that have not been handled, are annotated -
+    the resulting event runs our 'create' handler. Jobs that have been
+    handled need nothing more from us until their next event.
+    """
+    assert _CUSTOM_API
+    claimed: int = 0
+    async for job in list_jobs(_CUSTOM_API, _LISTED_NAMESPACES):
+        metadata: Dict[str, Any] = job["metadata"]
+        name: str = metadata["name"]
+        namespace: str = metadata["namespace"]
+        if (
+            _KOPF_LAST_HANDLED_ANNOTATION in metadata.get("annotations", {})
+            or not _is_ours(name, namespace)
+            or not _was_theirs(name, namespace, lost)
+        ):
+            continue
+        try:
+            await _api_call(
+                "create",
+                merge_patch_job,
+                _CUSTOM_API.api_client,
+                namespace,
+                name,
+                {"metadata": {"annotations": {_SHARD_ANNOTATION: _SHARD_ID}}},
+            )
+            claimed += 1
+        except kubernetes_asyncio.client.exceptions.ApiException as ex:
+            logging.warning(
+                'ApiException (%s) claiming DataManagerJob "%s"', ex.status, name
+            )
+    logging.info("Claimed %s unhandled DataManagerJobs (lost=%s)", claimed, lost)
+
+
+# Claims in progress
+_CLAIM_TASKS: Set[asyncio.Task] = set()
+
+
+def _start_claim(lost: Optional[Set[str]] = None) -> None:
+    """Starts claiming DataManagerJobs (see '_claim_jobs()') in the background,
+    and then deleting the finished Job Pods that are now ours (those of the
+    lost members). Their completion was seen (or their deletion was pending,
+    in the replica that had them) before they were ours, so they're listed again.
+    """
+
+    async def claim() -> None:
+        try:
+            await _claim_jobs(lost)
+            async for pod in _POD_WATCH.finished():
+                name: str = pod["metadata"]["name"]
+                namespace: str = pod["metadata"]["namespace"]
+                if _deletable(name, namespace) and _was_theirs(name, namespace, lost):
+                    await job_event(event={"type": "ADDED", "object": pod})
+        except _API_ERRORS as ex:
+            logging.warning("Failed to claim DataManagerJobs (%s)", ex)
+
+    task = asyncio.get_running_loop().create_task(claim())
+    _CLAIM_TASKS.add(task)
+    task.add_done_callback(_CLAIM_TASKS.discard)
+
+
+# The operator's replicas, sharing the DataManagerJobs (shards)
+# or standing by to take them all over (leadership).
+_SHARDS: Shards = Shards(
+    _SHARD_ID,
+    "" if _STANDBY else _SHARD_BY,
+    _SHARD_NAMESPACE,
+    _SHARD_LEASE_DURATION_S,
+    on_members_lost=_start_claim,
+)
+_LEADERSHIP: Leadership = Leadership(
+    _SHARD_ID,
+    _STANDBY,
+    _SHARD_NAMESPACE,
+    _LEADER_LEASE_DURATION_S,
+    on_elected=_start_claim,
+)
+
+
+def _serves(namespace: str) -> bool:
+    """True if the operator serves the namespace (see _NAMESPACES)."""
+    return not _NAMESPACES or any(
+        fnmatch.fnmatch(namespace, pattern) for pattern in _NAMESPACES
+    )
+
+
+def _is_ours(name: str, namespace: str) -> bool:
+    """True if the DataManagerJob is ours to handle."""
+    return (
+        _serves(namespace)
+        and _SHARDS.owns(name, namespace)
+        and _LEADERSHIP.owns(name, namespace)
+    )
+
+
+def _deletable(name: str, namespace: str) -> bool:
+    """True if the Job is ours, and is not being (or was recently) deleted."""
+    return _is_ours(name, namespace) and (namespace, name) not in _DEFERRED_DELETER
+
+
+def _was_theirs(name: str, namespace: str, lost: Optional[Set[str]]) -> bool:
+    """True if the Job was a lost shard member's (or, with none lost, anyone's)."""
+    return (
+        lost is None
+        or _SHARDS.owner(name, namespace, set(_SHARDS.members) | lost) in lost
+    )
+
 
+def _when_ours(**kwargs: Any) -> bool:
+    """A handler filter (kopf's 'when'), True if the DataManagerJob is ours."""
+    return _is_ours(kwargs["name"], kwargs["namespace"])
 
-@kopf.on.create("datamanagerjobs")
-def create(name, namespace, spec, **_):
+
+@kopf.on.create("datamanagerjobs", when=_when_ours)
+@metrics.instrumented("create")
+async def create(name, namespace, spec, meta, body, retry, **_):
     """Handler for CRD create events.
     Here we construct the required Kubernetes objects,
-    adopting them in kopf before using the corresponding Kubernetes API
-    to create them.
+    adopting them in kopf before applying them (server-side apply).
 
     We handle errors typically raising 'kopf.PermanentError' to prevent
-    Kubernetes constantly calling back for a given create.
+    Kubernetes constantly calling back for a given create. Transient
+    API failures raise 'kopf.TemporaryError' so the create is retried
+    (see '_api_failure()'). Objects are applied, so a retried create
+    (or one repeated after an operator restart) re-applies the objects
+    that already exist.
+
+    The handler is asynchronous, using the operator's shared API client,
+    so many creates can be in progress without occupying executor threads.
     """
 
     logging.info("Starting create (name=%s namespace=%s)...", name, namespace)
@@ -153,296 +696,158 @@ def create(name, namespace, spec, **_):
         logging.error(msg)
         raise kopf.PermanentError(msg)
 
-    # Get the image tag - to automate the pull policy setting.
-    # 'latest' and 'stable' images are always pulled,
-    # all others are 'IfNotPresent'
-    image_parts: List[str] = image.split(":")
-    image_tag: str = "latest" if len(image_parts) == 1 else image_parts[1]
-    image_pull_policy: str = (
-        "Always" if image_tag.lower() in ["latest", "stable"] else "IfNotPresent"
-    )
-
-    # The Kubernetes image command is an array.
-    # The supplied command is a string.
-    # For now split using Python shlex module - i.e. one that honours quotes.
-    # i.e. 'echo "Hello, world"' becomes ['echo', 'Hello, world']
-    command_items = shlex.split(command)
-
-    # Security options
-    sc_run_as_user = material.get("securityContext", {}).get(
-        "runAsUser", default_user_id
-    )
-    sc_run_as_group = material.get("securityContext", {}).get(
-        "runAsGroup", default_group_id
-    )
-
-    # Are resource requests/limits provided?
-    cpu_request: Any = (
-        material.get("resources", {}).get("requests", {}).get("cpu", default_cpu)
-    )
-    memory_request: Any = (
-        material.get("resources", {}).get("requests", {}).get("memory", default_memory)
-    )
-    cpu_limit: Any = (
-        material.get("resources", {}).get("limits", {}).get("cpu", default_cpu)
-    )
-    memory_limit: Any = (
-        material.get("resources", {}).get("limits", {}).get("memory", default_memory)
-    )
-
-    # The project mount
-    project_mount = material.get("projectMount", default_project_mount)
-    # The container working directory sub-path.
-    # The sub-path is optional (and only used) if there's a working directory.
-    working_sub_path = material.get("workingSubPath")
-    # The project claim name and project-id.
-    # The project ID must be provided.
-    project_claim_name = material.get("project", {}).get(
-        "claimName", default_project_claim_name
-    )
-
-    # Image pull secret?
-    pull_secret: str = material.get("pullSecret", "")
+    # The rest of the material (i.e. image tag and command,
+    # resources, security context and project mount)
+    # is applied to the Job's objects by the templates.
 
     # ConfigMaps
     # ----------
 
-    logging.info("Creating ConfigMap %s...", name)
+    assert _JOB_OBJECTS.core_api
+    configmaps: List[Dict[str, Any]] = []
 
-    core_api = kubernetes.client.CoreV1Api()
+    # A Nextflow Kubernetes configuration file?
+    # Written to the Job container as ${HOME}/nextflow.config
+    nf_config_name: Optional[str] = None
     if image_type.lower() == "nextflow":
-
-        # Do we need to provide extra Pod declaration settings?
-        # For example, is there an image-pull-secret - if so
-        # we add it to the nextflow.config to ensure all nextflow processes
-        # have access to it.
-        extra_pod_settings = ""
-        if pull_secret:
-            # If the main image has a pull-secret, put it in the config
-            # so the other process pods in the nextflow workflow can use it.
-            extra_pod_settings += f"[imagePullSecret: '{pull_secret}'],\n"
-        # A Nextflow Kubernetes configuration file
-        # Written to the Job container as ${HOME}/nextflow.config
-        configmap_vars = {
-            "executor_queue_size": _NF_EXECUTOR_QUEUE_SIZE,
-            "extra_pod_settings": extra_pod_settings,
-            "claim_name": project_claim_name,
-            "name": name,
-            "project_id": project_id,
-            "project_mount": project_mount,
-            "sa": _POD_SA,
-            "user": sc_run_as_user,
-            "group": sc_run_as_group,
-            "selector_key": _POD_NODE_SELECTOR_KEY,
-            "selector_value": _POD_NODE_SELECTOR_VALUE,
-        }
-        configmap_dmk = {
-            "apiVersion": "v1",
-            "kind": "ConfigMap",
-            "metadata": {"name": f"{name}-nf-config", "labels": {"app": name}},
-            "data": {"nextflow.config": nextflow_config % configmap_vars},
-        }
-
-        kopf.adopt(configmap_dmk)
-        try:
-            core_api.create_namespaced_config_map(namespace, configmap_dmk)
-        except kubernetes.client.exceptions.ApiException as ex:
-            # Whatever has happened treat it as a 'PermanentError',
-            # thus preventing the operator from constantly re-trying.
-            raise kopf.PermanentError(f"ApiException ({ex.status})")
-
-        logging.info("Created ConfigMap %s", name)
+        nf_config_name = f"{name}-nf-config"
+        configmaps.append(
+            {
+                "apiVersion": "v1",
+                "kind": "ConfigMap",
+                "metadata": {"name": nf_config_name, "labels": {"app": name}},
+                "data": {"nextflow.config": _TEMPLATES.nextflow_config(name, material)},
+            }
+        )
 
     # Any files to inject into the image?
     # If so they have a 'name', 'content' and 'origin'.
     # The name is expected to be a qualified path like '/usr/local/blob.txt'.
-    # We create a ConfigMap for each.
-
+    # We create a ConfigMap for each (or pack them into as few as possible).
     image_files: List[Dict[str, str]] = material.get("file", [])
-    file_number: int = 0
-    for image_file in image_files:
-
-        file_number += 1
-        file_name: str = os.path.basename(image_file["name"])
-        cm_name: str = f"{name}-file-{file_number}"
-        configmap_file = {
-            "apiVersion": "v1",
-            "kind": "ConfigMap",
-            "metadata": {
-                "name": cm_name,
-                "labels": {"app": name},
-                "annotations": {"origin": image_file["origin"]},
-            },
-            "data": {file_name: image_file["content"]},
-        }
-
-        kopf.adopt(configmap_file)
-        try:
-            core_api.create_namespaced_config_map(namespace, configmap_file)
-        except kubernetes.client.exceptions.ApiException as ex:
-            # Whatever has happened treat it as a 'PermanentError',
-            # thus preventing the operator from constantly re-trying.
-            raise kopf.PermanentError(f"ApiException ({ex.status})")
-
-        logging.info("Created ConfigMap %s", cm_name)
+    file_configmaps, file_volumes, file_mounts = file_objects(
+        name, image_files, _PACK_FILE_CONFIGMAPS, _FILE_CONFIGMAP_MAX_BYTES
+    )
+    configmaps.extend(file_configmaps)
+
+    # The names of the ConfigMaps that belong to this Job.
+    # They're recorded on the Pod (see _CONFIGMAPS_ANNOTATION).
+    owned_configmaps: List[str] = []
+    if _SHARE_CONFIGMAPS:
+        # Rename the ConfigMaps (and the volumes that refer to them)
+        renames: Dict[str, str] = {}
+        for configmap in configmaps:
+            cm_name: str = configmap["metadata"]["name"]
+            renames[cm_name] = share_configmap(configmap)
+        if nf_config_name:
+            nf_config_name = renames[nf_config_name]
+        for volume in file_volumes:
+            for source in [volume] + volume.get("projected", {}).get("sources", []):
+                if "configMap" in source:
+                    source["configMap"]["name"] = renames[source["configMap"]["name"]]
+    else:
+        owned_configmaps = [configmap["metadata"]["name"] for configmap in configmaps]
 
     # Pod
     # ---
 
-    logging.info("Creating Pod %s...", name)
-
-    # Job working directory (including any sub-path).
-    # We mount the nextflow config on this path.
-    working_path = working_directory
-    if working_sub_path:
-        working_path += f"/{working_sub_path}"
-
-    pod: Dict[str, Any] = {
-        "kind": "Pod",
-        "apiVersion": "v1",
-        "metadata": {"name": name, "labels": {}},
-        "spec": {
-            "serviceAccountName": _POD_SA,
-            "nodeSelector": {_POD_NODE_SELECTOR_KEY: _POD_NODE_SELECTOR_VALUE},
-            "restartPolicy": "Never",
-            "containers": [
-                {
-                    "name": name,
-                    "image": image,
-                    "command": command_items,
-                    "workingDir": working_path,
-                    "imagePullPolicy": image_pull_policy,
-                    "terminationMessagePolicy": "FallbackToLogsOnError",
-                    "env": [
-                        {
-                            "name": "NXF_WORK",
-                            "value": project_mount + "/." + name + "/work",
-                        }
-                    ],
-                    "resources": {
-                        "requests": {
-                            "cpu": f"{cpu_request}",
-                            "memory": f"{memory_request}",
-                        },
-                        "limits": {"cpu": f"{cpu_limit}", "memory": f"{memory_limit}"},
-                    },
-                    "volumeMounts": [
-                        {
-                            "name": "project",
-                            "mountPath": project_mount,
-                            "subPath": project_id,
-                        },
-                    ],
-                }
-            ],
-            "securityContext": {
-                "runAsUser": sc_run_as_user,
-                "runAsGroup": sc_run_as_group,
-                "fsGroup": 0,
-            },
-            "volumes": [
-                {
-                    "name": "project",
-                    "persistentVolumeClaim": {"claimName": project_claim_name},
-                },
-            ],
-        },
-    }
-
-    # Pull secret?
-    if pull_secret:
-        pod["spec"]["imagePullSecrets"] = [{"name": pull_secret}]
-
-    # Additional labels?
-    # Provided by the DM as an array of strings of the form '<KEY>=<VALUE>'
-    for label in material.get("labels", []):
-        key, value = label.split("=")
-        pod["metadata"]["labels"][key] = value
-
-    # Additional environment?
-    # Provided by the DM as an array of strings of the form '<KEY>=<VALUE>'
-    for environment in material.get("environment", []):
-        key, value = environment.split("=")
-        pod["spec"]["containers"][0]["env"].append({"name": key, "value": value})
-
     # Instructed to debug the Job?
     # Yes if the spec's debug is set.
-    # If so we add a DEBUG label to the template,
+    # If so the template adds a DEBUG label,
     # which prevents our 'on.event' handler from deleting the Job or its Pod.
     if material.get("debug"):
         logging.warning(
             "spec.debug is set. The corresponding Pod"
             " will not be automatically deleted"
         )
-        pod["metadata"]["labels"]["debug"] = "yes"
 
-    # If it's a nextflow image type
-    # add the nextflow config to the Pod.
-    if image_type.lower() == "nextflow":
-        # Extend the 'volumes' list...
-        pod["spec"]["volumes"].append(
-            {"name": "nf-config", "configMap": {"name": f"{name}-nf-config"}}
-        )
-        # ...and the corresponding container mounts...
-        pod["spec"]["containers"][0]["volumeMounts"].append(
-            {
-                "name": "nf-config",
-                "mountPath": f"{working_path}/nextflow.config",
-                "subPath": "nextflow.config",
-            }
-        )
-
-    # Files?
-    # If so add appropriate volumes and mounts
-    # using the config map we'll have created earlier.
-    file_number: int = 0
-    for image_file in image_files:
-        file_number += 1
-        file_name: str = os.path.basename(image_file["name"])
-        cm_name: str = f"{name}-file-{file_number}"
-        # Extend the 'volumes' list...
-        pod["spec"]["volumes"].append(
-            {"name": f"file-{file_number}", "configMap": {"name": cm_name}}
-        )
-        # ...and the corresponding container mounts...
-        pod["spec"]["containers"][0]["volumeMounts"].append(
-            {
-                "name": f"file-{file_number}",
-                "mountPath": image_file["name"],
-                "subPath": file_name,
-            }
-        )
-
-    # Definition's complete - adopt it and create it.
-    # Pods are part of the Core V1 API
-    kopf.adopt(pod)
-    api: kubernetes.client.CoreV1Api = kubernetes.client.CoreV1Api()
+    # If it's a nextflow image type the Pod mounts the nextflow config.
+    # Any files are mounted using the config map(s).
+    pod: Dict[str, Any] = _TEMPLATES.pod(
+        name,
+        material,
+        nf_config_name=nf_config_name,
+        volumes=file_volumes,
+        volume_mounts=file_mounts,
+    )
+    # Record the Job's ConfigMaps,
+    # so they can be deleted (with the Pod) when the Job finishes.
+    pod["metadata"]["annotations"] = {
+        _CONFIGMAPS_ANNOTATION: ",".join(owned_configmaps)
+    }
+    # Definition's complete - adopt it.
+    kopf.adopt(pod, owner=body)
+
+    # Create the objects.
+    # The ConfigMaps are independent of each other so they're created
+    # concurrently. The Pod is created when they have all been created
+    # or, if _CREATE_POD_WITH_CONFIGMAPS, at the same time.
+    logging.info("Creating %s ConfigMaps and Pod %s...", len(configmaps), name)
+    creations: List[Awaitable[None]] = [
+        _JOB_OBJECTS.create_configmap(namespace, configmap, body)
+        for configmap in configmaps
+    ]
     try:
-        api.create_namespaced_pod(body=pod, namespace=namespace)
-    except kubernetes.client.exceptions.ApiException as ex:
-        # Whatever has happened treat it as a 'PermanentError',
-        # thus preventing the operator from constantly re-trying.
-        raise kopf.PermanentError(f"ApiException ({ex.status})")
+        if _CREATE_POD_WITH_CONFIGMAPS:
+            await run_all(creations + [_JOB_OBJECTS.create_pod(namespace, pod)])
+        else:
+            await run_all(creations)
+            await _JOB_OBJECTS.create_pod(namespace, pod)
+    except _API_ERRORS as ex:
+        raise _api_failure(ex, retry) from ex
+
+    created_age_s: Optional[float] = job_status.age_s(meta.get("creationTimestamp"))
+    if created_age_s is not None:
+        metrics.CREATE_LATENCY_S.observe(created_age_s)
+
+    # Record the Job's objects in its status
+    _STATUS_WRITER.update(
+        namespace,
+        name,
+        job_status.created(
+            pod["metadata"]["name"],
+            [configmap["metadata"]["name"] for configmap in configmaps],
+        ),
+    )
 
-    logging.info("Created Pod %s", name)
 
+def _job_configmaps(pod: Dict[str, Any]) -> Optional[List[str]]:
+    """The Job's ConfigMaps, recorded on its Pod (see _CONFIGMAPS_ANNOTATION),
+    or None if they're not recorded.
+    """
+    annotation: Optional[str] = (
+        pod["metadata"].get("annotations", {}).get(_CONFIGMAPS_ANNOTATION)
+    )
+    return None if annotation is None else [cm for cm in annotation.split(",") if cm]
 
-@kopf.on.event(
-    "datamanagerjobs",
-    labels={"data-manager.informaticsmatters.com/instance-is-job": "yes"},
+
+# The operator's pending Job deletions
+_DEFERRED_DELETER: DeferredDeleter = DeferredDeleter(
+    _JOB_OBJECTS.delete_job,
+    backoff_base_s=_RETRY_BACKOFF_BASE_S,
+    backoff_max_s=_RETRY_BACKOFF_MAX_S,
+    max_attempts=_RETRY_MAX_ATTEMPTS,
 )
-def job_event(event, **_):
+
+
+@metrics.instrumented("job_event")
+async def job_event(event, **_):
     """An event handler for Pods that we created -
     i.e. those whose 'instance-is-job' is 'yes'.
+    It's called (by 'pod_event') when a Pod's phase changes.
 
     It's here we're able to detect that the Pod's run is complete.
     When it is, we delete the Pod and the Pod's Job
     (it won't be done automatically by the Operator).
+    The deletion is deferred (by _POD_PRE_DELETE_DELAY_S, or until the Pod's
+    logs have been collected) and handed to the DeferredDeleter,
+    so the handler returns immediately.
     """
     event_type: str = event["type"]
     logging.info("Handling event_type=%s", event_type)
 
-    if event_type == "MODIFIED":
+    # Pods are 'ADDED' if they're found when the Pods are listed
+    if event_type in ["ADDED", "MODIFIED"]:
         pod: Dict[str, Any] = event["object"]
         pod_phase: str = pod["status"]["phase"]
 
@@ -465,44 +870,131 @@ def job_event(event, **_):
                 return
 
             # Ok to delete if we get here...
-            logging.info('Job "%s" has finished.', pod_name)
-            if _POD_PRE_DELETE_DELAY_S > 0:
+            pod_namespace: str = pod["metadata"]["namespace"]
+            drained: bool = _LOGS_DRAINED_ANNOTATION in pod["metadata"].get(
+                "annotations", {}
+            ) or _LOG_SHIPPER.shipped(pod_namespace, pod_name)
+            if _DEFERRED_DELETER.schedule(
+                pod_namespace,
+                pod_name,
+                _job_configmaps(pod),
+                _POD_PRE_DELETE_DELAY_S,
+                drained,
+            ):
                 logging.info(
-                    'Deleting "%s"' " after a delay of %s" " seconds...",
+                    'Job "%s" has finished. Deleting "%s"'
+                    " after a delay of %s seconds (logs_drained=%s)...",
                     pod_name,
-                    _POD_PRE_DELETE_DELAY_S,
+                    pod_name,
+                    0 if drained else _POD_PRE_DELETE_DELAY_S,
+                    drained,
                 )
-                time.sleep(_POD_PRE_DELETE_DELAY_S)
+            else:
+                logging.info('Job "%s" deletion is already scheduled', pod_name)
+
+
+async def pod_event(
+    event_type: str, pod: Dict[str, Any], previous_phase: Optional[str]
+) -> None:
+    """The handler of the Job Pod watch (see pod_watch.py).
+
+    The state of each Pod (its phase, timings and node) is reflected
+    in the status of its DataManagerJob (which has the same name).
+    Only changes are written, and the writes are coalesced
+    (see _STATUS_PATCH_WINDOW_S). Phase transitions are handed to
+    'job_event', to detect that the Pod has finished. A finished Pod
+    whose logs have since been collected is deleted immediately.
+    The Pod's log is captured (if _LOG_SHIPPER_ENABLED).
+    """
+    name: str = pod["metadata"]["name"]
+    namespace: str = pod["metadata"]["namespace"]
+    if not _is_ours(name, namespace):
+        return
+    _LOG_SHIPPER.observe(event_type, pod)
+    if event_type == "DELETED":
+        _STATUS_WRITER.update(namespace, name, job_status.deleted())
+        return
+    _STATUS_WRITER.update(namespace, name, job_status.from_pod(pod))
+    if pod.get("status", {}).get("phase") != previous_phase:
+        await job_event(event={"type": event_type, "object": pod})
+    elif _LOGS_DRAINED_ANNOTATION in pod["metadata"].get("annotations", {}):
+        _expedite_deletion(namespace, name)
+
+
+def _expedite_deletion(namespace: str, name: str) -> None:
+    """Deletes a finished Job now, if its deletion is waiting
+    (for _POD_PRE_DELETE_DELAY_S). The Job's logs have been collected.
+    """
+    if _DEFERRED_DELETER.expedite(namespace, name):
+        logging.info('Job "%s" logs have been collected. Deleting "%s"', name, name)
+
+
+# The capture of the Job Pod logs.
+# A Job is deleted once its log has been captured.
+_LOG_SHIPPER: LogShipper = LogShipper(
+    _LOG_SHIPPER_ENABLED,
+    _LOG_SHIPPER_ROOT,
+    _LOG_SHIPPER_CLAIM_NAME,
+    _SHARD_NAMESPACE,
+    _LOG_SHIPPER_MAX_STREAMS,
+    _expedite_deletion,
+)
 
-            # Delete the Pod
-            pod_namespace: str = pod["metadata"]["namespace"]
-            logging.info('Deleting Pod "%s" (namespace=%s)...', pod_name, pod_namespace)
 
-            core_api: kubernetes.client.CoreV1Api = kubernetes.client.CoreV1Api()
-            try:
-                core_api.delete_namespaced_pod(pod_name, pod_namespace)
-            except kubernetes.client.exceptions.ApiException as ex:
-                logging.warning(
-                    'ApiException (%s) deleting Pod "%s" (%s)',
-                    ex.status,
-                    pod_name,
-                    ex.body,
-                )
+@kopf.on.event(
+    "datamanagerjobs",
+    annotations={_LOGS_DRAINED_ANNOTATION: kopf.PRESENT},
+    when=_when_ours,
+)
+async def logs_drained(name, namespace, **_):
+    """An event handler for DataManagerJobs the log-watcher has marked
+    (see _LOGS_DRAINED_ANNOTATION). The DataManagerJob and its Pod
+    have the same name.
+
+    If the mark is added before the Pod's deletion has been scheduled
+    it's seen again when the Job's status (its finished phase) is written.
+    """
+    _expedite_deletion(namespace, name)
 
-            # Delete the ConfigMap
-            # This will fail for non-nextflow Pods
-            # We need a better way to identify the resources we created
-            cm_name = f"{pod_name}-nf-config"
-            logging.info('Deleting ConfigMap "%s"...', cm_name)
-            core_api: kubernetes.client.CoreV1Api = kubernetes.client.CoreV1Api()
-            try:
-                core_api.delete_namespaced_config_map(cm_name, pod_namespace)
-            except kubernetes.client.exceptions.ApiException as ex:
-                logging.warning(
-                    'ApiException (%s) deleting ConfigMap "%s" (%s)',
-                    ex.status,
-                    cm_name,
-                    ex.body,
-                )
 
-            logging.info('Deleted "%s"', pod_name)
+# The checkpoint of the Job Pod watch
+_CHECKPOINT: Checkpoint = Checkpoint(
+    _WATCH_CHECKPOINT,
+    "job-operator-watch-checkpoint",
+    _SHARD_NAMESPACE,
+    _WATCH_CHECKPOINT_FILE,
+    _WATCH_CHECKPOINT_INTERVAL_S,
+)
+
+# The sweeper of missed (finished) Job Pods.
+# Pods being deleted (or recently deleted) are left alone.
+_SWEEPER: Sweeper = Sweeper(
+    f"{cache.INSTANCE_ID_LABEL},{cache.INSTANCE_IS_JOB_LABEL}=yes",
+    _deletable,
+    lambda pod: _JOB_OBJECTS.delete_job(
+        pod["metadata"]["name"], pod["metadata"]["namespace"], _job_configmaps(pod)
+    ),
+    min_age_s=_POD_PRE_DELETE_DELAY_S,
+    interval_s=_SWEEP_INTERVAL_S,
+    namespaces=_LISTED_NAMESPACES,
+)
+
+# The reaper of orphaned Job ConfigMaps
+_REAPER: ConfigMapReaper = ConfigMapReaper(
+    f"{cache.INSTANCE_ID_LABEL},{cache.INSTANCE_IS_JOB_LABEL}=yes",
+    _deletable,
+    _JOB_OBJECTS.delete_configmaps,
+    grace_s=_REAP_GRACE_S,
+    interval_s=_REAP_INTERVAL_S,
+    namespaces=_LISTED_NAMESPACES,
+)
+
+# The watch of the Job Pods.
+# Each watch request lasts as long as the framework's (10 minutes),
+# the client waits a little longer for it.
+_POD_WATCH: PodWatch = PodWatch(
+    f"{cache.INSTANCE_ID_LABEL},{cache.INSTANCE_IS_JOB_LABEL}=yes",
+    pod_event,
+    namespaces=_LISTED_NAMESPACES,
+    timeout_s=10 * 60,
+)
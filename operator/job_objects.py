@@ -0,0 +1,310 @@
+"""The creation (and deletion) of the Kubernetes objects of Jobs,
+their ConfigMaps and Pod.
+
+Job objects are applied (server-side, as the operator's field manager),
+so a creation can be repeated. Shared ConfigMaps are created (or patched)
+instead, applying them would replace their other owners.
+DataManagerJobs (which the operator only patches) are merge-patched.
+
+Every API call is made using the operator's API call function,
+which applies the operator's API write limits.
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+)
+
+import kopf
+import kubernetes_asyncio
+
+import cache
+
+# The field manager of the objects we apply (server-side)
+# and the API paths of the objects.
+_FIELD_MANAGER: str = "data-manager-job-operator"
+_APPLY_PATHS: Dict[str, str] = {
+    "ConfigMap": "/api/v1/namespaces/{namespace}/configmaps/{name}",
+    "Pod": "/api/v1/namespaces/{namespace}/pods/{name}",
+}
+# The number of times we try to create (or patch) a shared ConfigMap
+# that keeps being deleted (see '_create_shared_configmap()')
+_SHARED_CONFIGMAP_ATTEMPTS: int = 3
+
+
+def share_configmap(configmap: Dict[str, Any]) -> str:
+    """Turns a Job ConfigMap into a shared one, renaming it using
+    a hash of its data and replacing its labels. The new name is returned.
+    """
+    digest: str = hashlib.sha256(
+        json.dumps(configmap["data"], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    configmap["metadata"]["name"] = f"dmj-{digest[:40]}"
+    configmap["metadata"]["labels"] = {cache.SHARED_CONFIGMAP_LABEL: "yes"}
+    return configmap["metadata"]["name"]
+
+
+async def merge_patch_job(
+    api_client: kubernetes_asyncio.client.ApiClient,
+    namespace: str,
+    name: str,
+    body: Dict[str, Any],
+    subresource: str = "",
+) -> Any:
+    """Patches a DataManagerJob (or one of its subresources, i.e. 'status')
+    using a JSON merge patch. The client (19.x) sends a patch whose body is
+    an object as a strategic merge patch, which custom objects do not support
+    (the API server responds with a 415), so we make the request.
+    """
+    path: str = "/apis/squonk.it/v3/namespaces/{namespace}/datamanagerjobs/{name}"
+    return await api_client.call_api(
+        f"{path}/{subresource}" if subresource else path,
+        "PATCH",
+        path_params={"namespace": namespace, "name": name},
+        header_params={
+            "Accept": "application/json",
+            "Content-Type": "application/merge-patch+json",
+        },
+        # The client serialises (JSON) content
+        body=body,
+        response_type="object",
+        auth_settings=["BearerToken"],
+        _return_http_data_only=True,
+    )
+
+
+async def list_jobs(
+    custom_api: kubernetes_asyncio.client.CustomObjectsApi, namespaces: Sequence[str]
+) -> AsyncIterator[Dict[str, Any]]:
+    """The DataManagerJobs in the namespaces (all namespaces if there are
+    none), listed in pages. The API server selects one namespace
+    (or all of them) per request.
+    """
+    for namespace in namespaces or [""]:
+        list_fn: Callable[..., Awaitable[Dict[str, Any]]] = (
+            functools.partial(
+                custom_api.list_namespaced_custom_object, "squonk.it", "v3", namespace
+            )
+            if namespace
+            else functools.partial(
+                custom_api.list_cluster_custom_object, "squonk.it", "v3"
+            )
+        )
+        continue_token: Optional[str] = None
+        while True:
+            jobs: Dict[str, Any] = await list_fn(
+                "datamanagerjobs", limit=500, _continue=continue_token
+            )
+            for job in jobs["items"]:
+                yield job
+            continue_token = jobs["metadata"].get("continue")
+            if not continue_token:
+                break
+
+
+async def run_all(calls: List[Awaitable[None]]) -> None:
+    """Runs the calls (creations or deletions) concurrently, waiting for
+    all of them to finish. The first failure (if there is one) is then raised.
+    """
+    results: List[Any] = await asyncio.gather(*calls, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+class JobObjects:
+    """Creates and deletes Job objects.
+
+    'api_call' is called with the kind of call ('create' or 'delete'),
+    the API method and its arguments. 'share_configmaps' is set if
+    ConfigMaps are shared between Jobs. The CoreV1 API ('core_api')
+    is set when the operator starts.
+    """
+
+    def __init__(self, api_call: Callable[..., Awaitable[Any]], share_configmaps: bool):
+        self.share_configmaps: bool = share_configmaps
+        self.core_api: Optional[kubernetes_asyncio.client.CoreV1Api] = None
+        self._api_call = api_call
+
+    async def _server_side_apply(self, namespace: str, body: Dict[str, Any]) -> Any:
+        """Applies an object (a ConfigMap or Pod) using server-side apply,
+        as _FIELD_MANAGER, forcing the ownership of any conflicting fields.
+        The object is created if it doesn't exist.
+        """
+        assert self.core_api
+        # The client (19.x) cannot send apply patches, so we make the request.
+        # The body is JSON (a subset of YAML).
+        return await self.core_api.api_client.call_api(
+            _APPLY_PATHS[body["kind"]],
+            "PATCH",
+            path_params={"namespace": namespace, "name": body["metadata"]["name"]},
+            query_params=[("fieldManager", _FIELD_MANAGER), ("force", "true")],
+            header_params={
+                "Accept": "application/json",
+                "Content-Type": "application/apply-patch+yaml",
+            },
+            body=json.dumps(body).encode("utf-8"),
+            response_type="object",
+            auth_settings=["BearerToken"],
+            _return_http_data_only=True,
+        )
+
+    async def apply(
+        self, namespace: str, body: Dict[str, Any], exists: bool = False
+    ) -> None:
+        """Applies (creates) an object, unless we know (from the cache)
+        it exists. Applying an object that exists (i.e. one created by an
+        earlier attempt) changes nothing, so this can be repeated.
+        """
+        if exists:
+            logging.info("%s %s exists", body["kind"], body["metadata"]["name"])
+            return
+        await self._api_call("create", self._server_side_apply, namespace, body)
+
+    async def _create_shared_configmap(
+        self, namespace: str, configmap: Dict[str, Any], owner: kopf.Body
+    ) -> None:
+        """Creates a shared ConfigMap, owned by the given DataManagerJob.
+        If the ConfigMap already exists the Job is added to its owners
+        (if it's deleted before that's done, it's created again).
+        """
+        assert self.core_api
+
+        # Shared objects cannot have a controller,
+        # and must not block the deletion of any one of their owners.
+        kopf.append_owner_reference(
+            configmap, owner=owner, controller=False, block_owner_deletion=False
+        )
+        cm_name: str = configmap["metadata"]["name"]
+        owner_patch: Dict[str, Any] = {
+            "metadata": {"ownerReferences": configmap["metadata"]["ownerReferences"]}
+        }
+
+        # The existing ConfigMap may be deleted (by the garbage collector,
+        # once its last owner has gone) before we patch it, in which case
+        # it's created again.
+        for _ in range(_SHARED_CONFIGMAP_ATTEMPTS):
+            try:
+                await self._api_call(
+                    "create",
+                    self.core_api.create_namespaced_config_map,
+                    namespace,
+                    configmap,
+                )
+                return
+            except kubernetes_asyncio.client.exceptions.ApiException as ex:
+                if ex.status != 409:
+                    raise
+
+            # It exists - add our owner reference.
+            # Owner references are merged (by 'uid') in a strategic merge patch.
+            logging.info("Sharing existing ConfigMap %s", cm_name)
+            try:
+                await self._api_call(
+                    "create",
+                    self.core_api.patch_namespaced_config_map,
+                    cm_name,
+                    namespace,
+                    owner_patch,
+                )
+                return
+            except kubernetes_asyncio.client.exceptions.ApiException as ex:
+                if ex.status != 404:
+                    raise
+            logging.info("Shared ConfigMap %s has gone, creating it again", cm_name)
+        raise kopf.TemporaryError(f"Shared ConfigMap {cm_name} is being deleted")
+
+    async def create_configmap(
+        self, namespace: str, configmap: Dict[str, Any], owner: kopf.Body
+    ) -> None:
+        """Creates a Job (or shared) ConfigMap, owned by the given DataManagerJob.
+        Job ConfigMaps are applied. Shared ConfigMaps are created (or patched).
+        """
+        cm_name: str = configmap["metadata"]["name"]
+        if self.share_configmaps:
+            await self._create_shared_configmap(namespace, configmap, owner)
+        else:
+            kopf.adopt(configmap, owner=owner)
+            await self.apply(namespace, configmap)
+        logging.info("Created ConfigMap %s", cm_name)
+
+    async def create_pod(self, namespace: str, pod: Dict[str, Any]) -> None:
+        """Creates a (adopted) Job Pod."""
+        name: str = pod["metadata"]["name"]
+        await self.apply(namespace, pod, cache.pod_exists(namespace, name))
+        logging.info("Created Pod %s", name)
+
+    async def delete(self, kind: str, name: str, namespace: str) -> None:
+        """Deletes an object (a 'ConfigMap' or 'Pod').
+        An object that has already gone is ignored, other failures are raised.
+        """
+        assert self.core_api
+        delete_fn: Any = (
+            self.core_api.delete_namespaced_config_map
+            if kind == "ConfigMap"
+            else self.core_api.delete_namespaced_pod
+        )
+        logging.info('Deleting %s "%s"...', kind, name)
+        try:
+            await self._api_call("delete", delete_fn, name, namespace)
+        except kubernetes_asyncio.client.exceptions.ApiException as ex:
+            if ex.status != 404:
+                raise
+            logging.info('%s "%s" has gone', kind, name)
+
+    async def delete_job(
+        self, pod_name: str, pod_namespace: str, configmaps: Optional[List[str]]
+    ) -> None:
+        """Deletes the (finished) Job Pod and its ConfigMaps (concurrently).
+
+        The Job's ConfigMaps (those recorded on the Pod when it was created)
+        are deleted as a collection, selected by their 'app' label, so a Job
+        is deleted in (at most) two calls, however many ConfigMaps it has.
+        Shared ConfigMaps (which have no 'app' label) are left to Kubernetes,
+        which removes them when all their DataManagerJobs have gone.
+
+        Both deletions are attempted, the first failure (if there is one)
+        is then raised, so the whole deletion can be repeated.
+        """
+        # Nothing is skipped because it's not in the cache (it may be behind).
+        # A Pod created before its ConfigMaps were recorded
+        # may have some (unless they're shared).
+        deletions: List[Any] = [self.delete("Pod", pod_name, pod_namespace)]
+        if configmaps or (configmaps is None and not self.share_configmaps):
+            deletions.append(self.delete_configmaps(pod_namespace, [pod_name]))
+
+        logging.info(
+            'Deleting "%s" (namespace=%s configmaps=%s)...',
+            pod_name,
+            pod_namespace,
+            configmaps,
+        )
+        await run_all(deletions)
+
+        logging.info('Deleted "%s"', pod_name)
+
+    async def delete_configmaps(self, namespace: str, names: List[str]) -> None:
+        """Deletes the ConfigMaps of the named Jobs (those whose 'app' label
+        is one of the names) in one (collection) call.
+        """
+        assert self.core_api
+        label_selector: str = (
+            f"app={names[0]}" if len(names) == 1 else f"app in ({','.join(names)})"
+        )
+        logging.info("Deleting ConfigMaps (%s)...", label_selector)
+        await self._api_call(
+            "delete",
+            self.core_api.delete_collection_namespaced_config_map,
+            namespace,
+            label_selector=label_selector,
+        )
@@ -0,0 +1,238 @@
+"""The status of DataManagerJobs.
+
+The operator maintains each DataManagerJob's status (subresource)
+so that clients can watch the Job rather than its Pod. The status records
+the Job's phase, when its Pod was scheduled, started and finished,
+the node it ran on and the names of the Job's objects.
+
+The phase is that of the Pod ('Pending', 'Running', 'Succeeded' or 'Failed')
+until the Pod is deleted, when it becomes 'Deleted'.
+"""
+import asyncio
+import datetime
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import aiohttp
+import kubernetes_asyncio
+
+import metrics
+
+# Errors we expect (and survive) when writing the status,
+# and the API response codes we consider transient (and retry)
+_API_ERRORS = (
+    kubernetes_asyncio.client.exceptions.ApiException,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+)
+_TRANSIENT_API_STATUS: Set[int] = {408, 429, 500, 502, 503, 504}
+
+# The DataManagerJob phases
+PHASES: List[str] = ["Pending", "Running", "Succeeded", "Failed", "Deleted"]
+
+
+def age_s(timestamp: Optional[str]) -> Optional[float]:
+    """Returns the age (seconds) of a Kubernetes timestamp
+    (i.e. '2022-04-01T12:00:00Z'), or None if there isn't one.
+    """
+    if not timestamp:
+        return None
+    then = datetime.datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
+    return (
+        datetime.datetime.now(datetime.timezone.utc)
+        - then.replace(tzinfo=datetime.timezone.utc)
+    ).total_seconds()
+
+
+def created(pod_name: str, configmaps: List[str]) -> Dict[str, Any]:
+    """The status of a Job whose objects have just been created.
+    The phase is left to the Pod (which may already be running).
+    """
+    return {"pod": pod_name, "configMaps": configmaps}
+
+
+def deleted() -> Dict[str, Any]:
+    """The status of a Job whose Pod has been deleted."""
+    return {"phase": "Deleted"}
+
+
+def from_pod(pod: Dict[str, Any]) -> Dict[str, Any]:
+    """The status of a Job, from its Pod.
+    Only the fields the Pod has (so far) are returned.
+    """
+    pod_status: Dict[str, Any] = pod.get("status") or {}
+    status: Dict[str, Any] = {}
+    phase: Optional[str] = pod_status.get("phase")
+    if phase in PHASES:
+        status["phase"] = phase
+    node_name: Optional[str] = (pod.get("spec") or {}).get("nodeName")
+    if node_name:
+        status["nodeName"] = node_name
+
+    for condition in pod_status.get("conditions") or []:
+        if (
+            condition.get("type") == "PodScheduled"
+            and condition.get("status") == "True"
+        ):
+            status["scheduledTime"] = condition.get("lastTransitionTime")
+
+    # The Pod has started when its first container started,
+    # and finished when its last container finished.
+    started: List[str] = []
+    finished: List[str] = []
+    for container in pod_status.get("containerStatuses") or []:
+        state: Dict[str, Any] = container.get("state") or {}
+        running: Dict[str, Any] = state.get("running") or {}
+        terminated: Dict[str, Any] = state.get("terminated") or {}
+        if running.get("startedAt") or terminated.get("startedAt"):
+            started.append(running.get("startedAt") or terminated["startedAt"])
+        if terminated.get("finishedAt"):
+            finished.append(terminated["finishedAt"])
+    if started:
+        status["startedTime"] = min(started)
+    if finished and phase in ["Succeeded", "Failed"]:
+        status["finishedTime"] = max(finished)
+    return status
+
+
+class StatusWriter:
+    """Writes the status of DataManagerJobs, coalescing updates.
+
+    Updates are not written immediately. The first update to a Job's status
+    starts a window (of 'window_s' seconds) and every update made to the Job
+    during the window is merged, with later values replacing earlier ones.
+    At the end of the window the merged update is written as one (merge)
+    patch, made using 'patch_fn' (called with a Job's namespace, name and
+    the status fields to patch). A Pod that changes many times in quick
+    succession therefore results in one write, not one for every change.
+
+    The writer remembers what it has written for each Job, so only
+    the fields that have changed are patched, and an update that
+    changes nothing is not written at all. A Job is forgotten once
+    its 'Deleted' phase has been written.
+
+    The status is informational - failures are logged, not raised.
+    Transient failures are retried (in the next window), an update that's
+    rejected (i.e. a 4xx response) is dropped (logged as a warning).
+    """
+
+    def __init__(
+        self,
+        patch_fn: Callable[[str, str, Dict[str, Any]], Awaitable[None]],
+        window_s: float = 0.0,
+    ):
+        self._patch_fn = patch_fn
+        self.window_s: float = window_s
+        # The status written for each Job, keyed by namespace and name
+        self._written: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # The changes waiting to be written (for each Job),
+        # and the tasks that write them (at the end of each Job's window)
+        self._pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._written)
+
+    @property
+    def pending(self) -> int:
+        """The number of Jobs with changes waiting to be written."""
+        return len(self._pending)
+
+    def update(self, namespace: str, name: str, status: Dict[str, Any]) -> None:
+        """Merges the fields of the Job's status that have changed
+        into its pending update, which is written (without blocking the
+        caller) at the end of the Job's window.
+        """
+        key: Tuple[str, str] = (namespace, name)
+        written: Dict[str, Any] = self._written.get(key, {})
+        merged: Dict[str, Any] = {**self._pending.get(key, {}), **status}
+        changes: Dict[str, Any] = {
+            field: value
+            for field, value in merged.items()
+            if field not in written or written[field] != value
+        }
+        if not changes:
+            # Nothing to write (the Job may have changed and then changed back)
+            self._pending.pop(key, None)
+            metrics.STATUS_UPDATES.labels("unchanged").inc()
+            return
+        metrics.STATUS_UPDATES.labels(
+            "coalesced" if key in self._pending else "queued"
+        ).inc()
+        self._pending[key] = changes
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.get_running_loop().create_task(
+                self._write_later(key)
+            )
+
+    async def flush(self) -> None:
+        """Writes all the pending changes now
+        (i.e. when the operator is stopping).
+        """
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        await asyncio.gather(*[self._write(key) for key in list(self._pending)])
+        # Failures are not retried
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        self._pending.clear()
+
+    async def _write_later(self, key: Tuple[str, str]) -> None:
+        await asyncio.sleep(self.window_s)
+        del self._tasks[key]
+        await self._write(key)
+
+    async def _write(self, key: Tuple[str, str]) -> None:
+        """Writes a Job's pending changes."""
+        changes: Optional[Dict[str, Any]] = self._pending.pop(key, None)
+        if not changes:
+            return
+        namespace, name = key
+        try:
+            await self._patch_fn(namespace, name, changes)
+        except _API_ERRORS as ex:
+            status_code: Optional[int] = getattr(ex, "status", None)
+            if status_code == 404:
+                # The Job has gone
+                logging.info('DataManagerJob "%s" has gone', name)
+                metrics.STATUS_UPDATES.labels("dropped").inc()
+                self.forget(namespace, name)
+                return
+            if (
+                isinstance(ex, kubernetes_asyncio.client.exceptions.ApiException)
+                and status_code not in _TRANSIENT_API_STATUS
+            ):
+                # The update is rejected (i.e. 415, 422), it would be again
+                logging.warning(
+                    'Dropped the status update of DataManagerJob "%s" (%s %s)',
+                    name,
+                    status_code,
+                    ex.reason,
+                )
+                metrics.STATUS_UPDATES.labels("dropped").inc()
+                return
+            logging.warning(
+                'Failed to update the status of DataManagerJob "%s" (%s), retrying',
+                name,
+                ex,
+            )
+            metrics.STATUS_UPDATES.labels("retried").inc()
+            # Try again (with any changes made since) in the next window
+            self.update(namespace, name, {**changes, **self._pending.get(key, {})})
+            return
+        metrics.STATUS_UPDATES.labels("written").inc()
+        if changes.get("phase") == "Deleted":
+            self.forget(namespace, name)
+        else:
+            self._written[key] = {**self._written.get(key, {}), **changes}
+
+    def forget(self, namespace: str, name: str) -> None:
+        """Forgets a Job, dropping any changes waiting to be written."""
+        key: Tuple[str, str] = (namespace, name)
+        self._written.pop(key, None)
+        self._pending.pop(key, None)
+        task: Optional[asyncio.Task] = self._tasks.pop(key, None)
+        if task:
+            task.cancel()
@@ -0,0 +1,248 @@
+"""Leader election (active/standby) between operator replicas.
+
+The replicas compete for a single Lease (in the operator's namespace).
+The holder is the leader, and handles every DataManagerJob. The other
+replicas are (warm) standbys - they run kopf, watching the Jobs, with
+their handlers disabled.
+
+The leader renews the Lease, stepping down if it's unable to do so before
+the renew deadline (two-thirds of the lease duration). Standbys watch the
+Lease. A leader that stops releases it (clearing its holder), so a standby
+takes over as soon as it sees the change. If the leader simply disappears
+a standby takes over once the Lease has expired. A Lease is considered
+expired if its renew time has not changed for its duration, as observed by
+the standby, so clocks do not need to agree. Updates are conditional
+(on the Lease's resource version), so only one replica can win.
+"""
+import asyncio
+import datetime
+import logging
+from typing import Any, Callable, Optional, Tuple
+
+import aiohttp
+import kubernetes_asyncio
+
+# Errors we expect (and survive) when using the Lease
+_API_ERRORS = (
+    kubernetes_asyncio.client.exceptions.ApiException,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+)
+
+
+def _now() -> str:
+    """The current time, as a Lease (MicroTime) timestamp."""
+    return datetime.datetime.now(datetime.timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%S.%fZ"
+    )
+
+
+class Leadership:
+    """Maintains this replica's leadership (or standby) state.
+
+    An instance that is not 'enabled' is always the leader.
+    'on_elected' is called when this replica becomes the leader.
+    It must not block (Lease renewal waits for it).
+    """
+
+    def __init__(
+        self,
+        identity: str,
+        enabled: bool,
+        namespace: str,
+        lease_duration_s: int,
+        on_elected: Optional[Callable[[], None]] = None,
+    ):
+        self.identity: str = identity
+        self.enabled: bool = enabled
+        self.namespace: str = namespace
+        self.lease_duration_s: int = max(lease_duration_s, 3)
+        self.is_leader: bool = not enabled
+        self.leader: Optional[str] = None if enabled else identity
+        self._lease_name: str = "job-operator-leader"
+        self._renew_deadline_s: float = self.lease_duration_s * 2 / 3
+        self._on_elected = on_elected
+        self._api: Optional[kubernetes_asyncio.client.CoordinationV1Api] = None
+        self._task: Optional[asyncio.Task] = None
+        # When (event loop time) we last renewed the Lease
+        self._renewed: float = 0.0
+        # The last holder and renew time seen on the Lease,
+        # and when (event loop time) we saw it change.
+        self._observed: Tuple[Any, Any, float] = (None, None, 0.0)
+
+    def owns(self, name: str, namespace: str) -> bool:
+        """True if this replica handles the given Job
+        (i.e. it's the leader).
+        """
+        del name, namespace
+        return self.is_leader
+
+    async def start(self, api_client: kubernetes_asyncio.client.ApiClient) -> None:
+        """Tries to become the leader, and then starts
+        maintaining (or waiting for) the leadership in a background task.
+        """
+        if not self.enabled:
+            return
+        self._api = kubernetes_asyncio.client.CoordinationV1Api(api_client)
+        try:
+            await self._try_acquire()
+        except _API_ERRORS as ex:
+            logging.warning("Failed to acquire the leader Lease (%s)", ex)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logging.info(
+            "Started %s (leader=%s)",
+            "leader" if self.is_leader else "standby",
+            self.leader,
+        )
+
+    async def stop(self) -> None:
+        """Stops maintaining the leadership.
+        If we're the leader the Lease is released,
+        so a standby takes over without waiting for it to expire.
+        """
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._api and self.is_leader:
+            self.is_leader = False
+            try:
+                lease = await self._api.read_namespaced_lease(
+                    self._lease_name, self.namespace
+                )
+                if lease.spec.holder_identity == self.identity:
+                    lease.spec.holder_identity = None
+                    lease.spec.lease_duration_seconds = 1
+                    await self._api.replace_namespaced_lease(
+                        self._lease_name, self.namespace, lease
+                    )
+                    logging.info("Released the leader Lease")
+            except _API_ERRORS as ex:
+                logging.warning("Failed to release the leader Lease (%s)", ex)
+        self._api = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        interval_s: float = self.lease_duration_s / 3
+        while True:
+            if self.is_leader:
+                await asyncio.sleep(interval_s)
+            else:
+                await self._wait_for_release(interval_s)
+            try:
+                await self._try_acquire()
+            except _API_ERRORS as ex:
+                logging.warning("Failed to acquire the leader Lease (%s)", ex)
+            if self.is_leader and loop.time() - self._renewed > self._renew_deadline_s:
+                # We may have lost the Lease to another replica.
+                logging.warning("Failed to renew the leader Lease, standing by")
+                self.is_leader = False
+
+    async def _wait_for_release(self, timeout_s: float) -> None:
+        """Watches the Lease (for up to the given time),
+        returning early if it's released or deleted.
+        """
+        assert self._api
+        watch = kubernetes_asyncio.watch.Watch()
+        try:
+            async with watch.stream(
+                self._api.list_namespaced_lease,
+                self.namespace,
+                field_selector=f"metadata.name={self._lease_name}",
+                timeout_seconds=max(int(timeout_s), 1),
+            ) as stream:
+                async for event in stream:
+                    if (
+                        event["type"] == "DELETED"
+                        or not event["object"].spec.holder_identity
+                    ):
+                        return
+        except _API_ERRORS as ex:
+            logging.warning("Failed to watch the leader Lease (%s)", ex)
+            await asyncio.sleep(timeout_s)
+
+    async def _try_acquire(self) -> None:
+        """Renews the Lease if we hold it, or takes it if it's been released
+        (or has expired). The Lease is created if there isn't one.
+        """
+        assert self._api
+        loop = asyncio.get_running_loop()
+        try:
+            lease = await self._api.read_namespaced_lease(
+                self._lease_name, self.namespace
+            )
+        except kubernetes_asyncio.client.exceptions.ApiException as ex:
+            if ex.status != 404:
+                raise
+            lease = None
+
+        if lease is None:
+            renew_time: str = _now()
+            try:
+                await self._api.create_namespaced_lease(
+                    self.namespace,
+                    {
+                        "apiVersion": "coordination.k8s.io/v1",
+                        "kind": "Lease",
+                        "metadata": {"name": self._lease_name},
+                        "spec": {
+                            "holderIdentity": self.identity,
+                            "leaseDurationSeconds": self.lease_duration_s,
+                            "acquireTime": renew_time,
+                            "renewTime": renew_time,
+                            "leaseTransitions": 0,
+                        },
+                    },
+                )
+            except kubernetes_asyncio.client.exceptions.ApiException as ex:
+                if ex.status != 409:
+                    raise
+                # Another replica created it
+                return
+            self._elected(loop.time())
+            return
+
+        holder: Optional[str] = lease.spec.holder_identity
+        now: float = loop.time()
+        if (holder, lease.spec.renew_time) != self._observed[:2]:
+            self._observed = (holder, lease.spec.renew_time, now)
+        if holder and holder != self.identity:
+            self.leader = holder
+            self.is_leader = False
+            duration_s: int = lease.spec.lease_duration_seconds or self.lease_duration_s
+            if now - self._observed[2] < duration_s:
+                # Someone else holds it
+                return
+            logging.warning("The leader Lease (held by %s) has expired", holder)
+
+        # It's ours, or it's free - take (or renew) it.
+        # The replace is conditional on the Lease's resource version.
+        if holder != self.identity:
+            lease.spec.acquire_time = _now()
+            lease.spec.lease_transitions = (lease.spec.lease_transitions or 0) + 1
+        lease.spec.holder_identity = self.identity
+        lease.spec.lease_duration_seconds = self.lease_duration_s
+        lease.spec.renew_time = _now()
+        try:
+            await self._api.replace_namespaced_lease(
+                self._lease_name, self.namespace, lease
+            )
+        except kubernetes_asyncio.client.exceptions.ApiException as ex:
+            if ex.status != 409:
+                raise
+            # Another replica got there first
+            self.is_leader = False
+            return
+        if self.is_leader:
+            self._renewed = now
+        else:
+            self._elected(now)
+
+    def _elected(self, now: float) -> None:
+        self._renewed = now
+        self.is_leader = True
+        self.leader = self.identity
+        logging.info("Elected leader (%s)", self.identity)
+        # There's no need to call back if we've not started,
+        # i.e. if we're elected by 'start()', before kopf has listed the Jobs.
+        if self._on_elected and self._task:
+            self._on_elected()
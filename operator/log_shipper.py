@@ -0,0 +1,339 @@
+"""Captures the logs of Job Pods, writing them to the Job's project.
+
+The Data Manager's log-watcher collects a Job's logs from its Pod, so the
+Pod has to be kept (for a while) after it has finished. Instead, the
+operator can capture the logs itself, following (streaming) the log of
+each Job Pod while it runs and writing it, as it arrives, to a compressed
+(gzip) file in its project volume (i.e. the file
+'{project_mount}/.job-logs/{name}.log.gz', as seen by the Job).
+The logs are kept out of the Job's own directory, which the Job creates
+(as its user). Once a Pod has finished, and its log has been written,
+the Pod can be deleted - its logs no longer depend on it.
+
+The project volume (the Jobs' claim) has to be mounted in the operator,
+at 'root'. Jobs using a different claim (or a claim with the same name
+in another namespace) are not captured. New log files
+(and directories) are writable by the Job's group and, if the operator
+runs as root, owned by the Job's user and group (where the volume lets
+root change them - it won't if it squashes root).
+
+Each log is read in chunks (of at most _CHUNK_BYTES) and each chunk
+is written before the next is read, so a slow volume slows the stream
+(rather than buffering the log). Files are written in (a small pool of)
+threads, the volume is often a network file-system. The streams use
+their own API client (and connection pool) so they cannot starve the
+operator's other API calls. Pods beyond 'max_streams' are not captured.
+
+If the operator restarts while a Pod is running its log is followed again,
+skipping the part that has already been written.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import gzip
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import aiohttp
+import kubernetes_asyncio
+
+import api_response
+import metrics
+
+# Errors we expect (and survive) when capturing a log
+_ERRORS = (
+    kubernetes_asyncio.client.exceptions.ApiException,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+    OSError,
+    EOFError,
+)
+
+# The largest piece of a log read (and written) at a time
+_CHUNK_BYTES: int = 64 * 1024
+# How often (seconds) written logs are flushed (made readable)
+_FLUSH_INTERVAL_S: float = 5.0
+# The delay (seconds) before a log is followed again,
+# if its stream ended before the Pod finished
+_RETRY_DELAY_S: float = 1.0
+# The directory (in the Job's project) of the log files
+_LOG_DIRECTORY: str = ".job-logs"
+# The phases of Pods that have logs
+_LOG_PHASES: Tuple[str, ...] = ("Running", "Succeeded", "Failed")
+
+
+class LogShipper:
+    """Captures the logs of Job Pods (see 'observe') to files under 'root',
+    where the project volume (the claim 'claim_name' in 'claim_namespace')
+    is mounted.
+
+    'on_shipped' is called with a Pod's namespace and name
+    when its (finished) log has been written.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        root: str,
+        claim_name: str,
+        claim_namespace: str,
+        max_streams: int,
+        on_shipped: Callable[[str, str], None],
+    ):
+        self.enabled: bool = enabled
+        self.root: str = root
+        self.claim_name: str = claim_name
+        self.claim_namespace: str = claim_namespace
+        self.max_streams: int = max_streams
+        self._on_shipped = on_shipped
+        self._api: Optional[kubernetes_asyncio.client.CoreV1Api] = None
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        # The state of each Pod ('following', 'shipped' or 'failed')
+        # keyed by namespace and name, and the tasks following the logs
+        self._states: Dict[Tuple[str, str], str] = {}
+        self._tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def start(self) -> None:
+        """Starts capturing logs, using a new API client
+        (created from the default, loaded, configuration).
+        """
+        if not self.enabled:
+            return
+        configuration = kubernetes_asyncio.client.Configuration.get_default_copy()
+        configuration.connection_pool_maxsize = self.max_streams
+        self._api = kubernetes_asyncio.client.CoreV1Api(
+            kubernetes_asyncio.client.ApiClient(configuration)
+        )
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="log-shipper"
+        )
+        logging.info(
+            "Started log shipper (root=%s claim=%s/%s max_streams=%s)",
+            self.root,
+            self.claim_namespace,
+            self.claim_name,
+            self.max_streams,
+        )
+
+    async def stop(self) -> None:
+        """Stops capturing logs. Logs being written are closed
+        (so they can be resumed).
+        """
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        if self._api:
+            await self._api.api_client.close()
+        self._api = None
+        if self._executor:
+            self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def shipped(self, namespace: str, name: str) -> bool:
+        """True if the Pod's (finished) log has been written."""
+        return self._states.get((namespace, name)) == "shipped"
+
+    def observe(self, event_type: str, pod: Dict[str, Any]) -> None:
+        """Handles a Job Pod event, starting to follow the Pod's log
+        (once it has one), or forgetting the Pod (when it's deleted).
+        """
+        if not self._api:
+            return
+        metadata: Dict[str, Any] = pod["metadata"]
+        key: Tuple[str, str] = (metadata["namespace"], metadata["name"])
+        if event_type == "DELETED":
+            self._states.pop(key, None)
+            task: Optional[asyncio.Task] = self._tasks.pop(key, None)
+            if task:
+                task.cancel()
+            return
+        if key in self._states:
+            return
+        if pod.get("status", {}).get("phase") not in _LOG_PHASES:
+            return
+        path: Optional[str] = _log_path(
+            pod, self.root, self.claim_name, self.claim_namespace
+        )
+        if not path:
+            return
+        if len(self._tasks) >= self.max_streams:
+            logging.warning(
+                'Not capturing the log of "%s" (%s streams)', key[1], len(self._tasks)
+            )
+            metrics.LOG_SHIPMENTS.labels("skipped").inc()
+            self._states[key] = "failed"
+            return
+        self._states[key] = "following"
+        task = asyncio.get_running_loop().create_task(
+            self._ship(key, path, _log_owner(pod))
+        )
+        self._tasks[key] = task
+        task.add_done_callback(functools.partial(self._forget_task, key))
+
+    def _forget_task(self, key: Tuple[str, str], task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    async def _ship(
+        self, key: Tuple[str, str], path: str, owner: Optional[Tuple[int, int]]
+    ) -> None:
+        """Follows the Pod's log, writing it to 'path', until the Pod has
+        finished. Failures are logged (the log is not captured).
+        """
+        namespace, name = key
+        log_file: Optional[gzip.GzipFile] = None
+        try:
+            opened, written = await self._in_thread(_open_log, path, owner)
+            log_file = opened
+            while True:
+                written += await self._follow(namespace, name, opened, written)
+                assert self._api
+                pod = await self._api.read_namespaced_pod(name, namespace)
+                if pod.status.phase in ["Succeeded", "Failed"]:
+                    break
+                # The stream ended before the Pod finished - follow it again
+                await asyncio.sleep(_RETRY_DELAY_S)
+            await self._in_thread(opened.close)
+            log_file = None
+        except _ERRORS as ex:
+            logging.warning('Failed to capture the log of "%s" (%s)', name, ex)
+            metrics.LOG_SHIPMENTS.labels("failed").inc()
+            self._states[key] = "failed"
+            return
+        finally:
+            if log_file:
+                try:
+                    await self._in_thread(log_file.close)
+                except OSError as ex:
+                    logging.warning('Failed to close the log of "%s" (%s)', name, ex)
+
+        logging.info('Captured the log of "%s" (%s bytes)', name, written)
+        metrics.LOG_SHIPMENTS.labels("shipped").inc()
+        self._states[key] = "shipped"
+        self._on_shipped(namespace, name)
+
+    async def _follow(
+        self, namespace: str, name: str, log_file: gzip.GzipFile, skip: int
+    ) -> int:
+        """Follows the Pod's log until the stream ends, writing it
+        (after skipping the bytes already written) to 'log_file'.
+        The number of bytes written is returned.
+        """
+        assert self._api
+        response: aiohttp.ClientResponse = await self._api.read_namespaced_pod_log(
+            name,
+            namespace,
+            follow=True,
+            _preload_content=False,
+            # The stream lasts as long as the Pod runs
+            _request_timeout=aiohttp.ClientTimeout(total=None, sock_connect=60),
+        )
+        # A failure's body (a Status) is not the log
+        await api_response.check(response)
+        written: int = 0
+        flushed: float = time.monotonic()
+        async with response:
+            async for chunk in response.content.iter_chunked(_CHUNK_BYTES):
+                if skip >= len(chunk):
+                    skip -= len(chunk)
+                    continue
+                chunk = chunk[skip:]
+                skip = 0
+                await self._in_thread(log_file.write, chunk)
+                written += len(chunk)
+                if time.monotonic() - flushed > _FLUSH_INTERVAL_S:
+                    await self._in_thread(log_file.flush)
+                    flushed = time.monotonic()
+        return written
+
+    async def _in_thread(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Calls a (blocking) file function in one of our threads."""
+        future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Let the call finish (before the file is closed)
+            await asyncio.wait([future])
+            raise
+
+
+def _log_path(
+    pod: Dict[str, Any], root: str, claim_name: str, claim_namespace: str
+) -> Optional[str]:
+    """The path (under 'root') of the Pod's log file, or None if the Pod's
+    project is not on our volume (the claim 'claim_name' in 'claim_namespace').
+    A Pod can only use claims in its own namespace.
+    """
+    if pod["metadata"]["namespace"] != claim_namespace:
+        return None
+    spec: Dict[str, Any] = pod.get("spec") or {}
+    claims: Dict[str, Any] = {
+        volume["name"]: volume["persistentVolumeClaim"]["claimName"]
+        for volume in spec.get("volumes") or []
+        if "persistentVolumeClaim" in volume
+    }
+    if claims.get("project") != claim_name:
+        return None
+    for mount in (spec.get("containers") or [{}])[0].get("volumeMounts") or []:
+        if mount["name"] == "project":
+            return os.path.join(
+                root,
+                mount.get("subPath", ""),
+                _LOG_DIRECTORY,
+                f"{pod['metadata']['name']}.log.gz",
+            )
+    return None
+
+
+def _log_owner(pod: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    """The user and group the Pod runs as (None if it doesn't say)."""
+    security_context: Dict[str, Any] = (pod.get("spec") or {}).get(
+        "securityContext"
+    ) or {}
+    if "runAsUser" not in security_context or "runAsGroup" not in security_context:
+        return None
+    return security_context["runAsUser"], security_context["runAsGroup"]
+
+
+def _own(path: str, owner: Optional[Tuple[int, int]], mode: int) -> None:
+    """Sets the mode of a new log file (or directory) and, if we can,
+    its owner (the Job's user and group).
+    """
+    os.chmod(path, mode)
+    if owner and os.geteuid() == 0:
+        try:
+            os.chown(path, *owner)
+        except PermissionError:
+            # The volume squashes root
+            pass
+
+
+def _open_log(path: str, owner: Optional[Tuple[int, int]]) -> Tuple[gzip.GzipFile, int]:
+    """Opens a log file, returning it and the number of (uncompressed)
+    bytes it already has. A complete file is appended to (as a new gzip
+    member), an incomplete (or corrupt) one is replaced. A new file
+    (and directory) is given to 'owner' (a user and group).
+    """
+    directory: str = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+        _own(directory, owner, 0o775)
+    if os.path.exists(path):
+        written: int = 0
+        try:
+            with gzip.open(path, "rb") as existing:
+                while chunk := existing.read(_CHUNK_BYTES):
+                    written += len(chunk)
+            return gzip.GzipFile(path, "ab"), written
+        except (OSError, EOFError):
+            logging.warning("Replacing incomplete log %s", path)
+    log_file: gzip.GzipFile = gzip.GzipFile(path, "wb")
+    _own(path, owner, 0o664)
+    return log_file, 0
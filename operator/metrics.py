@@ -0,0 +1,162 @@
+"""Prometheus metrics for the operator.
+
+The metrics are served (on '/metrics') by 'start()',
+which is called from the operator's startup handler.
+"""
+import functools
+import logging
+from typing import Any, Callable
+
+import kopf
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Buckets (seconds) for the latency of whole operations
+# (i.e. creating a Job's objects, or deleting them once the Job's finished)
+_OPERATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30, 60, 120, 300, 600)
+
+CREATE_LATENCY_S: Histogram = Histogram(
+    "jo_create_latency_seconds",
+    "Time from a DataManagerJob's creation to its Pod being created",
+    buckets=_OPERATION_BUCKETS,
+)
+DELETE_LATENCY_S: Histogram = Histogram(
+    "jo_delete_latency_seconds",
+    "Time from a Job's completion being seen to its objects being deleted",
+    buckets=_OPERATION_BUCKETS,
+)
+PENDING_DELETIONS: Gauge = Gauge(
+    "jo_pending_deletions",
+    "Finished Jobs waiting to be deleted",
+)
+
+DELETIONS_STARTED: Counter = Counter(
+    "jo_deletions_started",
+    "Job deletions started, by trigger"
+    " (drained - the Job's logs were collected, or timeout - the delay expired)",
+    ["trigger"],
+)
+DELETION_FAILURES: Counter = Counter(
+    "jo_deletion_failures",
+    "Failed Job deletions, by outcome (retried or abandoned)",
+    ["outcome"],
+)
+SWEPT_PODS: Counter = Counter(
+    "jo_swept_pods",
+    "Finished Job Pods deleted by the sweeper (their completion was missed)",
+)
+REAPED_JOBS: Counter = Counter(
+    "jo_reaped_jobs",
+    "Jobs whose orphaned ConfigMaps were deleted by the reaper",
+)
+API_CALL_S: Histogram = Histogram(
+    "jo_api_call_seconds",
+    "Kubernetes API call latency",
+    ["call"],
+)
+API_WAIT_S: Histogram = Histogram(
+    "jo_api_limiter_wait_seconds",
+    "Time API calls spent waiting for the rate and in-flight limits",
+    ["kind"],
+)
+API_LIMITER_LEVEL: Gauge = Gauge(
+    "jo_api_limiter_level",
+    "How full each API rate-limit token bucket is (0 to 1)",
+    ["kind"],
+)
+API_IN_FLIGHT: Gauge = Gauge(
+    "jo_api_in_flight",
+    "API calls in progress",
+)
+API_MAX_IN_FLIGHT: Gauge = Gauge(
+    "jo_api_max_in_flight",
+    "The maximum number of API calls that can be in progress",
+)
+
+SHARD_MEMBERS: Gauge = Gauge(
+    "jo_shard_members",
+    "The operator replicas sharing the DataManagerJobs (1 if not sharded)",
+)
+
+JOB_PODS: Gauge = Gauge(
+    "jo_job_pods",
+    "Job Pods (seen by the operator's Pod watch) by phase",
+    ["phase"],
+)
+
+STATUS_UPDATES: Counter = Counter(
+    "jo_status_updates",
+    "DataManagerJob status updates, by outcome"
+    " (queued, coalesced, unchanged, written, retried or dropped)",
+    ["outcome"],
+)
+PENDING_STATUS_UPDATES: Gauge = Gauge(
+    "jo_pending_status_updates",
+    "DataManagerJobs with status updates waiting to be written",
+)
+
+LOG_STREAMS: Gauge = Gauge(
+    "jo_log_streams",
+    "Job Pod logs being captured (followed)",
+)
+LOG_SHIPMENTS: Counter = Counter(
+    "jo_log_shipments",
+    "Job Pod logs captured, by outcome (shipped, failed or skipped)",
+    ["outcome"],
+)
+LEADER: Gauge = Gauge(
+    "jo_leader",
+    "1 if this replica is handling DataManagerJobs (the leader), 0 if standing by",
+)
+
+HANDLERS_IN_PROGRESS: Gauge = Gauge(
+    "jo_handlers_in_progress",
+    "Handler invocations in progress",
+    ["handler"],
+)
+HANDLER_S: Histogram = Histogram(
+    "jo_handler_seconds",
+    "Handler invocation duration",
+    ["handler"],
+)
+HANDLER_FAILURES: Counter = Counter(
+    "jo_handler_failures",
+    "Handler invocations that failed, by error (permanent or temporary)",
+    ["handler", "error"],
+)
+
+
+def instrumented(handler: str) -> Callable[..., Any]:
+    """A decorator for asynchronous handlers that records
+    the number of invocations in progress, their duration,
+    and whether they fail permanently or are to be retried.
+    """
+
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with HANDLERS_IN_PROGRESS.labels(handler).track_inprogress():
+                with HANDLER_S.labels(handler).time():
+                    try:
+                        return await fn(*args, **kwargs)
+                    except kopf.PermanentError:
+                        HANDLER_FAILURES.labels(handler, "permanent").inc()
+                        raise
+                    except Exception:
+                        # kopf retries everything else
+                        HANDLER_FAILURES.labels(handler, "temporary").inc()
+                        raise
+
+        return wrapper
+
+    return decorator
+
+
+def start(port: int) -> None:
+    """Starts the metrics server (in a thread) on the given port.
+    A port of 0 (or less) means metrics are not served.
+    """
+    if port <= 0:
+        logging.info("Not serving metrics")
+        return
+    start_http_server(port)
+    logging.info("Serving metrics on port %s", port)
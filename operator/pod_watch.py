@@ -0,0 +1,291 @@
+"""A dedicated (label-selected) watch of the Job Pods.
+
+The operator detects that a Job has finished from its Pod. Rather than rely
+on the framework's events, the Pods are watched directly, selected (by the
+API server) using their labels, so only Job Pods are ever sent to us.
+
+The watch asks for bookmarks - events the API server sends (periodically)
+to tell a watcher that it has seen everything up to a resource version,
+even if none of the selected objects changed. The watch resumes from the
+latest version it has seen (an event's or a bookmark's) whenever it is
+reconnected (or, given a checkpoint, restarted), so Pods are only listed
+(again) if that version has expired.
+
+A watch resumed from a checkpoint is not told of the Pods that finished
+before the checkpoint was saved - including those whose deletion was
+still pending when the operator stopped. So, when it's resumed,
+the finished Pods are listed first (and presented as new).
+
+Given namespaces, each is watched (and listed) separately, with its own
+resource version - the API server can only select one namespace
+(or all of them) per request.
+
+The phase of each Pod is remembered so that the handler is told
+the Pod's previous phase, and can react only to phase transitions.
+The remembered Pods are the operator's cache (see cache.py).
+"""
+import asyncio
+import functools
+import logging
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+import aiohttp
+import kubernetes_asyncio
+
+import api_response
+import cache
+
+# Errors we expect (and survive) when watching
+_API_ERRORS = (
+    kubernetes_asyncio.client.exceptions.ApiException,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+)
+
+# The delay (seconds) before re-connecting a failed watch
+_RETRY_DELAY_S: float = 5.0
+# How much longer (seconds) than a watch request the client waits for it.
+# The client's default (5 minutes) would otherwise end longer requests.
+_REQUEST_TIMEOUT_MARGIN_S: int = 60
+
+
+class PodWatch:
+    """Watches the Pods selected by 'label_selector' in 'namespaces'
+    (all namespaces if there are none).
+
+    'on_event' is called (and awaited) for every Pod event,
+    with the event type ('ADDED', 'MODIFIED' or 'DELETED'), the Pod
+    and the Pod's previous phase (None if it's a new Pod).
+    Pods found when the Pods are listed are presented as 'ADDED'
+    (or 'MODIFIED', if they're known), and known Pods that have gone
+    as 'DELETED'. When resumed (from a checkpoint) the finished Pods
+    are presented as 'ADDED' before watching.
+
+    Each watch request ends (server-side) after 'timeout_s'
+    and is then resumed. A request that outlives it (by a margin)
+    is ended by the client, and also resumed.
+    """
+
+    def __init__(
+        self,
+        label_selector: str,
+        on_event: Callable[[str, Dict[str, Any], Optional[str]], Awaitable[None]],
+        namespaces: Sequence[str] = (),
+        timeout_s: int = 600,
+    ):
+        self.label_selector: str = label_selector
+        self.namespaces: List[str] = list(namespaces)
+        self.timeout_s: int = timeout_s
+        # The resource version each watch resumes from,
+        # keyed by namespace ('' if all namespaces are watched)
+        self.resource_versions: Dict[str, Optional[str]] = {}
+        self._on_event = on_event
+        self._api: Optional[kubernetes_asyncio.client.CoreV1Api] = None
+        self._tasks: List[asyncio.Task] = []
+        # The watches (namespaces) that have been resumed,
+        # until they've listed the finished Pods
+        self._resumed: Set[str] = set()
+        # The phase of each Pod, keyed by namespace and name
+        self._phases: Dict[Tuple[str, str], Optional[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._phases)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._phases
+
+    def count(self, phase: str) -> int:
+        """The number of Pods (we know of) in the given phase."""
+        return sum(1 for pod_phase in self._phases.values() if pod_phase == phase)
+
+    async def start(
+        self,
+        api_client: kubernetes_asyncio.client.ApiClient,
+        resource_versions: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Starts watching (in background tasks), from the given resource
+        versions (i.e. a checkpoint, keyed like 'resource_versions') or,
+        for a watch without one, after listing the Pods.
+        """
+        versions: Dict[str, str] = resource_versions or {}
+        self.resource_versions = {
+            namespace: versions.get(namespace) for namespace in self.namespaces or [""]
+        }
+        self._resumed = {
+            namespace
+            for namespace, version in self.resource_versions.items()
+            if version
+        }
+        self._api = kubernetes_asyncio.client.CoreV1Api(api_client)
+        self._tasks = [
+            asyncio.get_running_loop().create_task(self._run(namespace))
+            for namespace in self.resource_versions
+        ]
+        logging.info(
+            "Started Pod watch (label_selector=%s resource_versions=%s)",
+            self.label_selector,
+            self.resource_versions,
+        )
+
+    async def stop(self) -> None:
+        """Stops watching."""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._api = None
+
+    def _list_fn(self, namespace: str) -> Callable[..., Any]:
+        """The API function that lists (or watches) the Pods
+        in the namespace ('' for all namespaces).
+        """
+        assert self._api
+        if namespace:
+            return functools.partial(self._api.list_namespaced_pod, namespace)
+        return self._api.list_pod_for_all_namespaces
+
+    async def _run(self, namespace: str) -> None:
+        while True:
+            try:
+                if self.resource_versions[namespace] is None:
+                    await self._list(namespace)
+                elif namespace in self._resumed:
+                    await self._list_finished(namespace)
+                self._resumed.discard(namespace)
+                await self._watch(namespace)
+            except asyncio.TimeoutError:
+                # The request outlived the client's timeout (the server
+                # should have ended it) - it's simply resumed.
+                logging.info("Pod watch request timed out, resuming")
+            except kubernetes_asyncio.client.exceptions.ApiException as ex:
+                if ex.status == 410:
+                    # The version has expired - we have to list the Pods again
+                    logging.info("Pod watch version has expired, listing Pods")
+                    self.resource_versions[namespace] = None
+                    continue
+                logging.warning("Pod watch failed (%s)", ex)
+                await asyncio.sleep(_RETRY_DELAY_S)
+            except _API_ERRORS as ex:
+                logging.warning("Pod watch failed (%s)", ex)
+                await asyncio.sleep(_RETRY_DELAY_S)
+
+    async def _pages(
+        self, namespace: str, field_selector: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Lists the Pods in the namespace
+        (also selected by 'field_selector'), in pages.
+        """
+        continue_token: Optional[str] = None
+        while True:
+            response = await self._list_fn(namespace)(
+                label_selector=self.label_selector,
+                field_selector=field_selector,
+                limit=500,
+                _continue=continue_token,
+                _preload_content=False,
+            )
+            pods: Dict[str, Any] = await api_response.read_json(response)
+            yield pods
+            continue_token = pods["metadata"].get("continue")
+            if not continue_token:
+                return
+
+    async def _list(self, namespace: str) -> None:
+        """Lists the Pods in the namespace (in pages), presenting them
+        as events, and sets the version its watch starts from.
+        """
+        listed: Set[Tuple[str, str]] = set()
+        pods: Dict[str, Any] = {}
+        async for pods in self._pages(namespace):
+            for pod in pods["items"]:
+                metadata: Dict[str, Any] = pod["metadata"]
+                key: Tuple[str, str] = (metadata["namespace"], metadata["name"])
+                listed.add(key)
+                await self._observe("MODIFIED" if key in self._phases else "ADDED", pod)
+        # Pods we knew of (in the namespace) that have gone
+        # (while we weren't watching)
+        known: Set[Tuple[str, str]] = {
+            key for key in self._phases if not namespace or key[0] == namespace
+        }
+        for pod_namespace, name in known - listed:
+            await self._observe(
+                "DELETED", {"metadata": {"namespace": pod_namespace, "name": name}}
+            )
+        self.resource_versions[namespace] = pods["metadata"]["resourceVersion"]
+        logging.info(
+            "Listed %s Pods (namespace=%s resource_version=%s)",
+            len(listed),
+            namespace,
+            self.resource_versions[namespace],
+        )
+
+    async def finished(self) -> AsyncIterator[Dict[str, Any]]:
+        """The finished Pods (in every namespace we watch), listed
+        (in pages) rather than taken from what we've seen - the watch
+        does not keep the Pods.
+        """
+        for namespace in self.namespaces or [""]:
+            async for pods in self._pages(namespace, cache.FINISHED_FIELD_SELECTOR):
+                for pod in pods["items"]:
+                    yield pod
+
+    async def _list_finished(self, namespace: str) -> None:
+        """Lists the finished Pods in the namespace (in pages), presenting
+        those we don't know of as 'ADDED'. The version its watch resumes
+        from is kept.
+        """
+        listed: int = 0
+        async for pods in self._pages(namespace, cache.FINISHED_FIELD_SELECTOR):
+            for pod in pods["items"]:
+                metadata: Dict[str, Any] = pod["metadata"]
+                if (metadata["namespace"], metadata["name"]) not in self._phases:
+                    listed += 1
+                    await self._observe("ADDED", pod)
+        logging.info("Listed %s finished Pods (namespace=%s)", listed, namespace)
+
+    async def _watch(self, namespace: str) -> None:
+        """Watches the Pods in the namespace from its current version,
+        until the request ends.
+        """
+        watch = kubernetes_asyncio.watch.Watch(return_type="object")
+        async with watch.stream(
+            self._list_fn(namespace),
+            label_selector=self.label_selector,
+            allow_watch_bookmarks=True,
+            resource_version=self.resource_versions[namespace],
+            timeout_seconds=self.timeout_s,
+            _request_timeout=aiohttp.ClientTimeout(
+                total=self.timeout_s + _REQUEST_TIMEOUT_MARGIN_S, sock_connect=60
+            ),
+        ) as stream:
+            async for event in stream:
+                pod: Dict[str, Any] = event["raw_object"]
+                if event["type"] != "BOOKMARK":
+                    await self._observe(event["type"], pod)
+                # Resume from here
+                self.resource_versions[namespace] = pod["metadata"]["resourceVersion"]
+
+    async def _observe(self, event_type: str, pod: Dict[str, Any]) -> None:
+        """Records the Pod's phase and hands the event to 'on_event'."""
+        metadata: Dict[str, Any] = pod["metadata"]
+        key: Tuple[str, str] = (metadata["namespace"], metadata["name"])
+        previous_phase: Optional[str] = self._phases.get(key)
+        if event_type == "DELETED":
+            self._phases.pop(key, None)
+        else:
+            self._phases[key] = pod.get("status", {}).get("phase")
+        try:
+            await self._on_event(event_type, pod, previous_phase)
+        except Exception:  # pylint: disable=broad-except
+            # A failed handler must not stop the watch
+            logging.exception("Failed handling Pod %s event", metadata["name"])
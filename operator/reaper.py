@@ -0,0 +1,202 @@
+"""A periodic reaper of orphaned Job ConfigMaps.
+
+A Job's ConfigMaps (its Nextflow configuration and injected files) are
+created before its Pod, and deleted with it. They're orphaned if the Pod
+is never created (i.e. its creation failed permanently) or they're not
+deleted with it (i.e. the deletion failed). The reaper finds the Jobs
+(the 'app' label of their ConfigMaps) that have ConfigMaps but no Pod,
+and deletes their ConfigMaps.
+
+The reaper lists the ConfigMaps and the Job Pods (in pages, selected by
+the API server using their labels) each time it runs, rather than
+watching (and caching) them. Only their metadata is listed (the API
+server sends the objects without their content, i.e. a ConfigMap's data)
+and each page is reduced to what the reaper needs as it arrives, so
+the reaper's memory does not grow with the size of the objects. Given
+namespaces, the objects in each are listed separately. Only ConfigMaps
+owned by a DataManagerJob
+are considered. The ConfigMaps of a DataManagerJob that has been deleted
+are removed by Kubernetes (they're owned by it). The ConfigMaps of many
+Jobs are deleted using one (collection) call, selecting them using their
+'app' label.
+"""
+import asyncio
+import logging
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+import aiohttp
+import kubernetes_asyncio
+
+import api_response
+import job_status
+import metrics
+
+# Errors we expect (and survive) when reaping
+_API_ERRORS = (
+    kubernetes_asyncio.client.exceptions.ApiException,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+)
+
+# The (Accept) media type of a list of objects' metadata
+_METADATA_LIST: str = "application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1"
+
+
+class ConfigMapReaper:
+    """Deletes (every 'interval_s') the ConfigMaps of Jobs without a Pod,
+    in 'namespaces' (all namespaces if there are none).
+    An interval of 0 (or less) means ConfigMaps are not reaped.
+
+    A Job's ConfigMaps are orphaned if it has no Pod (amongst those
+    selected by 'pod_label_selector') and its (newest) ConfigMap is
+    older than 'grace_s' (its Pod should have been created by then).
+
+    'when' is called with each Job's name and namespace and returns
+    True if its ConfigMaps can be deleted. 'delete_fn' is called (and
+    awaited) with a namespace and the names of (at most 'batch_size')
+    Jobs whose ConfigMaps are to be deleted.
+    """
+
+    def __init__(
+        self,
+        pod_label_selector: str,
+        when: Callable[[str, str], bool],
+        delete_fn: Callable[[str, List[str]], Awaitable[None]],
+        grace_s: float,
+        interval_s: float,
+        namespaces: Sequence[str] = (),
+        page_size: int = 500,
+        batch_size: int = 50,
+    ):
+        self.pod_label_selector: str = pod_label_selector
+        self.namespaces: List[str] = list(namespaces)
+        self.grace_s: float = grace_s
+        self.interval_s: float = interval_s
+        self.page_size: int = page_size
+        self.batch_size: int = batch_size
+        self._when = when
+        self._delete_fn = delete_fn
+        self._api: Optional[kubernetes_asyncio.client.CoreV1Api] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        """True if ConfigMaps are reaped."""
+        return self.interval_s > 0
+
+    async def start(self, api_client: kubernetes_asyncio.client.ApiClient) -> None:
+        """Starts reaping (in a background task)."""
+        if not self.enabled:
+            return
+        self._api = kubernetes_asyncio.client.CoreV1Api(api_client)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops reaping."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._api = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_s)
+            try:
+                await self.reap()
+            except _API_ERRORS as ex:
+                logging.warning("ConfigMap reap failed (%s)", ex)
+
+    async def _metadata(
+        self, resource: str, label_selector: str
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """The metadata of the objects ('configmaps' or 'pods') selected
+        by the label selector, in each of our namespaces (listed in pages).
+        """
+        assert self._api
+        for namespace in self.namespaces or [""]:
+            path: str = (
+                f"/api/v1/namespaces/{namespace}/{resource}"
+                if namespace
+                else f"/api/v1/{resource}"
+            )
+            continue_token: Optional[str] = None
+            while True:
+                query: List[Tuple[str, Any]] = [
+                    ("labelSelector", label_selector),
+                    ("limit", self.page_size),
+                ]
+                if continue_token:
+                    query.append(("continue", continue_token))
+                response = await self._api.api_client.call_api(
+                    path,
+                    "GET",
+                    query_params=query,
+                    header_params={"Accept": _METADATA_LIST},
+                    auth_settings=["BearerToken"],
+                    _preload_content=False,
+                    _return_http_data_only=True,
+                )
+                objects: Dict[str, Any] = await api_response.read_json(response)
+                for item in objects["items"]:
+                    yield item["metadata"]
+                continue_token = objects["metadata"].get("continue")
+                if not continue_token:
+                    break
+
+    async def orphans(self) -> Dict[str, List[str]]:
+        """The Jobs with orphaned ConfigMaps (their names), by namespace.
+        The ConfigMaps are listed before the Pods, so a Pod created
+        (for a ConfigMap) while we're listing is seen.
+        """
+        # The creation time of the newest ConfigMap of each Job
+        created: Dict[Tuple[str, str], str] = {}
+        async for metadata in self._metadata("configmaps", "app"):
+            if not any(
+                owner.get("kind") == "DataManagerJob"
+                for owner in metadata.get("ownerReferences") or []
+            ):
+                continue
+            key: Tuple[str, str] = (metadata["namespace"], metadata["labels"]["app"])
+            created[key] = max(created.get(key, ""), metadata["creationTimestamp"])
+        if not created:
+            return {}
+        pods: Set[Tuple[str, str]] = set()
+        async for metadata in self._metadata("pods", self.pod_label_selector):
+            pods.add((metadata["namespace"], metadata["name"]))
+
+        orphans: Dict[str, List[str]] = {}
+        for key, timestamp in created.items():
+            namespace, name = key
+            if key in pods or not self._when(name, namespace):
+                continue
+            age_s: Optional[float] = job_status.age_s(timestamp)
+            if age_s is None or age_s < self.grace_s:
+                continue
+            orphans.setdefault(namespace, []).append(name)
+        return orphans
+
+    async def reap(self) -> int:
+        """Deletes the orphaned ConfigMaps (in batches of Jobs),
+        returning the number of Jobs whose ConfigMaps were deleted.
+        """
+        reaped: int = 0
+        for namespace, names in (await self.orphans()).items():
+            for start in range(0, len(names), self.batch_size):
+                batch: List[str] = names[start : start + self.batch_size]
+                await self._delete_fn(namespace, batch)
+                reaped += len(batch)
+                metrics.REAPED_JOBS.inc(len(batch))
+        if reaped:
+            logging.warning("Reaped the orphaned ConfigMaps of %s Jobs", reaped)
+        return reaped
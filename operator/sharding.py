@@ -0,0 +1,273 @@
+"""Sharding of DataManagerJobs between operator replicas.
+
+Each replica holds a Lease (in the operator's namespace) that it renews
+periodically. The replicas whose Leases are being renewed are the shard
+members, and each DataManagerJob belongs to one of them, chosen using
+rendezvous (highest random weight) hashing of the Job's instance name
+(or namespace). Rendezvous hashing is a consistent hash - when a member
+joins or leaves only the Jobs belonging to that member move.
+
+A Lease is considered expired if its renew time has not changed for its
+duration, as observed by this replica, so clocks do not need to agree
+(only a Lease seen for the first time is judged by its renew time).
+Expired Leases are deleted by the first member. A replica that stops
+deletes its own Lease.
+
+kopf records that it has handled an object (the last-handled configuration)
+even if none of its handlers are selected for it. A replica must not do that
+for Jobs it does not own, as the owner would then never see them created -
+so the operator uses a ShardDiffBaseStorage.
+"""
+import asyncio
+import datetime
+import hashlib
+import logging
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import aiohttp
+import kopf
+import kubernetes_asyncio
+
+# The label applied to the shard Leases
+_SHARD_LEASE_LABEL: str = "data-manager.informaticsmatters.com/job-operator-shard"
+
+
+class Shards:
+    """Maintains this replica's Lease and the set of shard members.
+
+    'shard_by' is 'name' (the DataManagerJob instance name)
+    or 'namespace'. An empty 'shard_by' disables sharding,
+    in which case this replica owns everything.
+    'on_members_lost' is called (with the identities of the lost members)
+    when members' Leases expire. It must not block (Lease renewal waits for it).
+    """
+
+    def __init__(
+        self,
+        identity: str,
+        shard_by: str,
+        namespace: str,
+        lease_duration_s: int,
+        on_members_lost: Optional[Callable[[Set[str]], None]] = None,
+    ):
+        if shard_by not in ["", "name", "namespace"]:
+            raise ValueError(f"Unsupported shard_by ({shard_by})")
+        self.identity: str = identity
+        self.shard_by: str = shard_by
+        self.namespace: str = namespace
+        self.lease_duration_s: int = max(lease_duration_s, 3)
+        self.members: List[str] = [identity]
+        self._lease_name: str = f"job-operator-shard-{identity}"
+        self._on_members_lost = on_members_lost
+        self._api: Optional[kubernetes_asyncio.client.CoordinationV1Api] = None
+        self._task: Optional[asyncio.Task] = None
+        # The last renew time seen for each member's Lease,
+        # and when (event loop time) we saw it change.
+        self._observed: Dict[str, Tuple[Any, float]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        """True if sharding is enabled."""
+        return bool(self.shard_by)
+
+    def owner(
+        self, name: str, namespace: str, members: Optional[Iterable[str]] = None
+    ) -> str:
+        """Returns the identity of the member that owns the given Job,
+        amongst the current (or the given) members.
+        """
+        key: str = name if self.shard_by == "name" else namespace
+        return max(members or self.members, key=lambda member: _weight(member, key))
+
+    def owns(self, name: str, namespace: str) -> bool:
+        """True if this replica owns the given Job."""
+        if not self.enabled:
+            return True
+        return self.owner(name, namespace) == self.identity
+
+    async def start(self, api_client: kubernetes_asyncio.client.ApiClient) -> None:
+        """Creates our Lease, finds the current members and starts
+        renewing the Lease (in a background task).
+        """
+        if not self.enabled:
+            return
+        self._api = kubernetes_asyncio.client.CoordinationV1Api(api_client)
+        await self._renew()
+        await self._refresh()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logging.info(
+            "Started shard %s (shard_by=%s members=%s)",
+            self.identity,
+            self.shard_by,
+            self.members,
+        )
+
+    async def stop(self) -> None:
+        """Stops renewing our Lease and deletes it,
+        so the other members take over our Jobs without waiting for it to expire.
+        """
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._api:
+            try:
+                await self._api.delete_namespaced_lease(
+                    self._lease_name, self.namespace
+                )
+            except kubernetes_asyncio.client.exceptions.ApiException as ex:
+                logging.warning("ApiException (%s) deleting shard Lease", ex.status)
+            self._api = None
+
+    async def _run(self) -> None:
+        interval_s: float = self.lease_duration_s / 3
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                await self._renew()
+                await self._refresh()
+            except (
+                kubernetes_asyncio.client.exceptions.ApiException,
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+            ) as ex:
+                # Keep trying - our Lease expires if we can't renew it.
+                logging.warning("Failed to renew shard Lease (%s)", ex)
+
+    async def _renew(self) -> None:
+        """Renews (or creates) our Lease."""
+        assert self._api
+        renew_time: str = datetime.datetime.now(datetime.timezone.utc).strftime(
+            "%Y-%m-%dT%H:%M:%S.%fZ"
+        )
+        try:
+            await self._api.patch_namespaced_lease(
+                self._lease_name, self.namespace, {"spec": {"renewTime": renew_time}}
+            )
+            return
+        except kubernetes_asyncio.client.exceptions.ApiException as ex:
+            if ex.status != 404:
+                raise
+        await self._api.create_namespaced_lease(
+            self.namespace,
+            {
+                "apiVersion": "coordination.k8s.io/v1",
+                "kind": "Lease",
+                "metadata": {
+                    "name": self._lease_name,
+                    "labels": {_SHARD_LEASE_LABEL: "yes"},
+                },
+                "spec": {
+                    "holderIdentity": self.identity,
+                    "leaseDurationSeconds": self.lease_duration_s,
+                    "acquireTime": renew_time,
+                    "renewTime": renew_time,
+                },
+            },
+        )
+
+    async def _refresh(self) -> None:
+        """Lists the shard Leases, updating the members.
+        The first member deletes the Leases that have expired.
+        """
+        assert self._api
+        leases = await self._api.list_namespaced_lease(
+            self.namespace, label_selector=f"{_SHARD_LEASE_LABEL}=yes"
+        )
+        now: float = asyncio.get_running_loop().time()
+        wall_now: datetime.datetime = datetime.datetime.now(datetime.timezone.utc)
+        observed: Dict[str, Tuple[Any, float]] = {}
+        members: Set[str] = {self.identity}
+        expired: List[str] = []
+        for lease in leases.items:
+            identity: Optional[str] = lease.spec.holder_identity
+            if not identity:
+                continue
+            renew_time: Any = lease.spec.renew_time
+            duration_s: int = lease.spec.lease_duration_seconds or self.lease_duration_s
+            previous: Optional[Tuple[Any, float]] = self._observed.get(identity)
+            seen: float = now
+            if previous and previous[0] == renew_time:
+                seen = previous[1]
+            elif not previous and renew_time:
+                # We've not seen it before. A Lease that's not been renewed
+                # for its duration (by the wall clock) is stale - its holder
+                # would have renewed it several times.
+                seen -= max((wall_now - renew_time).total_seconds(), 0)
+            observed[identity] = (renew_time, seen)
+            if now - seen < duration_s:
+                members.add(identity)
+            elif identity != self.identity:
+                expired.append(lease.metadata.name)
+        self._observed = observed
+
+        lost: Set[str] = set(self.members) - members
+        joined: Set[str] = members - set(self.members)
+        self.members = sorted(members)
+        if lost or joined:
+            logging.info(
+                "Shard members changed (joined=%s lost=%s members=%s)",
+                sorted(joined),
+                sorted(lost),
+                self.members,
+            )
+        if lost and self._on_members_lost:
+            self._on_members_lost(lost)
+        if expired and self.members[0] == self.identity:
+            await self._delete_leases(expired)
+
+    async def _delete_leases(self, names: List[str]) -> None:
+        """Deletes (expired) Leases, so those of replicas that have gone
+        (without deleting their own) do not accumulate.
+        A replica that's still alive creates its Lease again.
+        """
+        assert self._api
+        for name in names:
+            try:
+                await self._api.delete_namespaced_lease(name, self.namespace)
+                logging.info("Deleted expired shard Lease %s", name)
+            except kubernetes_asyncio.client.exceptions.ApiException as ex:
+                if ex.status != 404:
+                    logging.warning(
+                        "ApiException (%s) deleting shard Lease %s", ex.status, name
+                    )
+
+
+def _weight(member: str, key: str) -> int:
+    """The rendezvous hashing weight of a key for a member."""
+    return int.from_bytes(
+        hashlib.blake2b(f"{member}/{key}".encode("utf-8"), digest_size=8).digest(),
+        "big",
+    )
+
+
+class ShardDiffBaseStorage(kopf.AnnotationsDiffBaseStorage):
+    """kopf's (annotation) diff-base storage,
+    that only records the last-handled configuration of our own Jobs.
+    'owns' is called with a Job's name and namespace,
+    returning True if the Job is ours.
+    """
+
+    def __init__(self, owns: Callable[[str, str], bool], **kwargs: Any):
+        super().__init__(**kwargs)
+        self._owns: Callable[[str, str], bool] = owns
+
+    def store(
+        self,
+        *,
+        body: kopf.Body,
+        patch: kopf.Patch,
+        essence: kopf.BodyEssence,
+    ) -> None:
+        name: Optional[str] = body.metadata.name
+        namespace: Optional[str] = body.metadata.namespace
+        if name and namespace and self._owns(name, namespace):
+            super().store(body=body, patch=patch, essence=essence)
@@ -0,0 +1,148 @@
+"""A periodic sweep for finished Job Pods that have not been deleted.
+
+Finished Job Pods are normally deleted when their completion is seen
+(see 'job_event'). If that's missed (i.e. the operator was not watching,
+or the deletion failed) the Pod, and its ConfigMaps, would be left
+in the namespace for good. The sweeper lists the finished Job Pods
+periodically (in pages, selected by the API server using their labels
+and phase) and deletes those that finished long enough ago that they
+should have been deleted already. Pods with a 'debug' label are never
+selected. Given namespaces, the Pods in each are listed separately.
+
+The Pods are deleted in batches, one batch at a time,
+using the operator's (rate-limited) deletion function.
+"""
+import asyncio
+import functools
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import aiohttp
+import kubernetes_asyncio
+
+import api_response
+import cache
+import job_status
+import metrics
+
+# Errors we expect (and survive) when sweeping
+_API_ERRORS = (
+    kubernetes_asyncio.client.exceptions.ApiException,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+)
+
+
+class Sweeper:
+    """Deletes (every 'interval_s') the finished Pods selected by
+    'label_selector' in 'namespaces' (all namespaces if there are none)
+    that finished at least
+    'min_age_s' ago. An interval of 0 (or less) means Pods are not swept.
+
+    'when' is called with each Pod's name and namespace and returns
+    True if it can be deleted. 'delete_fn' is called (and awaited)
+    with each Pod that is to be deleted, 'batch_size' at a time.
+    """
+
+    def __init__(
+        self,
+        label_selector: str,
+        when: Callable[[str, str], bool],
+        delete_fn: Callable[[Dict[str, Any]], Awaitable[None]],
+        min_age_s: float,
+        interval_s: float,
+        namespaces: Sequence[str] = (),
+        page_size: int = 500,
+        batch_size: int = 50,
+    ):
+        self.label_selector: str = f"{label_selector},!debug"
+        self.namespaces: List[str] = list(namespaces)
+        self.min_age_s: float = min_age_s
+        self.interval_s: float = interval_s
+        self.page_size: int = page_size
+        self.batch_size: int = batch_size
+        self._when = when
+        self._delete_fn = delete_fn
+        self._api: Optional[kubernetes_asyncio.client.CoreV1Api] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        """True if Pods are swept."""
+        return self.interval_s > 0
+
+    async def start(self, api_client: kubernetes_asyncio.client.ApiClient) -> None:
+        """Starts sweeping (in a background task)."""
+        if not self.enabled:
+            return
+        self._api = kubernetes_asyncio.client.CoreV1Api(api_client)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops sweeping."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._api = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_s)
+            try:
+                await self.sweep()
+            except _API_ERRORS as ex:
+                logging.warning("Pod sweep failed (%s)", ex)
+
+    async def sweep(self) -> int:
+        """Lists the finished Pods (in pages), deleting those that
+        should have been deleted already. The number deleted is returned.
+        """
+        swept: int = 0
+        for namespace in self.namespaces or [""]:
+            swept += await self._sweep(namespace)
+        if swept:
+            logging.warning("Swept %s finished Job Pods", swept)
+        return swept
+
+    async def _sweep(self, namespace: str) -> int:
+        """Sweeps the namespace ('' for all namespaces)."""
+        assert self._api
+        list_fn: Callable[..., Awaitable[Any]] = (
+            functools.partial(self._api.list_namespaced_pod, namespace)
+            if namespace
+            else self._api.list_pod_for_all_namespaces
+        )
+        swept: int = 0
+        continue_token: Optional[str] = None
+        while True:
+            response = await list_fn(
+                label_selector=self.label_selector,
+                field_selector=cache.FINISHED_FIELD_SELECTOR,
+                limit=self.page_size,
+                _continue=continue_token,
+                _preload_content=False,
+            )
+            pods: Dict[str, Any] = await api_response.read_json(response)
+            missed: List[Dict[str, Any]] = [
+                pod for pod in pods["items"] if self._missed(pod)
+            ]
+            for start in range(0, len(missed), self.batch_size):
+                batch: List[Dict[str, Any]] = missed[start : start + self.batch_size]
+                await asyncio.gather(*[self._delete_fn(pod) for pod in batch])
+                swept += len(batch)
+                metrics.SWEPT_PODS.inc(len(batch))
+            continue_token = pods["metadata"].get("continue")
+            if not continue_token:
+                return swept
+
+    def _missed(self, pod: Dict[str, Any]) -> bool:
+        """True if the (finished) Pod should have been deleted already."""
+        metadata: Dict[str, Any] = pod["metadata"]
+        if not self._when(metadata["name"], metadata["namespace"]):
+            return False
+        # Pods that failed before they ran have no finish time
+        age_s: Optional[float] = job_status.age_s(
+            job_status.from_pod(pod).get("finishedTime")
+            or metadata.get("creationTimestamp")
+        )
+        return age_s is not None and age_s >= self.min_age_s
@@ -0,0 +1,375 @@
+"""Templates for the Kubernetes objects the operator creates for a Job.
+
+The parts of a Job's Pod (and Nextflow configuration) that are the same
+for every Job (the service account, node selector, default resources,
+security context and project volume) are built once, when the templates
+are created. Each Job's objects are then built by overlaying the Job's
+own fields (from the Data Manager's 'imDataManager' material)
+onto these frozen parts.
+
+Frozen parts are shared by the objects of every Job, not copied,
+and must not be modified. The rest of each object is the Job's own
+(see test_templates.py).
+"""
+import os
+import re
+import shlex
+from typing import Any, Dict, List, Optional, Tuple
+
+# The Nextflow kubernetes config file.
+# A ConfigMap written into the working directory, or root.
+nextflow_config: str = """
+process {
+  pod = [ %(extra_pod_settings)s
+          [nodeSelector: '%(selector_key)s=%(selector_value)s'],
+          [label: 'data-manager.informaticsmatters.com/instance-id',
+           value: '%(name)s'] ]
+}
+executor {
+  name = 'k8s'
+  queueSize = %(executor_queue_size)s
+}
+k8s {
+  computeResourceType = 'Job'
+  serviceAccount = '%(sa)s'
+  securityContext: [runAsUser: %(user)s, runAsGroup: %(group)s, fsGroup: 0]
+  storageClaimName = '%(claim_name)s'
+  storageMountPath = '%(project_mount)s'
+  storageSubPath = '%(project_id)s'
+  workDir = '%(project_mount)s/.%(name)s/work'
+}
+"""
+
+# The nextflow config variables that differ between Jobs
+_NF_JOB_VARIABLES: List[str] = [
+    "extra_pod_settings",
+    "claim_name",
+    "name",
+    "project_id",
+    "project_mount",
+    "user",
+    "group",
+]
+
+# Commands without quotes or escapes are split on (shlex) whitespace,
+# which gives the same result as 'shlex.split()' in a fraction of the time.
+_SHLEX_SPECIAL: re.Pattern = re.compile(r"['\"\\]")
+_SHLEX_WHITESPACE: re.Pattern = re.compile(r"[ \t\r\n]+")
+
+
+def split_command(command: str) -> List[str]:
+    """Splits a command string into the Kubernetes command array
+    using the rules of the Python shlex module - i.e. one that honours quotes.
+    i.e. 'echo "Hello, world"' becomes ['echo', 'Hello, world']
+    """
+    if _SHLEX_SPECIAL.search(command):
+        return shlex.split(command)
+    return [item for item in _SHLEX_WHITESPACE.split(command) if item]
+
+
+def file_objects(
+    name: str, image_files: List[Dict[str, str]], pack: bool, max_bytes: int
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Returns the ConfigMaps, Pod volumes and container volume mounts
+    needed to inject the given files into the Job's container.
+
+    Files are either written to a ConfigMap (and volume) each or,
+    if 'pack' is set, packed into ConfigMaps (of no more than 'max_bytes'
+    of content) that are mounted using a single projected volume.
+    """
+    configmaps: List[Dict[str, Any]] = []
+    volumes: List[Dict[str, Any]] = []
+    mounts: List[Dict[str, Any]] = []
+
+    if not pack:
+        file_number: int = 0
+        for image_file in image_files:
+            file_number += 1
+            file_name: str = os.path.basename(image_file["name"])
+            cm_name: str = f"{name}-file-{file_number}"
+            configmaps.append(
+                {
+                    "apiVersion": "v1",
+                    "kind": "ConfigMap",
+                    "metadata": {
+                        "name": cm_name,
+                        "labels": {"app": name},
+                        "annotations": {"origin": image_file["origin"]},
+                    },
+                    "data": {file_name: image_file["content"]},
+                }
+            )
+            volumes.append(
+                {"name": f"file-{file_number}", "configMap": {"name": cm_name}}
+            )
+            mounts.append(
+                {
+                    "name": f"file-{file_number}",
+                    "mountPath": image_file["name"],
+                    "subPath": file_name,
+                }
+            )
+        return configmaps, volumes, mounts
+
+    # Packed.
+    # Files are written using the key 'file-<n>'
+    # (basenames may not be unique) and their origin is recorded
+    # using a corresponding 'origin-file-<n>' annotation.
+    # A new ConfigMap is started when the current one is full.
+    packed_bytes: int = 0
+    file_number = 0
+    for image_file in image_files:
+        file_number += 1
+        key: str = f"file-{file_number}"
+        file_bytes: int = len(image_file["content"].encode("utf-8"))
+        if not configmaps or packed_bytes + file_bytes > max_bytes:
+            configmaps.append(
+                {
+                    "apiVersion": "v1",
+                    "kind": "ConfigMap",
+                    "metadata": {
+                        "name": f"{name}-files-{len(configmaps) + 1}",
+                        "labels": {"app": name},
+                        "annotations": {},
+                    },
+                    "data": {},
+                }
+            )
+            packed_bytes = 0
+        configmaps[-1]["metadata"]["annotations"][f"origin-{key}"] = image_file[
+            "origin"
+        ]
+        configmaps[-1]["data"][key] = image_file["content"]
+        packed_bytes += file_bytes
+        mounts.append(
+            {"name": "files", "mountPath": image_file["name"], "subPath": key}
+        )
+
+    if configmaps:
+        volumes.append(
+            {
+                "name": "files",
+                "projected": {
+                    "sources": [
+                        {"configMap": {"name": configmap["metadata"]["name"]}}
+                        for configmap in configmaps
+                    ]
+                },
+            }
+        )
+    return configmaps, volumes, mounts
+
+
+class JobTemplates:
+    """Builds the Pod and Nextflow configuration for a Job."""
+
+    def __init__(
+        self,
+        service_account: str,
+        node_selector_key: str,
+        node_selector_value: str,
+        nf_executor_queue_size: int,
+        default_cpu: str,
+        default_memory: str,
+        default_user_id: int,
+        default_group_id: int,
+        default_project_mount: str,
+        default_project_claim_name: str,
+    ):
+        self._default_cpu: str = default_cpu
+        self._default_memory: str = default_memory
+        self._default_user_id: int = default_user_id
+        self._default_group_id: int = default_group_id
+        self._default_project_mount: str = default_project_mount
+        self._default_project_claim_name: str = default_project_claim_name
+
+        # The Pod spec, without the Job's container, volumes
+        # or security context.
+        self._pod_spec: Dict[str, Any] = {
+            "serviceAccountName": service_account,
+            "nodeSelector": {node_selector_key: node_selector_value},
+            "restartPolicy": "Never",
+        }
+        self._default_resources: Dict[str, Dict[str, str]] = self._resources({})
+        self._default_security_context: Dict[str, int] = self._security_context({})
+        self._default_project_volume: Dict[str, Any] = self._project_volume(
+            default_project_claim_name
+        )
+
+        # The nextflow config, with the operator-wide variables replaced.
+        # The Job variables are left for 'nextflow_config()'.
+        nf_variables: Dict[str, Any] = {
+            "executor_queue_size": nf_executor_queue_size,
+            "sa": service_account,
+            "selector_key": node_selector_key,
+            "selector_value": node_selector_value,
+        }
+        for variable, value in nf_variables.items():
+            nf_variables[variable] = str(value).replace("%", "%%")
+        for variable in _NF_JOB_VARIABLES:
+            nf_variables[variable] = f"%({variable})s"
+        self._nextflow_config: str = nextflow_config % nf_variables
+
+    def _resources(self, resources: Dict[str, Any]) -> Dict[str, Dict[str, str]]:
+        """Returns the container resources, using defaults for any
+        requests or limits that are not provided.
+        """
+        requests: Dict[str, Any] = resources.get("requests", {})
+        limits: Dict[str, Any] = resources.get("limits", {})
+        return {
+            "requests": {
+                "cpu": f"{requests.get('cpu', self._default_cpu)}",
+                "memory": f"{requests.get('memory', self._default_memory)}",
+            },
+            "limits": {
+                "cpu": f"{limits.get('cpu', self._default_cpu)}",
+                "memory": f"{limits.get('memory', self._default_memory)}",
+            },
+        }
+
+    def _user_and_group(self, security_context: Dict[str, Any]) -> Tuple[int, int]:
+        """Returns the Job's user and group IDs."""
+        return (
+            security_context.get("runAsUser", self._default_user_id),
+            security_context.get("runAsGroup", self._default_group_id),
+        )
+
+    def _security_context(self, security_context: Dict[str, Any]) -> Dict[str, int]:
+        """Returns the Pod security context."""
+        user_id, group_id = self._user_and_group(security_context)
+        return {"runAsUser": user_id, "runAsGroup": group_id, "fsGroup": 0}
+
+    @staticmethod
+    def _project_volume(claim_name: str) -> Dict[str, Any]:
+        return {"name": "project", "persistentVolumeClaim": {"claimName": claim_name}}
+
+    def nextflow_config(self, name: str, material: Dict[str, Any]) -> str:
+        """Returns the Job's Nextflow configuration file."""
+        # Do we need to provide extra Pod declaration settings?
+        # For example, is there an image-pull-secret - if so
+        # we add it to the nextflow.config to ensure all nextflow processes
+        # have access to it.
+        extra_pod_settings: str = ""
+        pull_secret: str = material.get("pullSecret", "")
+        if pull_secret:
+            extra_pod_settings = f"[imagePullSecret: '{pull_secret}'],\n"
+        project: Dict[str, Any] = material["project"]
+        user_id, group_id = self._user_and_group(material.get("securityContext", {}))
+        return self._nextflow_config % {
+            "extra_pod_settings": extra_pod_settings,
+            "claim_name": project.get("claimName", self._default_project_claim_name),
+            "name": name,
+            "project_id": project["id"],
+            "project_mount": material.get("projectMount", self._default_project_mount),
+            "user": user_id,
+            "group": group_id,
+        }
+
+    def pod(
+        self,
+        name: str,
+        material: Dict[str, Any],
+        nf_config_name: Optional[str] = None,
+        volumes: Optional[List[Dict[str, Any]]] = None,
+        volume_mounts: Optional[List[Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        """Returns the Job's Pod.
+        If there's a Nextflow ConfigMap it's mounted in the working directory,
+        followed by any other volumes (and mounts).
+        """
+        # Get the image tag - to automate the pull policy setting.
+        # 'latest' and 'stable' images are always pulled,
+        # all others are 'IfNotPresent'
+        image: str = material["image"]
+        image_parts: List[str] = image.split(":")
+        image_tag: str = "latest" if len(image_parts) == 1 else image_parts[1]
+        image_pull_policy: str = (
+            "Always" if image_tag.lower() in ["latest", "stable"] else "IfNotPresent"
+        )
+
+        # Job working directory (including any sub-path).
+        # We mount the nextflow config on this path.
+        working_path: str = material["workingDirectory"]
+        working_sub_path: Optional[str] = material.get("workingSubPath")
+        if working_sub_path:
+            working_path += f"/{working_sub_path}"
+
+        project: Dict[str, Any] = material["project"]
+        project_mount: str = material.get("projectMount", self._default_project_mount)
+        claim_name: str = project.get("claimName", self._default_project_claim_name)
+
+        # Additional labels and environment?
+        # Provided by the DM as arrays of strings of the form '<KEY>=<VALUE>'
+        labels: Dict[str, str] = {}
+        for label in material.get("labels", []):
+            key, value = label.split("=")
+            labels[key] = value
+        env: List[Dict[str, str]] = [
+            {"name": "NXF_WORK", "value": f"{project_mount}/.{name}/work"}
+        ]
+        for environment in material.get("environment", []):
+            key, value = environment.split("=")
+            env.append({"name": key, "value": value})
+
+        # Instructed to debug the Job?
+        # If so we add a DEBUG label,
+        # which prevents our 'on.event' handler from deleting the Pod.
+        if material.get("debug"):
+            labels["debug"] = "yes"
+
+        # Volumes (and mounts),
+        # the project, any nextflow config and then the others.
+        pod_volumes: List[Dict[str, Any]] = [
+            self._default_project_volume
+            if claim_name == self._default_project_claim_name
+            else self._project_volume(claim_name)
+        ]
+        pod_volume_mounts: List[Dict[str, Any]] = [
+            {"name": "project", "mountPath": project_mount, "subPath": project["id"]}
+        ]
+        if nf_config_name:
+            pod_volumes.append(
+                {"name": "nf-config", "configMap": {"name": nf_config_name}}
+            )
+            pod_volume_mounts.append(
+                {
+                    "name": "nf-config",
+                    "mountPath": f"{working_path}/nextflow.config",
+                    "subPath": "nextflow.config",
+                }
+            )
+        pod_volumes.extend(volumes or [])
+        pod_volume_mounts.extend(volume_mounts or [])
+
+        spec: Dict[str, Any] = {
+            **self._pod_spec,
+            "containers": [
+                {
+                    "name": name,
+                    "image": image,
+                    "command": split_command(material["command"]),
+                    "workingDir": working_path,
+                    "imagePullPolicy": image_pull_policy,
+                    "terminationMessagePolicy": "FallbackToLogsOnError",
+                    "env": env,
+                    "resources": self._resources(material["resources"])
+                    if "resources" in material
+                    else self._default_resources,
+                    "volumeMounts": pod_volume_mounts,
+                }
+            ],
+            "securityContext": self._security_context(material["securityContext"])
+            if "securityContext" in material
+            else self._default_security_context,
+            "volumes": pod_volumes,
+        }
+        pull_secret: str = material.get("pullSecret", "")
+        if pull_secret:
+            spec["imagePullSecrets"] = [{"name": pull_secret}]
+
+        return {
+            "kind": "Pod",
+            "apiVersion": "v1",
+            "metadata": {"name": name, "labels": labels},
+            "spec": spec,
+        }
@@ -0,0 +1,121 @@
+"""A local (HTTP) stand-in for the Kubernetes API server.
+
+The operator's real API client talks to it, so tests can check
+what is actually sent (i.e. the content type of a patch).
+"""
+import inspect
+import json
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Pattern, Tuple
+
+from aiohttp import web
+import kubernetes_asyncio
+
+
+class Request(NamedTuple):
+    """A request received by the server."""
+
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]
+    body: Any
+
+
+# A route's handler, called with a request (and the groups matched in its path)
+# that returns (or, if it's a coroutine, resolves to) the response's status
+# and (JSON) body
+Handler = Callable[..., Any]
+
+
+class ApiServer:
+    """Serves the routes it's given, recording every request.
+    Requests that match no route are answered with a 404.
+
+    Used as an asynchronous context manager,
+    it provides an API client that uses the server.
+    """
+
+    def __init__(self) -> None:
+        self.requests: List[Request] = []
+        self._routes: List[Tuple[str, Pattern, Handler]] = []
+        self._runner: Optional[web.AppRunner] = None
+        self._api_client: Optional[kubernetes_asyncio.client.ApiClient] = None
+
+    def route(self, method: str, path: str, handler: Handler) -> None:
+        """Adds a route, for requests whose path matches 'path' (a regex)."""
+        self._routes.append((method, re.compile(f"^{path}$"), handler))
+
+    def sent(self, method: str, path: str) -> List[Request]:
+        """The requests received for the given method and path (a regex)."""
+        pattern: Pattern = re.compile(f"^{path}$")
+        return [
+            request
+            for request in self.requests
+            if request.method == method and pattern.match(request.path)
+        ]
+
+    async def _handle(self, http_request: web.Request) -> web.Response:
+        raw: bytes = await http_request.read()
+        request = Request(
+            http_request.method,
+            http_request.path,
+            dict(http_request.query),
+            dict(http_request.headers),
+            json.loads(raw) if raw else None,
+        )
+        self.requests.append(request)
+        for method, pattern, handler in self._routes:
+            match = pattern.match(request.path)
+            if method == request.method and match:
+                response: Any = handler(request, *match.groups())
+                if inspect.isawaitable(response):
+                    response = await response
+                code, body = response
+                return web.json_response(body, status=code)
+        return web.json_response(status(404, "NotFound"), status=404)
+
+    async def __aenter__(self) -> kubernetes_asyncio.client.ApiClient:
+        app = web.Application()
+        app.router.add_route("*", "/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port: int = self._runner.addresses[0][1]
+        configuration = kubernetes_asyncio.client.Configuration(
+            host=f"http://127.0.0.1:{port}"
+        )
+        self._api_client = kubernetes_asyncio.client.ApiClient(configuration)
+        return self._api_client
+
+    async def __aexit__(self, *_: Any) -> None:
+        if self._api_client:
+            await self._api_client.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+
+def status(code: int, reason: str) -> Dict[str, Any]:
+    """A (failure) Status object."""
+    return {
+        "apiVersion": "v1",
+        "kind": "Status",
+        "status": "Failure",
+        "reason": reason,
+        "code": code,
+    }
+
+
+def object_list(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """A list (of objects) response."""
+    return {"items": items, "metadata": {"resourceVersion": "1"}}
+
+
+def merge_patch_only(request: Request) -> Optional[Tuple[int, Any]]:
+    """Rejects a patch (of a custom object) that's not a JSON merge patch,
+    as the API server does, returning the response (or None if it's fine).
+    """
+    if request.headers.get("Content-Type") != "application/merge-patch+json":
+        return 415, status(415, "UnsupportedMediaType")
+    return None
@@ -0,0 +1,11 @@
+"""The operator's tests.
+
+The operator's modules are not a package, they're imported
+(as kopf does) from the operator directory.
+"""
+import os
+import sys
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "operator")
+)
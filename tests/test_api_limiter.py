@@ -0,0 +1,111 @@
+"""Tests of the API rate limits (api_limiter.py)."""
+import asyncio
+import types
+from typing import List
+
+import api_limiter
+from api_limiter import ApiLimiter, TokenBucket
+
+
+class _Clock:
+    """A clock that only moves when it's slept on."""
+
+    def __init__(self) -> None:
+        self.now: float = 0.0
+
+    def monotonic(self) -> float:
+        """The current time (seconds)."""
+        return self.now
+
+    async def sleep(self, delay_s: float) -> None:
+        """Moves the clock on (and lets other tasks run)."""
+        self.now += delay_s
+        await asyncio.sleep(0)
+
+
+def _use_clock(monkeypatch) -> _Clock:
+    """Replaces the limiter's clock (and sleep) with a _Clock."""
+    clock = _Clock()
+    monkeypatch.setattr(
+        api_limiter, "time", types.SimpleNamespace(monotonic=clock.monotonic)
+    )
+    monkeypatch.setattr(
+        api_limiter,
+        "asyncio",
+        types.SimpleNamespace(
+            sleep=clock.sleep, Lock=asyncio.Lock, Semaphore=asyncio.Semaphore
+        ),
+    )
+    return clock
+
+
+def test_calls_beyond_the_burst_wait_for_the_rate(monkeypatch):
+    """A burst of calls is allowed immediately, later calls wait (in turn)
+    for tokens added at the rate, and the bucket refills to the burst.
+    """
+    clock = _use_clock(monkeypatch)
+
+    async def run() -> List[float]:
+        bucket = TokenBucket(rate=2.0, burst=3)
+        waits: List[float] = list(
+            await asyncio.gather(*[bucket.acquire() for _ in range(5)])
+        )
+        assert clock.now == 1.0
+        assert bucket.level == 0.0
+        assert (bucket.acquired, bucket.waits, bucket.wait_s_total) == (5, 2, 1.0)
+
+        clock.now += 1.0
+        assert bucket.level == 2 / 3
+        clock.now += 60.0
+        assert bucket.level == 1.0
+        return waits
+
+    assert asyncio.run(run()) == [0.0, 0.0, 0.0, 0.5, 0.5]
+
+
+def test_no_rate_is_no_limit(monkeypatch):
+    """A bucket without a rate never waits."""
+    clock = _use_clock(monkeypatch)
+
+    async def run() -> List[float]:
+        bucket = TokenBucket(rate=0.0, burst=1)
+        return list(await asyncio.gather(*[bucket.acquire() for _ in range(10)]))
+
+    assert asyncio.run(run()) == [0.0] * 10
+    assert clock.now == 0.0
+
+
+def test_calls_in_flight_are_capped():
+    """No more than 'max_in_flight' calls are in progress at once,
+    the others wait for one to finish.
+    """
+    running: List[int] = []
+    finish: List[asyncio.Event] = []
+
+    async def api_fn(number: int) -> int:
+        running.append(number)
+        await finish[number].wait()
+        running.remove(number)
+        return number
+
+    async def run() -> List[int]:
+        finish.extend(asyncio.Event() for _ in range(5))
+        limiter = ApiLimiter()
+        limiter.configure(max_in_flight=2)
+        calls = asyncio.gather(
+            *[limiter.call("create", api_fn, number) for number in range(5)]
+        )
+        await asyncio.sleep(0.01)
+        assert (running, limiter.in_flight) == ([0, 1], 2)
+
+        finish[1].set()
+        await asyncio.sleep(0.01)
+        assert (running, limiter.in_flight) == ([0, 2], 2)
+
+        for event in finish:
+            event.set()
+        results: List[int] = list(await calls)
+        assert limiter.in_flight == 0
+        return results
+
+    assert asyncio.run(run()) == [0, 1, 2, 3, 4]
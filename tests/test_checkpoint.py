@@ -0,0 +1,27 @@
+"""Tests of the watch checkpoint (checkpoint.py)."""
+import asyncio
+import json
+from typing import Dict, Optional
+
+from checkpoint import Checkpoint
+
+
+def test_versions_are_saved_by_namespace(tmp_path):
+    """A watch's versions are saved (and loaded) by namespace."""
+    path: str = str(tmp_path / "checkpoint.json")
+
+    async def run(versions: Dict[str, Optional[str]]) -> Dict[str, str]:
+        checkpoint = Checkpoint("file", "checkpoint", "operator", path)
+        await checkpoint.start(None)
+        loaded: Dict[str, str] = checkpoint.watch_versions("pods")
+        checkpoint.track("pods", lambda: versions)
+        await checkpoint.stop()
+        return loaded
+
+    assert not asyncio.run(run({"a": "3", "b": None}))
+    with open(path, "r", encoding="utf-8") as checkpoint_file:
+        assert json.load(checkpoint_file) == {"pods.a": "3"}
+
+    assert asyncio.run(run({"": "4"})) == {"a": "3"}
+    with open(path, "r", encoding="utf-8") as checkpoint_file:
+        assert json.load(checkpoint_file) == {"pods.a": "3", "pods": "4"}
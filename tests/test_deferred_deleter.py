@@ -0,0 +1,66 @@
+"""Tests of the deferred deletion of Jobs (deferred_deleter.py)."""
+import asyncio
+from typing import List, Optional, Tuple
+
+from deferred_deleter import DeferredDeleter
+
+
+def test_deleted_jobs_are_not_pending():
+    """Only deletions yet to finish are pending,
+    deleted Pods are remembered (but not counted).
+    """
+
+    async def run() -> None:
+        deleted: List[str] = []
+
+        async def delete_fn(name: str, namespace: str, configmaps) -> None:
+            del namespace, configmaps
+            deleted.append(name)
+
+        deleter = DeferredDeleter(delete_fn)
+        assert deleter.schedule("ns", "a", None, 0.01)
+        assert deleter.schedule("ns", "b", None, 10)
+        assert len(deleter) == 2
+        await asyncio.sleep(0.05)
+
+        assert deleted == ["a"]
+        assert len(deleter) == 1
+        assert ("ns", "a") in deleter
+        assert not deleter.schedule("ns", "a", None, 0)
+        assert deleter.cancel_all() == 1
+        assert ("ns", "a") not in deleter
+
+    asyncio.run(run())
+
+
+def test_failed_deletions_are_retried():
+    """A deletion that fails is retried (after a delay) until it succeeds,
+    or is abandoned after the maximum number of attempts.
+    """
+
+    async def run() -> None:
+        attempts: List[Tuple[str, Optional[List[str]]]] = []
+
+        async def delete_fn(name: str, namespace: str, configmaps) -> None:
+            del namespace
+            attempts.append((name, configmaps))
+            if name == "bad" or len(attempts) < 3:
+                raise asyncio.TimeoutError()
+
+        deleter = DeferredDeleter(
+            delete_fn, backoff_base_s=0.01, backoff_max_s=0.02, max_attempts=3
+        )
+        deleter.schedule("ns", "good", ["good-cm"], 0, drained=True)
+        await asyncio.sleep(0.1)
+        assert attempts == [("good", ["good-cm"])] * 3
+        assert len(deleter) == 0
+
+        attempts.clear()
+        deleter.schedule("ns", "bad", None, 0, drained=True)
+        assert len(deleter) == 1
+        await asyncio.sleep(0.1)
+        assert len(attempts) == 3
+        assert len(deleter) == 0
+        assert ("ns", "bad") in deleter
+
+    asyncio.run(run())
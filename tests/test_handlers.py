@@ -0,0 +1,339 @@
+"""Tests of the operator's handlers (handlers.py),
+against a local stand-in for the API server (see api_server.py).
+"""
+# The tests use the handlers' private state
+# pylint: disable=protected-access
+import asyncio
+import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import aiohttp
+import kopf
+import kubernetes_asyncio
+
+from api_server import ApiServer, Request, merge_patch_only, object_list
+import cache
+from deferred_deleter import DeferredDeleter
+import handlers
+from leadership import Leadership
+from sharding import Shards
+
+# The API paths of the DataManagerJobs
+_JOBS_PATH: str = "/apis/squonk.it/v3/datamanagerjobs"
+_JOB_PATH: str = "/apis/squonk.it/v3/namespaces/([^/]+)/datamanagerjobs/([^/]+)"
+
+
+def _job(name: str, handled: bool = False) -> Dict[str, Any]:
+    """A DataManagerJob (that's been handled, or not)."""
+    annotations: Dict[str, str] = (
+        {handlers._KOPF_LAST_HANDLED_ANNOTATION: "{}"} if handled else {}
+    )
+    return {
+        "apiVersion": "squonk.it/v3",
+        "kind": "DataManagerJob",
+        "metadata": {"name": name, "namespace": "ns", "annotations": annotations},
+    }
+
+
+def _patch_job(request: Request, namespace: str, name: str) -> Tuple[int, Any]:
+    """Patches a DataManagerJob, if the patch is a merge patch."""
+    return merge_patch_only(request) or (
+        200,
+        {"metadata": {"name": name, "namespace": namespace}, **request.body},
+    )
+
+
+async def _delete_job(namespace: str, name: str, configmaps: Any) -> None:
+    """Deletes nothing (the tests only look at what's scheduled)."""
+    del namespace, name, configmaps
+
+
+def _run_with_api(server: ApiServer, test_fn: Callable[[], Awaitable[None]]) -> None:
+    """Runs the test with the handlers using the server."""
+
+    async def run() -> None:
+        async with server as api_client:
+            handlers._CUSTOM_API = kubernetes_asyncio.client.CustomObjectsApi(
+                api_client
+            )
+            try:
+                await test_fn()
+            finally:
+                handlers._CUSTOM_API = None
+
+    asyncio.run(run())
+
+
+def test_claims_are_merge_patches():
+    """Unhandled DataManagerJobs are claimed (annotated) using a merge patch."""
+    server = ApiServer()
+    server.route(
+        "GET",
+        _JOBS_PATH,
+        lambda request: (200, object_list([_job("handled", True), _job("new")])),
+    )
+    server.route("PATCH", _JOB_PATH, _patch_job)
+
+    _run_with_api(server, lambda: handlers._claim_jobs(None))
+
+    patches = server.sent("PATCH", _JOB_PATH)
+    assert [patch.path for patch in patches] == [
+        "/apis/squonk.it/v3/namespaces/ns/datamanagerjobs/new"
+    ]
+    assert patches[0].headers["Content-Type"] == "application/merge-patch+json"
+    assert patches[0].body == {
+        "metadata": {"annotations": {handlers._SHARD_ANNOTATION: handlers._SHARD_ID}}
+    }
+
+
+def test_status_is_merge_patched():
+    """The status of a DataManagerJob is written using a merge patch."""
+    server = ApiServer()
+    server.route("PATCH", f"{_JOB_PATH}/status", _patch_job)
+
+    _run_with_api(
+        server, lambda: handlers._patch_job_status("ns", "job", {"phase": "Running"})
+    )
+
+    patches = server.sent("PATCH", ".*")
+    assert [patch.path for patch in patches] == [
+        "/apis/squonk.it/v3/namespaces/ns/datamanagerjobs/job/status"
+    ]
+    assert patches[0].headers["Content-Type"] == "application/merge-patch+json"
+    assert patches[0].body == {"status": {"phase": "Running"}}
+
+
+def _leader_lease(server: ApiServer) -> asyncio.Event:
+    """Serves the Lease of another (the current) leader, returning
+    the Event to set once the leader has released it.
+    """
+    leases_path: str = "/apis/coordination.k8s.io/v1/namespaces/operator/leases"
+    lease: Dict[str, Any] = {
+        "metadata": {"name": "job-operator-leader", "resourceVersion": "1"},
+        "spec": {
+            "holderIdentity": "leader",
+            "leaseDurationSeconds": 15,
+            "renewTime": datetime.datetime.now(datetime.timezone.utc).strftime(
+                "%Y-%m-%dT%H:%M:%S.%fZ"
+            ),
+        },
+    }
+    released: asyncio.Event = asyncio.Event()
+
+    def replace_lease(request: Request) -> Tuple[int, Any]:
+        lease.update(request.body)
+        return 200, lease
+
+    async def watch_lease(request: Request) -> Tuple[int, Any]:
+        assert request.query["watch"] == "True"
+        await released.wait()
+        lease["spec"]["holderIdentity"] = None
+        return 200, {"type": "MODIFIED", "object": lease}
+
+    server.route("GET", f"{leases_path}/job-operator-leader", lambda r: (200, lease))
+    server.route("PUT", f"{leases_path}/job-operator-leader", replace_lease)
+    server.route("GET", leases_path, watch_lease)
+    return released
+
+
+def _finished_pod(name: str) -> Dict[str, Any]:
+    """A (finished) Job Pod."""
+    return {
+        "metadata": {"name": name, "namespace": "ns", "labels": {}},
+        "status": {"phase": "Succeeded"},
+    }
+
+
+def test_standby_claims_jobs_when_elected(monkeypatch):
+    """A standby that takes over (once the leader has released its Lease)
+    claims the DataManagerJobs the leader had not handled.
+    """
+    server = ApiServer()
+    released: asyncio.Event = _leader_lease(server)
+    server.route(
+        "GET",
+        _JOBS_PATH,
+        lambda request: (200, object_list([_job("handled", True), _job("new")])),
+    )
+    server.route("PATCH", _JOB_PATH, _patch_job)
+    server.route("GET", "/api/v1/pods", lambda request: (200, object_list([])))
+    standby = Leadership("standby", True, "operator", 15, handlers._start_claim)
+    monkeypatch.setattr(handlers, "_LEADERSHIP", standby)
+
+    async def failover() -> None:
+        assert handlers._API_CLIENT is None
+        await standby.start(handlers._CUSTOM_API.api_client)
+        assert not standby.is_leader
+        assert not handlers._is_ours("new", "ns")
+
+        # The leader stops (releasing the Lease)
+        released.set()
+        for _ in range(50):
+            if server.sent("PATCH", _JOB_PATH):
+                break
+            await asyncio.sleep(0.1)
+        await standby.stop()
+
+    _run_with_api(server, failover)
+
+    assert standby.leader == "standby"
+    patches = server.sent("PATCH", _JOB_PATH)
+    assert [patch.path for patch in patches] == [
+        "/apis/squonk.it/v3/namespaces/ns/datamanagerjobs/new"
+    ]
+
+
+def test_standby_deletes_finished_pods_when_elected(monkeypatch):
+    """A standby that takes over deletes the Job Pods that finished
+    before it was elected (their completion was seen, and dropped,
+    while the Pods were the leader's).
+    """
+    server = ApiServer()
+    released: asyncio.Event = _leader_lease(server)
+    server.route("GET", _JOBS_PATH, lambda request: (200, object_list([])))
+    server.route(
+        "GET",
+        "/api/v1/pods",
+        lambda request: (200, object_list([_finished_pod("done")])),
+    )
+    standby = Leadership("standby", True, "operator", 15, handlers._start_claim)
+    monkeypatch.setattr(handlers, "_LEADERSHIP", standby)
+    monkeypatch.setattr(handlers, "_DEFERRED_DELETER", DeferredDeleter(_delete_job))
+
+    async def failover() -> None:
+        api_client = handlers._CUSTOM_API.api_client
+        monkeypatch.setattr(
+            handlers._POD_WATCH, "_api", kubernetes_asyncio.client.CoreV1Api(api_client)
+        )
+        await standby.start(api_client)
+        # The Pod finished while it was the leader's
+        await handlers.pod_event("MODIFIED", _finished_pod("done"), "Running")
+        assert ("ns", "done") not in handlers._DEFERRED_DELETER
+
+        released.set()
+        for _ in range(50):
+            if ("ns", "done") in handlers._DEFERRED_DELETER:
+                break
+            await asyncio.sleep(0.1)
+        await standby.stop()
+        handlers._DEFERRED_DELETER.cancel_all()
+
+    _run_with_api(server, failover)
+
+    assert standby.leader == "standby"
+    pod_lists = server.sent("GET", "/api/v1/pods")
+    assert [request.query["fieldSelector"] for request in pod_lists] == [
+        cache.FINISHED_FIELD_SELECTOR
+    ]
+
+
+def test_finished_pods_of_lost_members_are_deleted(monkeypatch):
+    """When shard members are lost, the finished Job Pods that were theirs
+    (and are now ours) are deleted. Those that were already ours are not
+    (their deletion was handled when they finished).
+    """
+    shards = Shards("a", "name", "operator", 15)
+    previous_members: Set[str] = {"a", "b"}
+    names: List[str] = [f"job-{number}" for number in range(8)]
+    theirs: List[str] = [
+        name for name in names if shards.owner(name, "ns", previous_members) == "b"
+    ]
+    assert theirs and len(theirs) < len(names)
+    server = ApiServer()
+    server.route("GET", _JOBS_PATH, lambda request: (200, object_list([])))
+    server.route(
+        "GET",
+        "/api/v1/pods",
+        lambda request: (200, object_list([_finished_pod(name) for name in names])),
+    )
+    monkeypatch.setattr(handlers, "_SHARDS", shards)
+    monkeypatch.setattr(handlers, "_DEFERRED_DELETER", DeferredDeleter(_delete_job))
+
+    async def members_lost() -> None:
+        monkeypatch.setattr(
+            handlers._POD_WATCH,
+            "_api",
+            kubernetes_asyncio.client.CoreV1Api(handlers._CUSTOM_API.api_client),
+        )
+        handlers._start_claim({"b"})
+        await asyncio.gather(*handlers._CLAIM_TASKS)
+        scheduled: List[str] = [
+            name for name in names if ("ns", name) in handlers._DEFERRED_DELETER
+        ]
+        handlers._DEFERRED_DELETER.cancel_all()
+        assert scheduled == theirs
+
+    _run_with_api(server, members_lost)
+
+
+def _api_exception(
+    status: int, headers: Optional[Dict[str, str]] = None
+) -> kubernetes_asyncio.client.exceptions.ApiException:
+    """A failed API call's exception (with the response's headers)."""
+    ex = kubernetes_asyncio.client.exceptions.ApiException(status=status)
+    ex.headers = headers
+    return ex
+
+
+def _retry_settings(monkeypatch) -> None:
+    """Sets the retry backoff (1 to 8 seconds) and the maximum attempts (5)."""
+    monkeypatch.setattr(handlers, "_RETRY_BACKOFF_BASE_S", 1.0)
+    monkeypatch.setattr(handlers, "_RETRY_BACKOFF_MAX_S", 8.0)
+    monkeypatch.setattr(handlers, "_RETRY_MAX_ATTEMPTS", 5)
+
+
+def test_transient_api_failures_are_retried(monkeypatch):
+    """Transient failures (408, 429 and the server's 5xx errors, and failed
+    connections) are retried with a jittered exponential backoff.
+    """
+    _retry_settings(monkeypatch)
+    failures: List[Exception] = [
+        _api_exception(status) for status in [408, 429, 500, 502, 503, 504]
+    ] + [aiohttp.ClientConnectionError(), asyncio.TimeoutError()]
+    for failure in failures:
+        for retry, backoff_s in [(0, 1.0), (1, 2.0), (3, 8.0)]:
+            error = handlers._api_failure(failure, retry)
+            assert isinstance(error, kopf.TemporaryError), failure
+            assert backoff_s / 2 <= error.delay <= backoff_s
+
+
+def test_other_api_failures_are_permanent(monkeypatch):
+    """Other API failures (i.e. a rejected object) are not retried."""
+    _retry_settings(monkeypatch)
+    for status in [400, 401, 403, 404, 409, 422, 501]:
+        error = handlers._api_failure(_api_exception(status), 0)
+        assert isinstance(error, kopf.PermanentError), status
+        assert str(error) == f"ApiException ({status})"
+
+
+def test_retry_after_is_honoured(monkeypatch):
+    """A 429's 'Retry-After' (seconds) delays the retry, if it's longer
+    than the backoff. Other forms of the header (an HTTP date) are ignored.
+    """
+    _retry_settings(monkeypatch)
+    error = handlers._api_failure(_api_exception(429, {"Retry-After": "30"}), 0)
+    assert isinstance(error, kopf.TemporaryError)
+    assert error.delay == 30.0
+
+    error = handlers._api_failure(_api_exception(429, {"Retry-After": "0"}), 3)
+    assert isinstance(error, kopf.TemporaryError)
+    assert 4.0 <= error.delay <= 8.0
+
+    error = handlers._api_failure(
+        _api_exception(429, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}), 0
+    )
+    assert isinstance(error, kopf.TemporaryError)
+    assert 0.5 <= error.delay <= 1.0
+
+
+def test_transient_api_failures_are_permanent_after_the_maximum_attempts(
+    monkeypatch,
+):
+    """A transient failure of the last attempt is permanent."""
+    _retry_settings(monkeypatch)
+    assert isinstance(
+        handlers._api_failure(_api_exception(503), 3), kopf.TemporaryError
+    )
+    error = handlers._api_failure(_api_exception(503), 4)
+    assert isinstance(error, kopf.PermanentError)
+    assert str(error) == "ApiException (503) after 5 attempts"
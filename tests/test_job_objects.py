@@ -0,0 +1,155 @@
+"""Tests of the creation and deletion of Job objects (job_objects.py)."""
+import asyncio
+from typing import Any, Dict, List, Tuple
+
+import kubernetes_asyncio
+
+import cache
+from job_objects import JobObjects
+
+
+class _CoreApi:
+    """Records the calls made. Creations and patches fail with
+    the given statuses (one per call) until there are none left.
+    """
+
+    def __init__(
+        self,
+        create_failures: Tuple[int, ...] = (),
+        patch_failures: Tuple[int, ...] = (),
+    ) -> None:
+        self.calls: List[Tuple[str, Any]] = []
+        self._failures: Dict[str, List[int]] = {
+            "create": list(create_failures),
+            "patch": list(patch_failures),
+        }
+
+    def _call(self, kind: str, call: Tuple[str, Any]) -> None:
+        self.calls.append(call)
+        if self._failures[kind]:
+            raise kubernetes_asyncio.client.exceptions.ApiException(
+                status=self._failures[kind].pop(0)
+            )
+
+    async def create_namespaced_config_map(
+        self, namespace: str, body: Dict[str, Any]
+    ) -> None:
+        """Creates a ConfigMap."""
+        self._call("create", ("create_namespaced_config_map", (namespace, body)))
+
+    async def patch_namespaced_config_map(
+        self, name: str, namespace: str, body: Dict[str, Any]
+    ) -> None:
+        """Patches a ConfigMap."""
+        self._call("patch", ("patch_namespaced_config_map", (namespace, name, body)))
+
+    async def delete_namespaced_pod(self, name: str, namespace: str) -> None:
+        """Deletes a Pod."""
+        self.calls.append(("delete_namespaced_pod", (namespace, name)))
+
+    async def delete_collection_namespaced_config_map(
+        self, namespace: str, label_selector: str
+    ) -> None:
+        """Deletes a collection of ConfigMaps."""
+        self.calls.append(
+            ("delete_collection_namespaced_config_map", (namespace, label_selector))
+        )
+
+
+async def _api_call(kind: str, api_fn: Any, *args: Any, **kwargs: Any) -> Any:
+    del kind
+    return await api_fn(*args, **kwargs)
+
+
+def test_deletions_are_not_skipped_for_objects_not_in_the_cache():
+    """A Job's objects are deleted even if they're not in the cache
+    (it may not have been populated yet).
+    """
+    core_api = _CoreApi()
+    job_objects = JobObjects(_api_call, share_configmaps=False)
+    job_objects.core_api = core_api  # type: ignore
+    cache.use(set())
+    try:
+        asyncio.run(job_objects.delete_job("job", "ns", ["job-nf-config"]))
+    finally:
+        cache.use(None)
+
+    assert sorted(core_api.calls) == [
+        ("delete_collection_namespaced_config_map", ("ns", "app=job")),
+        ("delete_namespaced_pod", ("ns", "job")),
+    ]
+
+
+_OWNER: Dict[str, Any] = {
+    "apiVersion": "squonk.it/v3",
+    "kind": "DataManagerJob",
+    "metadata": {"name": "job", "namespace": "ns", "uid": "job-uid"},
+}
+_OWNER_REFERENCE: Dict[str, Any] = {
+    "apiVersion": "squonk.it/v3",
+    "kind": "DataManagerJob",
+    "name": "job",
+    "uid": "job-uid",
+    "controller": False,
+    "blockOwnerDeletion": False,
+}
+
+
+def _create_shared_configmap(core_api: _CoreApi) -> None:
+    """Creates a shared ConfigMap (named 'shared'), owned by _OWNER."""
+    job_objects = JobObjects(_api_call, share_configmaps=True)
+    job_objects.core_api = core_api  # type: ignore
+    configmap: Dict[str, Any] = {"metadata": {"name": "shared"}, "data": {}}
+    asyncio.run(job_objects.create_configmap("ns", configmap, _OWNER))
+
+
+def test_shared_configmaps_are_created_with_an_owner():
+    """A new shared ConfigMap is created, with a (non-controller) owner."""
+    core_api = _CoreApi()
+    _create_shared_configmap(core_api)
+
+    assert core_api.calls == [
+        (
+            "create_namespaced_config_map",
+            (
+                "ns",
+                {
+                    "metadata": {
+                        "name": "shared",
+                        "ownerReferences": [_OWNER_REFERENCE],
+                    },
+                    "data": {},
+                },
+            ),
+        )
+    ]
+
+
+def test_existing_shared_configmaps_are_given_an_owner():
+    """A shared ConfigMap that exists (409) is patched, adding the owner."""
+    core_api = _CoreApi(create_failures=(409,))
+    _create_shared_configmap(core_api)
+
+    assert [call[0] for call in core_api.calls] == [
+        "create_namespaced_config_map",
+        "patch_namespaced_config_map",
+    ]
+    assert core_api.calls[1][1] == (
+        "ns",
+        "shared",
+        {"metadata": {"ownerReferences": [_OWNER_REFERENCE]}},
+    )
+
+
+def test_shared_configmaps_deleted_before_the_patch_are_created_again():
+    """A shared ConfigMap that exists (409) but has gone by the time
+    it's patched (404) is created again.
+    """
+    core_api = _CoreApi(create_failures=(409,), patch_failures=(404,))
+    _create_shared_configmap(core_api)
+
+    assert [call[0] for call in core_api.calls] == [
+        "create_namespaced_config_map",
+        "patch_namespaced_config_map",
+        "create_namespaced_config_map",
+    ]
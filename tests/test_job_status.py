@@ -0,0 +1,48 @@
+"""Tests of the writing of DataManagerJob status (job_status.py)."""
+import asyncio
+import logging
+from typing import Any, Dict, List
+
+import kubernetes_asyncio
+
+from job_status import StatusWriter
+
+
+def test_rejected_updates_are_dropped_with_a_warning(caplog):
+    """An update the API server rejects (a 4xx) is dropped, and logged
+    as a warning. A transient failure is retried.
+    """
+    patches: List[Dict[str, Any]] = []
+
+    async def patch_fn(namespace: str, name: str, fields: Dict[str, Any]) -> None:
+        del namespace
+        patches.append(fields)
+        if name == "rejected":
+            raise kubernetes_asyncio.client.exceptions.ApiException(
+                status=415, reason="Unsupported Media Type"
+            )
+        if len(patches) == 2:
+            raise kubernetes_asyncio.client.exceptions.ApiException(status=503)
+
+    async def run() -> None:
+        writer = StatusWriter(patch_fn, window_s=0.01)
+        writer.update("ns", "rejected", {"phase": "Running"})
+        await asyncio.sleep(0.05)
+        assert writer.pending == 0
+        writer.update("ns", "retried", {"phase": "Running"})
+        await asyncio.sleep(0.05)
+        assert len(writer) == 1
+
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(run())
+
+    assert patches == [{"phase": "Running"}] * 3
+    messages: List[str] = [record.getMessage() for record in caplog.records]
+    assert len(messages) == 2
+    assert messages[0] == (
+        'Dropped the status update of DataManagerJob "rejected"'
+        " (415 Unsupported Media Type)"
+    )
+    assert messages[1].startswith(
+        'Failed to update the status of DataManagerJob "retried"'
+    )
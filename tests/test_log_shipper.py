@@ -0,0 +1,93 @@
+"""Tests of the Job Pod log capture (log_shipper.py)."""
+# pylint: disable=protected-access
+import asyncio
+import gzip
+import os
+import stat
+from typing import Any, Dict, List, Tuple
+
+import kubernetes_asyncio
+
+from api_server import ApiServer, status
+import log_shipper
+
+
+def _pod() -> Dict[str, Any]:
+    """A Job Pod, whose project is on the 'project' claim."""
+    return {
+        "metadata": {"name": "job", "namespace": "ns"},
+        "spec": {
+            "securityContext": {"runAsUser": 1001, "runAsGroup": 0},
+            "volumes": [
+                {"name": "project", "persistentVolumeClaim": {"claimName": "project"}}
+            ],
+            "containers": [
+                {"volumeMounts": [{"name": "project", "subPath": "project-1"}]}
+            ],
+        },
+    }
+
+
+def test_logs_are_written_outside_the_job_directory(tmp_path):
+    """A log is written to its project's log directory (not the
+    Job's directory) and is given to the Job's user and group.
+    """
+    pod: Dict[str, Any] = _pod()
+    path = log_shipper._log_path(pod, str(tmp_path), "project", "ns")
+    assert path == os.path.join(tmp_path, "project-1", ".job-logs", "job.log.gz")
+    # A claim (of the same name) in another namespace is another volume
+    assert not log_shipper._log_path(pod, str(tmp_path), "project", "other")
+
+    log_file, written = log_shipper._open_log(path, log_shipper._log_owner(pod))
+    log_file.write(b"hello\n")
+    log_file.close()
+    assert written == 0
+    assert not os.path.exists(os.path.join(tmp_path, "project-1", ".job"))
+    for created, mode in [(os.path.dirname(path), 0o775), (path, 0o664)]:
+        status = os.stat(created)
+        assert stat.S_IMODE(status.st_mode) == mode
+        if os.geteuid() == 0:
+            assert (status.st_uid, status.st_gid) == (1001, 0)
+
+    # A complete log is appended to
+    log_file, written = log_shipper._open_log(path, None)
+    log_file.close()
+    assert written == len(b"hello\n")
+
+
+def test_failed_log_requests_are_not_shipped(tmp_path, monkeypatch):
+    """A log request that fails (i.e. a 403) is not captured - its
+    Status is not written as the log, and the Pod is not 'shipped'.
+    """
+    server = ApiServer()
+    server.route(
+        "GET",
+        "/api/v1/namespaces/ns/pods/job/log",
+        lambda request: (403, status(403, "Forbidden")),
+    )
+    shipped: List[Tuple[str, str]] = []
+    shipper = log_shipper.LogShipper(
+        True, str(tmp_path), "project", "ns", 10, lambda *key: shipped.append(key)
+    )
+    pod: Dict[str, Any] = _pod()
+    pod["status"] = {"phase": "Running"}
+
+    async def run() -> None:
+        async with server as api_client:
+            monkeypatch.setattr(
+                kubernetes_asyncio.client.Configuration,
+                "_default",
+                api_client.configuration,
+            )
+            await shipper.start()
+            shipper.observe("ADDED", pod)
+            await asyncio.gather(*shipper._tasks.values())
+            await shipper.stop()
+
+    asyncio.run(run())
+
+    assert not shipper.shipped("ns", "job")
+    assert not shipped
+    path = os.path.join(tmp_path, "project-1", ".job-logs", "job.log.gz")
+    with gzip.open(path, "rb") as log_file:
+        assert log_file.read() == b""
@@ -0,0 +1,204 @@
+"""Tests of the Job Pod watch (pod_watch.py)."""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from api_server import ApiServer, Request, object_list, status
+import cache
+import pod_watch
+
+
+def test_timed_out_watch_requests_are_resumed(caplog, monkeypatch):
+    """A watch request the client ends (it outlived its timeout)
+    is resumed immediately, it's not a failure.
+    """
+    monkeypatch.setattr(pod_watch, "_REQUEST_TIMEOUT_MARGIN_S", 0)
+    pod: Dict[str, Any] = {
+        "metadata": {"name": "job", "namespace": "ns", "resourceVersion": "2"},
+        "status": {"phase": "Running"},
+    }
+
+    async def list_pods(request: Request) -> Tuple[int, Any]:
+        if request.query.get("watch") != "True":
+            return 200, object_list([])
+        watch_number: int = len(server.sent("GET", "/api/v1/pods")) - 1
+        if watch_number == 1:
+            # The first watch request hangs
+            await asyncio.sleep(2)
+        elif watch_number > 2:
+            # Later requests (until we stop) see nothing new
+            await asyncio.sleep(0.1)
+            bookmark: Dict[str, Any] = {"metadata": {"resourceVersion": "3"}}
+            return 200, {"type": "BOOKMARK", "object": bookmark}
+        return 200, {"type": "ADDED", "object": pod}
+
+    server = ApiServer()
+    server.route("GET", "/api/v1/pods", list_pods)
+    events: List[Tuple[str, str, Optional[str]]] = []
+
+    async def on_event(
+        event_type: str, event_pod: Dict[str, Any], previous_phase: Optional[str]
+    ) -> None:
+        events.append((event_type, event_pod["metadata"]["name"], previous_phase))
+
+    watch = pod_watch.PodWatch("job", on_event, timeout_s=1)
+
+    async def run() -> None:
+        async with server as api_client:
+            await watch.start(api_client)
+            for _ in range(30):
+                if events:
+                    break
+                await asyncio.sleep(0.1)
+            await watch.stop()
+
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(run())
+
+    watches: List[Request] = server.sent("GET", "/api/v1/pods")[1:]
+    assert events == [("ADDED", "job", None)]
+    assert watch.resource_versions[""] in ["2", "3"]
+    assert [request.query["resourceVersion"] for request in watches][:2] == ["1", "1"]
+    assert not caplog.records
+
+
+def test_resumed_watches_list_the_finished_pods():
+    """A watch resumed from a checkpoint presents the finished Pods
+    (whose deletion may have been pending) before it resumes.
+    """
+    finished: Dict[str, Any] = {
+        "metadata": {"name": "done", "namespace": "ns", "resourceVersion": "2"},
+        "status": {"phase": "Succeeded"},
+    }
+
+    async def list_pods(request: Request) -> Tuple[int, Any]:
+        if request.query.get("watch") != "True":
+            return 200, object_list([finished])
+        await asyncio.sleep(0.1)
+        bookmark: Dict[str, Any] = {"metadata": {"resourceVersion": "4"}}
+        return 200, {"type": "BOOKMARK", "object": bookmark}
+
+    server = ApiServer()
+    server.route("GET", "/api/v1/pods", list_pods)
+    events: List[Tuple[str, str, Optional[str]]] = []
+
+    async def on_event(
+        event_type: str, event_pod: Dict[str, Any], previous_phase: Optional[str]
+    ) -> None:
+        events.append((event_type, event_pod["metadata"]["name"], previous_phase))
+
+    watch = pod_watch.PodWatch("job", on_event)
+
+    async def run() -> None:
+        async with server as api_client:
+            await watch.start(api_client, {"": "3"})
+            for _ in range(30):
+                if watch.resource_versions[""] == "4":
+                    break
+                await asyncio.sleep(0.1)
+            await watch.stop()
+
+    asyncio.run(run())
+
+    assert events == [("ADDED", "done", None)]
+    lists, first_watch = server.sent("GET", "/api/v1/pods")[:2]
+    assert lists.query["fieldSelector"] == cache.FINISHED_FIELD_SELECTOR
+    assert first_watch.query["resourceVersion"] == "3"
+    assert watch.resource_versions[""] == "4"
+
+
+def test_namespaces_are_watched_separately():
+    """Given namespaces, each is listed and watched (from its own version)."""
+    resumed: List[str] = []
+
+    def pods(request: Request, namespace: str) -> Tuple[int, Any]:
+        if request.query.get("watch") != "True":
+            pod: Dict[str, Any] = {
+                "metadata": {"name": "job", "namespace": namespace},
+                "status": {"phase": "Running"},
+            }
+            return 200, {"items": [pod], "metadata": {"resourceVersion": "5"}}
+        resumed.append(f"{namespace}:{request.query['resourceVersion']}")
+        bookmark: Dict[str, Any] = {"metadata": {"resourceVersion": "6"}}
+        return 200, {"type": "BOOKMARK", "object": bookmark}
+
+    server = ApiServer()
+    server.route("GET", "/api/v1/namespaces/([^/]+)/pods", pods)
+    events: List[Tuple[str, str]] = []
+
+    async def on_event(
+        event_type: str, event_pod: Dict[str, Any], previous_phase: Optional[str]
+    ) -> None:
+        del previous_phase
+        events.append((event_type, event_pod["metadata"]["namespace"]))
+
+    watch = pod_watch.PodWatch("job", on_event, namespaces=["a", "b"])
+
+    async def run() -> None:
+        async with server as api_client:
+            # Only 'a' has a checkpoint
+            await watch.start(api_client, {"a": "3", "": "1"})
+            for _ in range(30):
+                if set(watch.resource_versions.values()) == {"6"}:
+                    break
+                await asyncio.sleep(0.1)
+            await watch.stop()
+
+    asyncio.run(run())
+
+    # 'a' lists its finished Pods, 'b' lists all of its Pods
+    assert sorted(events) == [("ADDED", "a"), ("ADDED", "b")]
+    assert resumed[:2] == ["a:3", "b:5"] or resumed[:2] == ["b:5", "a:3"]
+    assert not server.sent("GET", "/api/v1/pods")
+
+
+def test_failed_list_pages_are_retried(caplog, monkeypatch):
+    """A list that fails (the API server responds with a Status)
+    is retried, it does not end the watch.
+    """
+    monkeypatch.setattr(pod_watch, "_RETRY_DELAY_S", 0)
+    pod: Dict[str, Any] = {
+        "metadata": {"name": "job", "namespace": "ns"},
+        "status": {"phase": "Running"},
+    }
+
+    async def list_pods(request: Request) -> Tuple[int, Any]:
+        if request.query.get("watch") == "True":
+            await asyncio.sleep(0.1)
+            bookmark: Dict[str, Any] = {"metadata": {"resourceVersion": "1"}}
+            return 200, {"type": "BOOKMARK", "object": bookmark}
+        if len(server.sent("GET", "/api/v1/pods")) == 1:
+            return 500, status(500, "InternalError")
+        return 200, object_list([pod])
+
+    server = ApiServer()
+    server.route("GET", "/api/v1/pods", list_pods)
+    events: List[Tuple[str, str, Optional[str]]] = []
+
+    async def on_event(
+        event_type: str, event_pod: Dict[str, Any], previous_phase: Optional[str]
+    ) -> None:
+        events.append((event_type, event_pod["metadata"]["name"], previous_phase))
+
+    watch = pod_watch.PodWatch("job", on_event)
+
+    async def run() -> None:
+        async with server as api_client:
+            await watch.start(api_client)
+            for _ in range(30):
+                if watch.resource_versions[""]:
+                    break
+                await asyncio.sleep(0.1)
+            await watch.stop()
+
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(run())
+
+    assert events == [("ADDED", "job", None)]
+    lists: List[Request] = [
+        request
+        for request in server.sent("GET", "/api/v1/pods")
+        if "watch" not in request.query
+    ]
+    assert len(lists) == 2
+    assert caplog.records[0].getMessage().startswith("Pod watch failed ((500)")
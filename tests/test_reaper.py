@@ -0,0 +1,162 @@
+"""Tests of the reaping of orphaned Job ConfigMaps (reaper.py)."""
+import asyncio
+import datetime
+from typing import Any, Dict, List, Tuple
+
+from api_server import ApiServer, Request, object_list, status
+from reaper import ConfigMapReaper
+
+
+def _configmap(app: str, age_s: float, owned: bool = True) -> Dict[str, Any]:
+    """A Job ConfigMap (owned by its DataManagerJob, or not) of the given age."""
+    created: datetime.datetime = datetime.datetime.now(
+        datetime.timezone.utc
+    ) - datetime.timedelta(seconds=age_s)
+    owners: List[Dict[str, Any]] = (
+        [{"kind": "DataManagerJob", "name": app, "uid": app}] if owned else []
+    )
+    return {
+        "metadata": {
+            "name": f"{app}-{age_s}",
+            "namespace": "ns",
+            "labels": {"app": app},
+            "creationTimestamp": created.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "ownerReferences": owners,
+        }
+    }
+
+
+def test_configmaps_of_jobs_without_pods_are_reaped():
+    """The (owned) ConfigMaps of Jobs without a Pod are reaped,
+    once the newest of them is older than the grace period.
+    """
+    server = ApiServer()
+    server.route(
+        "GET",
+        "/api/v1/configmaps",
+        lambda request: (
+            200,
+            object_list(
+                [
+                    _configmap("orphan", 7200),
+                    _configmap("orphan", 3700),
+                    _configmap("running", 7200),
+                    _configmap("new", 7200),
+                    _configmap("new", 60),
+                    _configmap("other", 7200, owned=False),
+                ]
+            ),
+        ),
+    )
+    server.route(
+        "GET",
+        "/api/v1/pods",
+        lambda request: (
+            200,
+            object_list([{"metadata": {"name": "running", "namespace": "ns"}}]),
+        ),
+    )
+    reaped: List[Tuple[str, List[str]]] = []
+
+    async def delete_fn(namespace: str, names: List[str]) -> None:
+        reaped.append((namespace, names))
+
+    reaper = ConfigMapReaper(
+        "job", lambda name, namespace: True, delete_fn, grace_s=3600, interval_s=60
+    )
+
+    async def run() -> None:
+        async with server as api_client:
+            await reaper.start(api_client)
+            assert await reaper.reap() == 1
+            await reaper.stop()
+
+    asyncio.run(run())
+
+    assert reaped == [("ns", ["orphan"])]
+    pods: Request = server.sent("GET", "/api/v1/pods")[0]
+    assert pods.query["labelSelector"] == "job"
+    # Only the objects' metadata is listed
+    assert pods.headers["Accept"].startswith(
+        "application/json;as=PartialObjectMetadataList"
+    )
+
+
+def test_failed_reaps_are_survived():
+    """A reap whose list fails (the API server responds with a Status)
+    does not stop the reaper - the next reap lists (every page) again.
+    """
+
+    def list_configmaps(request: Request) -> Tuple[int, Any]:
+        if len(server.sent("GET", "/api/v1/configmaps")) == 1:
+            return 500, status(500, "InternalError")
+        if request.query.get("continue") != "next":
+            page: Dict[str, Any] = object_list([_configmap("first", 7200)])
+            page["metadata"]["continue"] = "next"
+            return 200, page
+        return 200, object_list([_configmap("second", 7200)])
+
+    server = ApiServer()
+    server.route("GET", "/api/v1/configmaps", list_configmaps)
+    server.route("GET", "/api/v1/pods", lambda request: (200, object_list([])))
+    reaped: List[Tuple[str, List[str]]] = []
+
+    async def delete_fn(namespace: str, names: List[str]) -> None:
+        reaped.append((namespace, names))
+
+    reaper = ConfigMapReaper(
+        "job", lambda name, namespace: True, delete_fn, grace_s=3600, interval_s=0.05
+    )
+
+    async def run() -> None:
+        async with server as api_client:
+            await reaper.start(api_client)
+            for _ in range(40):
+                if reaped:
+                    break
+                await asyncio.sleep(0.05)
+            await reaper.stop()
+
+    asyncio.run(run())
+
+    assert reaped[0] == ("ns", ["first", "second"])
+
+
+def test_namespaces_are_listed_separately():
+    """Given namespaces, the ConfigMaps and Pods in each are listed
+    (the API server selects the namespace).
+    """
+    server = ApiServer()
+    for namespace in ["a", "b"]:
+        server.route(
+            "GET",
+            f"/api/v1/namespaces/{namespace}/configmaps",
+            lambda request, namespace=namespace: (
+                200,
+                object_list([_configmap(f"orphan-{namespace}", 7200)]),
+            ),
+        )
+        server.route(
+            "GET",
+            f"/api/v1/namespaces/{namespace}/pods",
+            lambda _: (200, object_list([])),
+        )
+    reaper = ConfigMapReaper(
+        "job",
+        lambda name, namespace: True,
+        lambda namespace, names: asyncio.sleep(0),
+        grace_s=3600,
+        interval_s=60,
+        namespaces=["a", "b"],
+    )
+
+    async def run() -> Dict[str, List[str]]:
+        async with server as api_client:
+            await reaper.start(api_client)
+            orphans = await reaper.orphans()
+            await reaper.stop()
+            return orphans
+
+    assert asyncio.run(run()) == {"ns": ["orphan-a", "orphan-b"]}
+    assert not server.sent("GET", "/api/v1/configmaps")
+    assert len(server.sent("GET", "/api/v1/namespaces/b/pods")) == 1
@@ -0,0 +1,55 @@
+"""Tests of the sharing of DataManagerJobs between replicas (sharding.py)."""
+import asyncio
+import datetime
+from typing import Any, Dict
+
+from api_server import ApiServer, object_list
+from sharding import Shards
+
+_LEASES_PATH: str = "/apis/coordination.k8s.io/v1/namespaces/operator/leases"
+
+
+def _lease(identity: str, renewed_s_ago: float) -> Dict[str, Any]:
+    """A shard Lease, last renewed the given time ago."""
+    renew_time: datetime.datetime = datetime.datetime.now(
+        datetime.timezone.utc
+    ) - datetime.timedelta(seconds=renewed_s_ago)
+    return {
+        "metadata": {"name": f"job-operator-shard-{identity}"},
+        "spec": {
+            "holderIdentity": identity,
+            "leaseDurationSeconds": 15,
+            "renewTime": renew_time.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        },
+    }
+
+
+def test_stale_leases_are_not_members():
+    """Leases that have not been renewed for their duration (i.e. those
+    of replicas that have gone) are not members, and are deleted.
+    """
+    server = ApiServer()
+    server.route("PATCH", f"{_LEASES_PATH}/job-operator-shard-a", lambda r: (200, {}))
+    server.route(
+        "GET",
+        _LEASES_PATH,
+        lambda request: (
+            200,
+            object_list([_lease("a", 0), _lease("b", 5), _lease("c", 3600)]),
+        ),
+    )
+    server.route("DELETE", f"{_LEASES_PATH}/([^/]+)", lambda r, name: (200, {}))
+    shards = Shards("a", "name", "operator", 15)
+
+    async def run() -> None:
+        async with server as api_client:
+            await shards.start(api_client)
+            await shards.stop()
+
+    asyncio.run(run())
+
+    assert shards.members == ["a", "b"]
+    assert [request.path for request in server.sent("DELETE", ".*")] == [
+        f"{_LEASES_PATH}/job-operator-shard-c",
+        f"{_LEASES_PATH}/job-operator-shard-a",
+    ]
@@ -0,0 +1,69 @@
+"""Tests of the sweep for missed (finished) Job Pods (sweeper.py)."""
+import asyncio
+import datetime
+from typing import Any, Dict, List
+
+from api_server import ApiServer, Request, object_list, status
+import cache
+from sweeper import Sweeper
+
+
+def _pod(name: str, finished_s: float) -> Dict[str, Any]:
+    """A Job Pod that finished the given time (seconds) ago."""
+    finished: datetime.datetime = datetime.datetime.now(
+        datetime.timezone.utc
+    ) - datetime.timedelta(seconds=finished_s)
+    timestamp: str = finished.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return {
+        "metadata": {"name": name, "namespace": "ns", "creationTimestamp": timestamp},
+        "status": {
+            "phase": "Succeeded",
+            "containerStatuses": [
+                {"state": {"terminated": {"finishedAt": timestamp, "exitCode": 0}}}
+            ],
+        },
+    }
+
+
+def test_failed_sweeps_are_survived():
+    """A sweep whose list fails (the API server responds with a Status)
+    does not stop the sweeper - the next sweep deletes the missed Pods.
+    """
+
+    def list_pods(request: Request) -> Any:
+        assert request.query["fieldSelector"] == cache.FINISHED_FIELD_SELECTOR
+        assert request.query["labelSelector"] == "job,!debug"
+        if len(server.sent("GET", "/api/v1/pods")) == 1:
+            return 500, status(500, "InternalError")
+        return 200, object_list(
+            [_pod("missed", 600), _pod("recent", 1), _pod("not-ours", 600)]
+        )
+
+    server = ApiServer()
+    server.route("GET", "/api/v1/pods", list_pods)
+    deleted: List[str] = []
+
+    async def delete_fn(pod: Dict[str, Any]) -> None:
+        deleted.append(pod["metadata"]["name"])
+
+    sweeper = Sweeper(
+        "job",
+        lambda name, namespace: name != "not-ours",
+        delete_fn,
+        min_age_s=60,
+        interval_s=0.05,
+    )
+
+    async def run() -> None:
+        async with server as api_client:
+            await sweeper.start(api_client)
+            for _ in range(40):
+                if deleted:
+                    break
+                await asyncio.sleep(0.05)
+            await sweeper.stop()
+
+    asyncio.run(run())
+
+    assert deleted[0] == "missed"
+    assert set(deleted) == {"missed"}
@@ -0,0 +1,304 @@
+"""Tests of the Kubernetes objects built for a Job (templates.py)."""
+import copy
+from typing import Any, Dict, List
+
+import kopf
+
+from templates import JobTemplates, file_objects, nextflow_config
+
+_TEMPLATES: JobTemplates = JobTemplates(
+    service_account="sa",
+    node_selector_key="worker",
+    node_selector_value="yes",
+    nf_executor_queue_size=100,
+    default_cpu="1",
+    default_memory="1Gi",
+    default_user_id=1001,
+    default_group_id=1001,
+    default_project_mount="/project",
+    default_project_claim_name="project",
+)
+# A Job's material, using (and overriding) every field
+_MATERIAL: Dict[str, Any] = {
+    "image": "informaticsmatters/job:stable",
+    "imageType": "nextflow",
+    "command": "nextflow run main.nf --title 'My Job' --in data/in.sdf",
+    "project": {"id": "project-1", "claimName": "claim-1"},
+    "projectMount": "/data",
+    "workingDirectory": "/project",
+    "workingSubPath": "job-1",
+    "labels": ["a=1", "b=2"],
+    "environment": ["X=1"],
+    "resources": {"requests": {"cpu": 2}, "limits": {"memory": "4Gi"}},
+    "securityContext": {"runAsUser": 2000},
+    "pullSecret": "secret",
+    "debug": True,
+}
+# ...and one that only has the fields that must be provided
+_MINIMAL_MATERIAL: Dict[str, Any] = {
+    "image": "informaticsmatters/job:1.0.0",
+    "command": "run.sh",
+    "project": {"id": "project-1"},
+    "workingDirectory": "/project",
+}
+
+# The files injected into a Job (two with the same basename)
+_IMAGE_FILES: List[Dict[str, str]] = [
+    {
+        "name": f"/data/{directory}/file-{number}.txt",
+        "content": f"content {number}\n",
+        "origin": f"origin-{number}",
+    }
+    for number, directory in enumerate(["a", "b", "a", "b", "c", "c"], 1)
+] + [{"name": "/data/c/file-1.txt", "content": "same basename\n", "origin": "o"}]
+
+
+def _mounted_files(
+    configmaps: List[Dict[str, Any]],
+    volumes: List[Dict[str, Any]],
+    mounts: List[Dict[str, Any]],
+) -> Dict[str, str]:
+    """The content of the files the container sees (keyed by mount path),
+    following each mount to its volume's ConfigMap(s).
+    """
+    data: Dict[str, Dict[str, str]] = {
+        configmap["metadata"]["name"]: configmap["data"] for configmap in configmaps
+    }
+    volume_configmaps: Dict[str, List[str]] = {
+        volume["name"]: (
+            [volume["configMap"]["name"]]
+            if "configMap" in volume
+            else [
+                source["configMap"]["name"] for source in volume["projected"]["sources"]
+            ]
+        )
+        for volume in volumes
+    }
+    files: Dict[str, str] = {}
+    for mount in mounts:
+        (content,) = [
+            data[cm_name][mount["subPath"]]
+            for cm_name in volume_configmaps[mount["name"]]
+            if mount["subPath"] in data[cm_name]
+        ]
+        files[mount["mountPath"]] = content
+    return files
+
+
+def test_packed_files_are_mounted_like_one_configmap_per_file():
+    """Files packed into one ConfigMap (and projected volume) are mounted
+    where, and with the content, they are when each has its own ConfigMap.
+    """
+    baseline = file_objects("job", _IMAGE_FILES, pack=False, max_bytes=0)
+    configmaps, volumes, mounts = file_objects(
+        "job", _IMAGE_FILES, pack=True, max_bytes=1024
+    )
+
+    assert len(baseline[0]) == len(_IMAGE_FILES)
+    assert [configmap["metadata"] for configmap in configmaps] == [
+        {
+            "name": "job-files-1",
+            "labels": {"app": "job"},
+            "annotations": {
+                f"origin-file-{number}": image_file["origin"]
+                for number, image_file in enumerate(_IMAGE_FILES, 1)
+            },
+        }
+    ]
+    assert list(configmaps[0]["data"]) == [
+        f"file-{number}" for number in range(1, len(_IMAGE_FILES) + 1)
+    ]
+    assert volumes == [
+        {
+            "name": "files",
+            "projected": {"sources": [{"configMap": {"name": "job-files-1"}}]},
+        }
+    ]
+    assert [mount["mountPath"] for mount in mounts] == [
+        mount["mountPath"] for mount in baseline[2]
+    ]
+    assert _mounted_files(configmaps, volumes, mounts) == _mounted_files(*baseline)
+
+
+def test_packed_configmaps_are_size_bounded():
+    """A new ConfigMap is started when a file would overflow the current one,
+    all of them projected into the one volume.
+    """
+    configmaps, volumes, mounts = file_objects(
+        "job", _IMAGE_FILES, pack=True, max_bytes=30
+    )
+
+    assert [list(configmap["data"]) for configmap in configmaps] == [
+        ["file-1", "file-2", "file-3"],
+        ["file-4", "file-5", "file-6"],
+        ["file-7"],
+    ]
+    assert volumes[0]["projected"]["sources"] == [
+        {"configMap": {"name": f"job-files-{number}"}} for number in [1, 2, 3]
+    ]
+    assert _mounted_files(configmaps, volumes, mounts) == _mounted_files(
+        *file_objects("job", _IMAGE_FILES, pack=False, max_bytes=0)
+    )
+
+
+def test_pods_match_the_golden_manifests():
+    """The Pods built from the templates are those the operator built
+    (field by field, for every Job) before there were templates.
+    """
+    file_volume: Dict[str, Any] = {"name": "file-1", "configMap": {"name": "f"}}
+    file_mount: Dict[str, Any] = {"name": "file-1", "mountPath": "/f", "subPath": "f"}
+    pod: Dict[str, Any] = _TEMPLATES.pod(
+        "job-1",
+        _MATERIAL,
+        nf_config_name="job-1-nf-config",
+        volumes=[file_volume],
+        volume_mounts=[file_mount],
+    )
+
+    assert pod == {
+        "kind": "Pod",
+        "apiVersion": "v1",
+        "metadata": {"name": "job-1", "labels": {"a": "1", "b": "2", "debug": "yes"}},
+        "spec": {
+            "serviceAccountName": "sa",
+            "nodeSelector": {"worker": "yes"},
+            "restartPolicy": "Never",
+            "containers": [
+                {
+                    "name": "job-1",
+                    "image": "informaticsmatters/job:stable",
+                    "command": [
+                        "nextflow",
+                        "run",
+                        "main.nf",
+                        "--title",
+                        "My Job",
+                        "--in",
+                        "data/in.sdf",
+                    ],
+                    "workingDir": "/project/job-1",
+                    "imagePullPolicy": "Always",
+                    "terminationMessagePolicy": "FallbackToLogsOnError",
+                    "env": [
+                        {"name": "NXF_WORK", "value": "/data/.job-1/work"},
+                        {"name": "X", "value": "1"},
+                    ],
+                    "resources": {
+                        "requests": {"cpu": "2", "memory": "1Gi"},
+                        "limits": {"cpu": "1", "memory": "4Gi"},
+                    },
+                    "volumeMounts": [
+                        {
+                            "name": "project",
+                            "mountPath": "/data",
+                            "subPath": "project-1",
+                        },
+                        {
+                            "name": "nf-config",
+                            "mountPath": "/project/job-1/nextflow.config",
+                            "subPath": "nextflow.config",
+                        },
+                        file_mount,
+                    ],
+                }
+            ],
+            "securityContext": {"runAsUser": 2000, "runAsGroup": 1001, "fsGroup": 0},
+            "volumes": [
+                {"name": "project", "persistentVolumeClaim": {"claimName": "claim-1"}},
+                {"name": "nf-config", "configMap": {"name": "job-1-nf-config"}},
+                file_volume,
+            ],
+            "imagePullSecrets": [{"name": "secret"}],
+        },
+    }
+    assert _TEMPLATES.pod("job-2", _MINIMAL_MATERIAL) == {
+        "kind": "Pod",
+        "apiVersion": "v1",
+        "metadata": {"name": "job-2", "labels": {}},
+        "spec": {
+            "serviceAccountName": "sa",
+            "nodeSelector": {"worker": "yes"},
+            "restartPolicy": "Never",
+            "containers": [
+                {
+                    "name": "job-2",
+                    "image": "informaticsmatters/job:1.0.0",
+                    "command": ["run.sh"],
+                    "workingDir": "/project",
+                    "imagePullPolicy": "IfNotPresent",
+                    "terminationMessagePolicy": "FallbackToLogsOnError",
+                    "env": [{"name": "NXF_WORK", "value": "/project/.job-2/work"}],
+                    "resources": {
+                        "requests": {"cpu": "1", "memory": "1Gi"},
+                        "limits": {"cpu": "1", "memory": "1Gi"},
+                    },
+                    "volumeMounts": [
+                        {
+                            "name": "project",
+                            "mountPath": "/project",
+                            "subPath": "project-1",
+                        }
+                    ],
+                }
+            ],
+            "securityContext": {"runAsUser": 1001, "runAsGroup": 1001, "fsGroup": 0},
+            "volumes": [
+                {"name": "project", "persistentVolumeClaim": {"claimName": "project"}}
+            ],
+        },
+    }
+
+
+def test_nextflow_configs_match_the_golden_config():
+    """The Nextflow config built from the templates is the one the operator
+    built (formatting every variable, for every Job) before there were templates.
+    """
+    assert _TEMPLATES.nextflow_config("job-1", _MATERIAL) == nextflow_config % {
+        "executor_queue_size": 100,
+        "extra_pod_settings": "[imagePullSecret: 'secret'],\n",
+        "claim_name": "claim-1",
+        "name": "job-1",
+        "project_id": "project-1",
+        "project_mount": "/data",
+        "sa": "sa",
+        "user": 2000,
+        "group": 1001,
+        "selector_key": "worker",
+        "selector_value": "yes",
+    }
+
+
+def test_pods_do_not_share_their_job_fields():
+    """Changing one Job's Pod (as adopting it does) changes neither the
+    Pods of other Jobs nor the templates. Only the frozen (operator-wide)
+    parts are shared.
+    """
+    first: Dict[str, Any] = _TEMPLATES.pod("job-1", _MINIMAL_MATERIAL)
+    second: Dict[str, Any] = _TEMPLATES.pod("job-1", _MINIMAL_MATERIAL)
+    expected: Dict[str, Any] = copy.deepcopy(second)
+
+    kopf.adopt(
+        first,
+        owner={
+            "apiVersion": "squonk.it/v3",
+            "kind": "DataManagerJob",
+            "metadata": {
+                "name": "job-1",
+                "namespace": "ns",
+                "uid": "job-uid",
+                "labels": {"owner": "yes"},
+            },
+        },
+    )
+    first["metadata"]["labels"]["debug"] = "yes"
+    first["spec"]["imagePullSecrets"] = [{"name": "secret"}]
+    container: Dict[str, Any] = first["spec"]["containers"][0]
+    container["command"].append("--debug")
+    container["env"].append({"name": "X", "value": "1"})
+    container["volumeMounts"].append({"name": "f", "mountPath": "/f"})
+    first["spec"]["volumes"].append({"name": "f", "configMap": {"name": "f"}})
+
+    assert second == expected
+    assert _TEMPLATES.pod("job-1", _MINIMAL_MATERIAL) == expected
+    assert first["spec"]["securityContext"] is second["spec"]["securityContext"]
+    assert first["spec"]["nodeSelector"] is second["spec"]["nodeSelector"]